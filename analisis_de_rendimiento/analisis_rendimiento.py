@@ -54,8 +54,8 @@ def ejecutar_prueba(config, comunidad):
         print(f"Ejecutando prueba: {config['nombre']} - Comunidad: {comunidad}")
         print(f"{'='*80}")
         
-        # Construir el comando
-        comando = ["python", "main.py"] + config["params"] + [comunidad]
+        # Construir el comando (sin caché de particiones, para medir el cálculo completo)
+        comando = ["python", "main.py"] + config["params"] + ["sin_cache", comunidad]
         print(f"Comando: {' '.join(comando)}")
         
         # Iniciar temporizador
@@ -1,4 +1,6 @@
 import os
+import sys
+import json
 import subprocess
 import shutil
 import time
@@ -18,6 +20,12 @@ CONFIGS = [
     {"nombre": "GPU-Rapido-Grid", "params": ["gpu", "rapido", "grid"]},
 ]
 
+# Configuraciones para comparar los motores de Voronoi (scipy frente a GEOS)
+CONFIGS_MOTOR_VORONOI = [
+    {"nombre": "CPU-Voronoi-Scipy", "params": ["cpu", "voronoi", "scipy"]},
+    {"nombre": "CPU-Voronoi-GEOS", "params": ["cpu", "voronoi", "geos"]},
+]
+
 # Comunidades autónomas pequeñas para pruebas rápidas
 COMUNIDADES_PRUEBA = [
     "34170000000",  # La Rioja
@@ -75,10 +83,13 @@ def guardar_archivos_geojson(config_nombre, comunidad):
     
     return archivos_copiados
 
-def ejecutar_prueba(config, comunidad):
+def ejecutar_prueba(config, comunidad, guardar_geojson=True):
     """
     Ejecuta main.py con los parámetros especificados,
     espera a que termine y guarda los resultados.
+    
+    Si guardar_geojson es False no se copian los GeoJSON generados a la
+    carpeta de resultados (evita mezclarlos con los de comparar_resultados.py).
     """
     limpiar_directorio_geojson()
     
@@ -86,8 +97,8 @@ def ejecutar_prueba(config, comunidad):
     print(f"Ejecutando prueba: {config['nombre']} - Comunidad: {comunidad}")
     print(f"{'='*80}")
     
-    # Construir el comando
-    comando = ["python", "main.py"] + config["params"] + [comunidad]
+    # Construir el comando (sin caché de particiones, para medir el cálculo completo)
+    comando = ["python", "main.py"] + config["params"] + ["sin_cache", comunidad]
     print(f"Comando: {' '.join(comando)}")
     
     # Iniciar temporizador
@@ -134,7 +145,7 @@ def ejecutar_prueba(config, comunidad):
         print(f"Tiempo total: {tiempo_total:.2f} segundos")
         
         # Guardar archivos GeoJSON generados
-        archivos_guardados = guardar_archivos_geojson(config['nombre'], comunidad)
+        archivos_guardados = guardar_archivos_geojson(config['nombre'], comunidad) if guardar_geojson else []
         
         return {
             "config": config['nombre'],
@@ -156,8 +167,57 @@ def ejecutar_prueba(config, comunidad):
             "archivos_guardados": []
         }
 
+def contar_zonas_generadas(comunidad):
+    """Cuenta las zonas de los GeoJSON generados para una comunidad."""
+    total = 0
+    for geojson_file in glob.glob(os.path.join("geojson_comunidades_zonas", f"{comunidad}_*.geojson")):
+        try:
+            with open(geojson_file, 'r', encoding='utf-8') as f:
+                total += len(json.load(f).get("features", []))
+        except Exception as e:
+            print(f"Error al leer {geojson_file}: {e}")
+    return total
+
+def comparar_motores_voronoi():
+    """
+    Compara el motor de Voronoi de scipy con el de GEOS (shapely.voronoi_polygons)
+    en las comunidades de prueba y guarda un resumen con tiempos y zonas.
+    """
+    print("Comparando motores de Voronoi (scipy vs GEOS)...")
+    setup_directorios()
+    
+    resultados = []
+    for comunidad in COMUNIDADES_PRUEBA:
+        for config in CONFIGS_MOTOR_VORONOI:
+            resultado = ejecutar_prueba(config, comunidad, guardar_geojson=False)
+            resultado["zonas"] = contar_zonas_generadas(comunidad)
+            resultados.append(resultado)
+    
+    resumen_file = os.path.join(LOGS_DIR, f"resumen_motores_voronoi_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+    with open(resumen_file, 'w', encoding='utf-8') as f:
+        f.write("COMPARATIVA DE MOTORES DE VORONOI\n")
+        f.write("=================================\n\n")
+        f.write(f"{'Comunidad':<14}{'Config':<22}{'Tiempo (s)':>12}{'Zonas':>10}\n")
+        
+        for res in resultados:
+            f.write(f"{res['comunidad']:<14}{res['config']:<22}{res['tiempo_total']:>12.2f}{res['zonas']:>10}\n")
+        
+        f.write("\n")
+        for comunidad in COMUNIDADES_PRUEBA:
+            tiempos = {res['config']: res['tiempo_total'] for res in resultados if res['comunidad'] == comunidad}
+            tiempo_scipy = tiempos.get("CPU-Voronoi-Scipy")
+            tiempo_geos = tiempos.get("CPU-Voronoi-GEOS")
+            if tiempo_scipy and tiempo_geos:
+                f.write(f"{comunidad}: GEOS es {tiempo_scipy / tiempo_geos:.2f}x respecto a scipy\n")
+    
+    print(f"\nComparativa completa. Resumen guardado en: {resumen_file}")
+
 def main():
     """Función principal que ejecuta todas las pruebas secuencialmente."""
+    if "motores" in sys.argv[1:]:
+        comparar_motores_voronoi()
+        return
+    
     print("Iniciando ejecución de pruebas...")
     
     # Crear directorios para resultados
@@ -98,9 +98,9 @@ def ejecutar_prueba(config, comunidad):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = os.path.join(LOGS_DIR, f"log_{config['nombre']}_{comunidad}_{timestamp}.txt")
     
-    # Construir comando - ir a la carpeta raíz para ejecutar
+    # Construir comando - ir a la carpeta raíz para ejecutar (sin caché de particiones, para medir el cálculo completo)
     parametros = " ".join(config["params"])
-    comando = f'cd .. && py main.py {parametros} {comunidad}'
+    comando = f'cd .. && py main.py {parametros} sin_cache {comunidad}'
     
     # Ejecutar comando y guardar salida
     print(f"\n{'='*80}")
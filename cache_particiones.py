@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import shapely
+
+# Versión del código de división: incrementarla cuando cambie el resultado de algún
+# método de división para que no se reutilicen particiones calculadas con el anterior
+VERSION_PARTICIONES = 3
+
+# Directorio y tamaño máximo por defecto de la caché de particiones
+DIRECTORIO_CACHE = "cache_particiones"
+TAMANO_MAXIMO_CACHE_MB = 2048
+
+# Tras superar el tamaño máximo se eliminan entradas hasta bajar a esta fracción
+FRACCION_TRAS_EVICCION = 0.9
+
+# Escrituras acumuladas antes de confirmar la transacción
+ESCRITURAS_POR_COMMIT = 200
+
+def abrir_cache(directorio=DIRECTORIO_CACHE, tamano_maximo_mb=TAMANO_MAXIMO_CACHE_MB):
+    """
+    Abre (o crea) la caché persistente de particiones de municipios
+
+    Las particiones se guardan en una base SQLite como una fila por zona con su
+    geometría en WKB, indexadas por una clave que identifica el contenido (ver
+    clave_particion). Cuando se supera el tamaño máximo se eliminan las
+    particiones usadas hace más tiempo (LRU).
+
+    Args:
+        directorio: Directorio de la caché
+        tamano_maximo_mb: Tamaño máximo de las geometrías almacenadas, en MB
+
+    Returns:
+        dict con la conexión y los contadores de la caché
+    """
+    os.makedirs(directorio, exist_ok=True)
+    conexion = sqlite3.connect(os.path.join(directorio, "particiones.sqlite"), timeout=60)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.execute("CREATE TABLE IF NOT EXISTS particiones (clave TEXT PRIMARY KEY, tamano INTEGER, ultimo_uso REAL)")
+    conexion.execute("CREATE TABLE IF NOT EXISTS zonas (clave TEXT, orden INTEGER, sufijo TEXT, wkb BLOB, "
+                     "PRIMARY KEY (clave, orden))")
+    conexion.execute("CREATE INDEX IF NOT EXISTS particiones_uso ON particiones (ultimo_uso)")
+    tamano_actual = conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM particiones").fetchone()[0]
+    return {
+        "conexion": conexion,
+        "tamano_maximo": int(tamano_maximo_mb * 1024 * 1024),
+        "tamano_actual": tamano_actual,
+        "escrituras_pendientes": 0,
+        "aciertos": 0,
+        "fallos": 0,
+        "eliminadas": 0
+    }
+
+def clave_particion(geometria, parametros):
+    """
+    Calcula la clave de contenido de la partición de un municipio
+
+    Args:
+        geometria: Geometría del municipio
+        parametros: dict con todo lo que influye en el resultado (método, número
+            de zonas, semilla...); VERSION_PARTICIONES se añade automáticamente
+
+    Returns:
+        Hash SHA-256 en hexadecimal
+    """
+    resumen = hashlib.sha256(shapely.to_wkb(geometria))
+    resumen.update(json.dumps(dict(parametros, version=VERSION_PARTICIONES), sort_keys=True).encode("utf-8"))
+    return resumen.hexdigest()
+
+def leer_particion(cache, clave):
+    """
+    Busca una partición en la caché
+
+    Args:
+        cache: dict devuelto por abrir_cache
+        clave: Clave devuelta por clave_particion
+
+    Returns:
+        Lista de tuplas (sufijo, geometria) en el orden original, o None si no está
+    """
+    filas = cache["conexion"].execute("SELECT sufijo, wkb FROM zonas WHERE clave = ? ORDER BY orden", (clave,)).fetchall()
+    if not filas:
+        cache["fallos"] += 1
+        return None
+
+    cache["aciertos"] += 1
+    cache["conexion"].execute("UPDATE particiones SET ultimo_uso = ? WHERE clave = ?", (time.time(), clave))
+    _confirmar_si_procede(cache)
+    geometrias = shapely.from_wkb([wkb for _, wkb in filas])
+    return [(sufijo, geometria) for (sufijo, _), geometria in zip(filas, geometrias)]
+
+def guardar_particion(cache, clave, zonas):
+    """
+    Guarda una partición en la caché, eliminando las menos usadas si se supera el tamaño máximo
+
+    Args:
+        cache: dict devuelto por abrir_cache
+        clave: Clave devuelta por clave_particion
+        zonas: Lista de tuplas (sufijo, geometria)
+    """
+    if not zonas:
+        return
+    wkbs = shapely.to_wkb([geometria for _, geometria in zonas])
+    tamano = sum(len(wkb) for wkb in wkbs)
+
+    conexion = cache["conexion"]
+    anterior = conexion.execute("SELECT tamano FROM particiones WHERE clave = ?", (clave,)).fetchone()
+    if anterior is not None:
+        cache["tamano_actual"] -= anterior[0]
+        conexion.execute("DELETE FROM zonas WHERE clave = ?", (clave,))
+    conexion.execute("INSERT OR REPLACE INTO particiones (clave, tamano, ultimo_uso) VALUES (?, ?, ?)",
+                     (clave, tamano, time.time()))
+    conexion.executemany("INSERT INTO zonas (clave, orden, sufijo, wkb) VALUES (?, ?, ?, ?)",
+                         [(clave, orden, sufijo, wkb) for orden, ((sufijo, _), wkb) in enumerate(zip(zonas, wkbs))])
+    cache["tamano_actual"] += tamano
+
+    if cache["tamano_actual"] > cache["tamano_maximo"]:
+        _eliminar_menos_usadas(cache)
+    _confirmar_si_procede(cache)
+
+def _eliminar_menos_usadas(cache):
+    """
+    Elimina las particiones usadas hace más tiempo hasta bajar de FRACCION_TRAS_EVICCION del máximo
+    """
+    conexion = cache["conexion"]
+    limite = cache["tamano_maximo"] * FRACCION_TRAS_EVICCION
+    eliminar = []
+    for clave, tamano in conexion.execute("SELECT clave, tamano FROM particiones ORDER BY ultimo_uso"):
+        if cache["tamano_actual"] <= limite:
+            break
+        eliminar.append((clave,))
+        cache["tamano_actual"] -= tamano
+    conexion.executemany("DELETE FROM zonas WHERE clave = ?", eliminar)
+    conexion.executemany("DELETE FROM particiones WHERE clave = ?", eliminar)
+    cache["eliminadas"] += len(eliminar)
+
+def _confirmar_si_procede(cache):
+    """
+    Confirma la transacción cada ESCRITURAS_POR_COMMIT escrituras
+    """
+    cache["escrituras_pendientes"] += 1
+    if cache["escrituras_pendientes"] >= ESCRITURAS_POR_COMMIT:
+        cache["conexion"].commit()
+        cache["escrituras_pendientes"] = 0
+
+def cerrar_cache(cache):
+    """
+    Confirma las escrituras pendientes, cierra la caché y muestra sus contadores
+
+    Args:
+        cache: dict devuelto por abrir_cache
+    """
+    cache["conexion"].commit()
+    cache["conexion"].close()
+    consultas = cache["aciertos"] + cache["fallos"]
+    if consultas > 0:
+        print(f"Caché de particiones: {cache['aciertos']} de {consultas} municipios reutilizados "
+              f"({100 * cache['aciertos'] / consultas:.1f}%), {cache['tamano_actual'] / (1024 * 1024):.1f} MB en disco"
+              + (f", {cache['eliminadas']} particiones eliminadas por tamaño" if cache["eliminadas"] else "") + ".")
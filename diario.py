@@ -0,0 +1,138 @@
+import json
+import os
+
+# Diario de municipios terminados, junto a los GeoJSON, para reanudar una ejecución interrumpida
+ARCHIVO_DIARIO = "diario_municipios.jsonl"
+
+def abrir_diario(ruta, parametros, reanudar=False):
+    """
+    Abre el diario de municipios terminados de una ejecución
+
+    El diario es un archivo JSON Lines al que solo se añaden líneas: la primera con los
+    parámetros de división y después una por municipio terminado, con sus features.
+    Cada línea se vuelca al disco en cuanto se escribe, así que si la ejecución muere
+    solo se pierden los municipios que estaban en curso.
+
+    Al reanudar con los mismos parámetros se conservan las entradas existentes, indexadas
+    por su posición en el archivo (sin cargar sus features en memoria). En otro caso el
+    diario se vacía y se empieza de nuevo.
+
+    Args:
+        ruta: Archivo del diario
+        parametros: Parámetros de división de esta ejecución
+        reanudar: Conservar las entradas de una ejecución anterior interrumpida
+
+    Returns:
+        dict con el archivo abierto y el índice (codigo_ccaa, natcode) -> (huella, desplazamiento)
+    """
+    indice = {}
+    if reanudar and os.path.exists(ruta):
+        resultado = _indexar_diario(ruta, parametros)
+        if resultado is None:
+            print(f"El diario {ruta} es de otra configuración de división. Se empieza de nuevo.")
+        else:
+            indice, fin = resultado
+            # Descartar la última línea si quedó a medias al interrumpirse la ejecución
+            os.truncate(ruta, fin)
+            print(f"Reanudando: {len(indice)} municipios terminados en el diario {ruta}")
+    elif reanudar:
+        print(f"No existe el diario {ruta}. Se procesará todo.")
+
+    if indice:
+        archivo = open(ruta, 'ab')
+    else:
+        archivo = open(ruta, 'wb')
+        _escribir_linea(archivo, {"parametros": parametros})
+
+    return {"ruta": ruta, "archivo": archivo, "lectura": None, "indice": indice, "anotados": 0}
+
+def _indexar_diario(ruta, parametros):
+    """
+    Indexa las entradas válidas de un diario existente
+
+    Returns:
+        Tupla (indice, fin): índice (codigo_ccaa, natcode) -> (huella, desplazamiento) y
+        posición del final de la última línea completa; None si los parámetros no coinciden
+    """
+    indice = {}
+    fin = 0
+    with open(ruta, 'rb') as f:
+        try:
+            cabecera = json.loads(f.readline())
+        except ValueError:
+            return None
+        if cabecera.get("parametros") != parametros:
+            return None
+        fin = f.tell()
+
+        while True:
+            desplazamiento = f.tell()
+            linea = f.readline()
+            if not linea.endswith(b"\n"):
+                break
+            try:
+                entrada = json.loads(linea)
+            except ValueError:
+                break
+            # Si un municipio aparece varias veces, vale la última entrada
+            indice[(entrada["ccaa"], entrada["natcode"])] = (entrada["huella"], desplazamiento)
+            fin = f.tell()
+    return indice, fin
+
+def _escribir_linea(archivo, datos):
+    """
+    Añade una línea JSON al diario y la vuelca al sistema operativo
+    """
+    archivo.write(json.dumps(datos, ensure_ascii=False).encode("utf-8") + b"\n")
+    archivo.flush()
+
+def recuperar_municipio(diario, codigo_ccaa, natcode, huella):
+    """
+    Busca en el diario las features de un municipio ya terminado
+
+    Args:
+        diario: dict devuelto por abrir_diario
+        codigo_ccaa: Código de la comunidad autónoma
+        natcode: NATCODE del municipio
+        huella: Huella de la geometría actual del municipio
+
+    Returns:
+        Lista de features, o None si el municipio no está en el diario, su geometría ha
+        cambiado o no tiene zonas (un municipio fallido se vuelve a calcular)
+    """
+    entrada = diario["indice"].get((codigo_ccaa, natcode))
+    if entrada is None or entrada[0] != huella:
+        return None
+
+    if diario["lectura"] is None:
+        diario["lectura"] = open(diario["ruta"], 'rb')
+    diario["lectura"].seek(entrada[1])
+    return json.loads(diario["lectura"].readline())["features"] or None
+
+def anotar_municipio(diario, codigo_ccaa, natcode, huella, features):
+    """
+    Añade al diario un municipio terminado
+
+    Args:
+        diario: dict devuelto por abrir_diario
+        codigo_ccaa: Código de la comunidad autónoma
+        natcode: NATCODE del municipio
+        huella: Huella de la geometría del municipio
+        features: Features GeoJSON de sus zonas
+    """
+    _escribir_linea(diario["archivo"], {"ccaa": codigo_ccaa, "natcode": natcode, "huella": huella, "features": features})
+    diario["anotados"] += 1
+
+def cerrar_diario(diario, eliminar=False):
+    """
+    Cierra el diario
+
+    Args:
+        diario: dict devuelto por abrir_diario
+        eliminar: Borrar el archivo (la ejecución terminó sin errores y ya no hace falta)
+    """
+    diario["archivo"].close()
+    if diario["lectura"] is not None:
+        diario["lectura"].close()
+    if eliminar:
+        os.remove(diario["ruta"])
@@ -1,5 +1,4 @@
 import os
-import geopandas as gpd
 import json
 import uuid
 from shapely.geometry import mapping, shape, Polygon, MultiPolygon
@@ -7,9 +6,15 @@ import numpy as np
 from tqdm import tqdm
 import math
 import voronoi_utils
+from ingesta import leer_capa
+from jerarquia import (prefijo_comunidad, asignacion_guardada, cargar_asignacion, calcular_asignacion,
+                       asignar_comunidades)
 import sys
 import matplotlib.pyplot as plt
 
+# Únicos atributos de los recintos que se usan (además de la geometría)
+COLUMNAS_RECINTOS = ["NATCODE", "NAMEUNIT"]
+
 def obtener_comunidades_autonomas(input_shapefile_recintos_autonomicos):
     """
     Obtiene la lista de comunidades autónomas del shapefile
@@ -21,34 +26,29 @@ def obtener_comunidades_autonomas(input_shapefile_recintos_autonomicos):
         GeoDataFrame con las comunidades autónomas
     """
     print(f"Leyendo comunidades autónomas de: {input_shapefile_recintos_autonomicos}")
-    gdf_ccaa = gpd.read_file(input_shapefile_recintos_autonomicos)
-    
-    # Asegurarse de que está en el sistema de coordenadas correcto (WGS84)
-    if gdf_ccaa.crs != "EPSG:4326":
-        print(f"Convirtiendo de {gdf_ccaa.crs} a EPSG:4326 (WGS84)")
-        gdf_ccaa = gdf_ccaa.to_crs("EPSG:4326")
-    
-    return gdf_ccaa
+    # La caché de ingesta ya guarda la capa en WGS84 (EPSG:4326)
+    return leer_capa(input_shapefile_recintos_autonomicos, COLUMNAS_RECINTOS)
 
-def obtener_municipios(input_shapefile_municipios):
+def obtener_municipios(input_shapefile_municipios, codigo_ccaa=None, natcodes_ccaa=None):
     """
-    Obtiene todos los municipios del shapefile
+    Obtiene los municipios del shapefile (todos, o solo los de una comunidad autónoma)
     
     Args:
         input_shapefile_municipios: Ruta al shapefile de municipios
+        codigo_ccaa: Leer solo los municipios de esta comunidad autónoma (opcional)
+        natcodes_ccaa: NATCODE de sus municipios según la tabla de asignación (opcional);
+            incluye los asignados por su ubicación, cuyo NATCODE tiene otro prefijo
     
     Returns:
-        GeoDataFrame con todos los municipios
+        GeoDataFrame con los municipios
     """
     print(f"Leyendo municipios de: {input_shapefile_municipios}")
-    gdf_municipios = gpd.read_file(input_shapefile_municipios)
-    
-    # Asegurarse de que está en el sistema de coordenadas correcto (WGS84)
-    if gdf_municipios.crs != "EPSG:4326":
-        print(f"Convirtiendo de {gdf_municipios.crs} a EPSG:4326 (WGS84)")
-        gdf_municipios = gdf_municipios.to_crs("EPSG:4326")
-    
-    return gdf_municipios
+    # La caché de ingesta ya guarda la capa en WGS84 (EPSG:4326). Con una comunidad, el filtro
+    # por NATCODE se aplica al leer, sin cargar los municipios del resto de España
+    prefijo_natcode = prefijo_comunidad(codigo_ccaa) if codigo_ccaa else None
+    otros_natcodes = [natcode for natcode in natcodes_ccaa or [] if not natcode.startswith(prefijo_natcode or "")]
+    return leer_capa(input_shapefile_municipios, COLUMNAS_RECINTOS, prefijo_natcode=prefijo_natcode,
+                     otros_natcodes=otros_natcodes)
 
 def determinar_numero_distritos(area_km2, poblacion=None):
     """
@@ -186,8 +186,10 @@ def procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, codigo_ccaa, output_di
     print(f"\nProcesando comunidad autónoma: {nombre_ccaa} (código {codigo_ccaa})")
     
     # Filtrar municipios de esta comunidad autónoma
-    # Los códigos NATCODE de municipios comienzan con el código de la comunidad autónoma
-    municipios_ccaa = gdf_municipios[gdf_municipios['NATCODE'].str.startswith(codigo_ccaa[:2])]
+    # Los municipios ya llevan su comunidad si se asignaron al cargarlos (ver main); si no, se asignan ahora
+    if 'CODIGO_CCAA' not in gdf_municipios.columns:
+        gdf_municipios = asignar_comunidades(gdf_municipios, calcular_asignacion(gdf_ccaa, gdf_municipios))
+    municipios_ccaa = gdf_municipios[gdf_municipios['CODIGO_CCAA'].to_numpy() == codigo_ccaa]
     
     if municipios_ccaa.empty:
         print(f"No se encontraron municipios para la comunidad autónoma {nombre_ccaa}")
@@ -321,7 +323,18 @@ def main():
     
     # Obtener comunidades autónomas
     gdf_ccaa = obtener_comunidades_autonomas(shapefile_ccaa)
-    gdf_municipios = obtener_municipios(shapefile_municipios)
+    # Con una sola comunidad, leer solo sus municipios según la tabla de asignación
+    # (junto a la caché de ingesta), incluidos los asignados por su ubicación
+    codigo_ccaa = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] not in ["voronoi", "grid"] else None
+    ccaa = gdf_ccaa[gdf_ccaa['NATCODE'] == codigo_ccaa] if codigo_ccaa else gdf_ccaa.iloc[:0]
+    asignacion = None if ccaa.empty else asignacion_guardada(shapefile_ccaa, shapefile_municipios)
+    if asignacion is not None:
+        gdf_municipios = obtener_municipios(shapefile_municipios, codigo_ccaa, asignacion.get(codigo_ccaa, []))
+    else:
+        # Sin tabla al día se lee la capa completa para calcularla una sola vez y guardarla
+        gdf_municipios = obtener_municipios(shapefile_municipios)
+        asignacion = cargar_asignacion(shapefile_ccaa, shapefile_municipios, gdf_ccaa, gdf_municipios)
+    gdf_municipios = asignar_comunidades(gdf_municipios, asignacion)
     
     # Lista de comunidades autónomas
     codigos_ccaa = gdf_ccaa['NATCODE'].unique()
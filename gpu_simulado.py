@@ -0,0 +1,42 @@
+import os
+from voronoi_utils import generar_semillas, crear_filtro_contiene, muestreo_en_gpu
+
+# Backend de GPU simulado: misma interfaz que gpu_voronoi_utils (verificar_gpu_disponible y
+# mejorar_puntos_aleatorios_gpu) pero calculado con NumPy en CPU. Reproduce el muestreo de la
+# GPU real (mismos candidatos y mismo filtro por aristas, con NumPy en lugar de CuPy) y permite
+# probar el reparto híbrido CPU+GPU en equipos sin GPU: python main.py gpu_simulada
+
+def verificar_gpu_disponible():
+    """
+    Simula la detección de una GPU
+
+    Returns:
+        bool: Siempre True
+        dict: Información de la GPU simulada (incluye el PID del proceso que la usa)
+    """
+    return True, {
+        "nombre": f"GPU simulada (proceso {os.getpid()})",
+        "memoria_total_gb": 0.0,
+        "compute_capability": "0.0"
+    }
+
+def mejorar_puntos_aleatorios_gpu(poligono, n_puntos, iteraciones=5, tolerancia=None, metodo_relajacion="lloyd",
+                                  rng=None):
+    """
+    Genera puntos aleatorios dentro del polígono y los relaja, como la versión de GPU
+    
+    Args:
+        poligono: Polígono (shapely.geometry.Polygon)
+        n_puntos: Número de puntos a generar
+        iteraciones: Número máximo de iteraciones de relajación
+        tolerancia: Desplazamiento máximo para detener antes las iteraciones (opcional)
+        metodo_relajacion: 'lloyd' (geométrico) o 'cvt' (k-means sobre muestras densas)
+        rng: Generador aleatorio (numpy.random.Generator); None usa el estado global de NumPy
+    
+    Returns:
+        Array de puntos (x, y) optimizados
+    """
+    filtro = None
+    if muestreo_en_gpu(len(poligono.exterior.coords), poligono.area, n_puntos):
+        filtro = crear_filtro_contiene(poligono)
+    return generar_semillas(poligono, n_puntos, iteraciones, tolerancia, metodo_relajacion, rng, filtro)
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import shapely
+
+# Tabla de huellas de la última ejecución, junto a los GeoJSON que describe
+ARCHIVO_HUELLAS = "huellas_municipios.json"
+
+def huella_geometria(geometria):
+    """
+    Calcula la huella de la geometría de un municipio
+
+    Args:
+        geometria: Geometría del municipio
+
+    Returns:
+        Hash SHA-256 en hexadecimal de su WKB
+    """
+    return hashlib.sha256(shapely.to_wkb(geometria)).hexdigest()
+
+def cargar_huellas(ruta):
+    """
+    Carga la tabla de huellas de la última ejecución
+
+    La tabla guarda, por comunidad autónoma, los parámetros de división usados y,
+    por NATCODE, la huella de la geometría del municipio y los ids de sus zonas
+    en el GeoJSON de la comunidad.
+
+    Args:
+        ruta: Archivo JSON de la tabla
+
+    Returns:
+        dict codigo_ccaa -> {"parametros": dict, "municipios": {natcode: {"huella": str, "ids": [str]}}}
+        (vacío si no existe o no se puede leer)
+    """
+    if not os.path.exists(ruta):
+        return {}
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"No se pudo leer la tabla de huellas {ruta}: {e}. Se procesará todo de nuevo.")
+        return {}
+
+def guardar_huellas(ruta, huellas):
+    """
+    Guarda la tabla de huellas de forma atómica (archivo temporal y reemplazo)
+
+    Args:
+        ruta: Archivo JSON de la tabla
+        huellas: dict con el formato de cargar_huellas
+    """
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(huellas, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+def zonas_reutilizables(huellas, codigo_ccaa, parametros, natcodes, huellas_actuales, ruta_geojson):
+    """
+    Determina qué municipios de una comunidad no han cambiado desde la última ejecución
+
+    Un municipio se reutiliza si su NATCODE estaba en la comunidad con la misma huella,
+    los parámetros de división son los mismos y sus zonas (al menos una) siguen en el
+    GeoJSON anterior.
+
+    Args:
+        huellas: Tabla devuelta por cargar_huellas
+        codigo_ccaa: Código de la comunidad autónoma
+        parametros: Parámetros de división de esta ejecución
+        natcodes: NATCODE de los municipios actuales de la comunidad, en orden
+        huellas_actuales: Huella de cada municipio actual, en el mismo orden
+        ruta_geojson: GeoJSON de la comunidad generado en la ejecución anterior
+
+    Returns:
+        Tupla (features, sin_cambios): features es un dict posición -> lista de features
+        del GeoJSON anterior, y sin_cambios indica que la comunidad tiene exactamente los
+        mismos municipios, todos reutilizables, por lo que no hace falta reescribirla
+    """
+    anterior = huellas.get(codigo_ccaa)
+    if not anterior or anterior.get("parametros") != parametros or not os.path.exists(ruta_geojson):
+        return {}, False
+
+    try:
+        with open(ruta_geojson, 'r', encoding='utf-8') as f:
+            features_previas = {feature["properties"]["id"]: feature for feature in json.load(f)["features"]}
+    except Exception as e:
+        print(f"No se pudo leer el GeoJSON anterior {ruta_geojson}: {e}")
+        return {}, False
+
+    municipios = anterior.get("municipios", {})
+    features = {}
+    for posicion, (natcode, huella) in enumerate(zip(natcodes, huellas_actuales)):
+        entrada = municipios.get(natcode)
+        # Un municipio sin zonas anotadas no se reutiliza (su división falló)
+        if (entrada and entrada["huella"] == huella and entrada["ids"]
+                and all(i in features_previas for i in entrada["ids"])):
+            features[posicion] = [features_previas[i] for i in entrada["ids"]]
+
+    sin_cambios = len(features) == len(natcodes) and set(municipios) == set(natcodes)
+    return features, sin_cambios
@@ -0,0 +1,398 @@
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+from shapely.geometry import box
+try:
+    import pyarrow  # Necesario para leer y escribir GeoParquet
+except ImportError:
+    pyarrow = None
+try:
+    import pyogrio  # Lectura de shapefiles con filtros por atributos y bbox
+except ImportError:
+    pyogrio = None
+
+# Caché de ingesta: cada capa de lineas_limite convertida a GeoParquet y ya proyectada
+DIRECTORIO_INGESTA = "cache_ingesta"
+CRS_INGESTA = "EPSG:4326"
+
+# Versión del formato de la caché de ingesta: incrementarla si cambia la conversión
+VERSION_INGESTA = 3
+
+# Filas por grupo del GeoParquet. Las filas se ordenan por NATCODE, así que al filtrar
+# por prefijo se leen solo los grupos cuyo rango de códigos lo incluye
+FILAS_POR_GRUPO = 512
+
+# Archivos de un shapefile de los que depende su contenido
+EXTENSIONES_SHAPEFILE = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+# Niveles del índice de jerarquía y longitud del prefijo de NATCODE que los identifica.
+# Un NATCODE es "34" + comunidad (2) + provincia (2) + municipio (5)
+LONGITUDES_NIVEL = {"comunidad": 4, "provincia": 6, "municipio": 11}
+
+# Atributos que el índice guarda de cada región cuando son comunes a todos sus recintos
+ATRIBUTOS_INDICE = ["NAMEUNIT", "CODNUT1", "CODNUT2", "CODNUT3"]
+
+def rutas_ingesta(ruta_shapefile, directorio=DIRECTORIO_INGESTA):
+    """
+    Rutas de la capa ingerida de un shapefile
+
+    Args:
+        ruta_shapefile: Ruta al shapefile (.shp)
+        directorio: Directorio de la caché de ingesta
+
+    Returns:
+        Tupla (ruta_parquet, ruta_metadatos)
+    """
+    nombre = os.path.splitext(os.path.basename(ruta_shapefile))[0]
+    return os.path.join(directorio, nombre + ".parquet"), os.path.join(directorio, nombre + ".json")
+
+def ruta_indice(ruta_shapefile, directorio=DIRECTORIO_INGESTA):
+    """
+    Ruta del índice de jerarquía de la capa ingerida de un shapefile
+    """
+    nombre = os.path.splitext(os.path.basename(ruta_shapefile))[0]
+    return os.path.join(directorio, nombre + ".indice.json")
+
+def _hash_archivo(ruta):
+    """
+    Hash SHA-256 en hexadecimal del contenido de un archivo, leído por bloques
+    """
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def describir_fuente(ruta_shapefile, anterior=None):
+    """
+    Describe los archivos de un shapefile: fecha de modificación, tamaño y hash SHA-256
+
+    El hash solo se recalcula para los archivos cuya fecha o tamaño no coinciden con la
+    descripción anterior, así que comprobar una capa sin cambios no lee el shapefile.
+
+    Args:
+        ruta_shapefile: Ruta al shapefile (.shp)
+        anterior: Descripción guardada en la ingesta anterior (opcional)
+
+    Returns:
+        dict nombre_archivo -> {"mtime_ns": int, "tamano": int, "sha256": str}
+    """
+    anterior = anterior or {}
+    base = os.path.splitext(ruta_shapefile)[0]
+    fuente = {}
+    for extension in EXTENSIONES_SHAPEFILE:
+        ruta = base + extension
+        if not os.path.exists(ruta):
+            continue
+        estado = os.stat(ruta)
+        nombre = os.path.basename(ruta)
+        previo = anterior.get(nombre)
+        if previo and previo["mtime_ns"] == estado.st_mtime_ns and previo["tamano"] == estado.st_size:
+            sha256 = previo["sha256"]
+        else:
+            sha256 = _hash_archivo(ruta)
+        fuente[nombre] = {"mtime_ns": estado.st_mtime_ns, "tamano": estado.st_size, "sha256": sha256}
+    return fuente
+
+def _cargar_metadatos(ruta):
+    """
+    Lee los metadatos de una capa ingerida (None si no existen o no se pueden leer)
+    """
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"No se pudieron leer los metadatos de ingesta {ruta}: {e}")
+        return None
+
+def _guardar_metadatos(ruta, metadatos):
+    """
+    Guarda los metadatos de una capa ingerida de forma atómica (archivo temporal y reemplazo)
+    """
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(metadatos, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+def construir_indice(gdf):
+    """
+    Construye el índice de jerarquía de una capa ordenada por NATCODE
+
+    Para cada prefijo de NATCODE de cada nivel (comunidad, provincia y municipio) guarda
+    su nombre y atributos comunes, su rectángulo, su número de vértices y recintos, su
+    superficie (en grados cuadrados de CRS_INGESTA, como el resto del proyecto) y el rango
+    de filas [inicio, fin) que ocupa en el GeoParquet. Con él se pueden listar regiones,
+    situarlas y estimar su coste sin leer la geometría.
+
+    Args:
+        gdf: GeoDataFrame ordenado por NATCODE, en el orden en que se escribe el GeoParquet
+
+    Returns:
+        dict nivel -> {prefijo: {"nombre", "atributos", "bbox", "vertices", "area", "recintos", "filas"}}
+    """
+    geometrias = gdf.geometry.values
+    limites = shapely.bounds(geometrias)
+    tabla = pd.DataFrame({
+        "fila": np.arange(len(gdf)),
+        "minx": limites[:, 0], "miny": limites[:, 1], "maxx": limites[:, 2], "maxy": limites[:, 3],
+        "vertices": shapely.get_num_coordinates(geometrias),
+        "area": shapely.area(geometrias)
+    })
+    natcodes = gdf["NATCODE"].astype(str).to_numpy()
+    atributos = [columna for columna in ATRIBUTOS_INDICE if columna in gdf.columns]
+
+    indice = {}
+    for nivel, longitud in LONGITUDES_NIVEL.items():
+        prefijos = pd.Series(natcodes).str[:longitud].to_numpy()
+        grupos = tabla.groupby(prefijos, sort=True)
+        resumen = grupos.agg(inicio=("fila", "min"), fin=("fila", "max"), recintos=("fila", "size"),
+                             minx=("minx", "min"), miny=("miny", "min"), maxx=("maxx", "max"), maxy=("maxy", "max"),
+                             vertices=("vertices", "sum"), area=("area", "sum"))
+        # Un atributo se guarda solo si es el mismo en todos los recintos de la región
+        comunes = {}
+        for columna in atributos:
+            valores = gdf[columna].groupby(prefijos, sort=True)
+            unicos = valores.nunique(dropna=False)
+            comunes[columna] = valores.first().where(unicos == 1)
+
+        regiones = {}
+        for prefijo, fila in zip(resumen.index, resumen.itertuples(index=False)):
+            valores = {columna: comunes[columna][prefijo] for columna in atributos
+                       if pd.notna(comunes[columna][prefijo])}
+            regiones[prefijo] = {
+                "nombre": valores.pop("NAMEUNIT", None),
+                "atributos": valores,
+                "bbox": [fila.minx, fila.miny, fila.maxx, fila.maxy],
+                "vertices": int(fila.vertices),
+                "area": fila.area,
+                "recintos": int(fila.recintos),
+                # Las filas están ordenadas por NATCODE: cada región ocupa un rango contiguo
+                "filas": [int(fila.inicio), int(fila.fin) + 1]
+            }
+        indice[nivel] = regiones
+    return indice
+
+def ingestar_capa(ruta_shapefile, directorio=DIRECTORIO_INGESTA, forzar=False):
+    """
+    Convierte un shapefile en GeoParquet proyectado a CRS_INGESTA, si no lo estaba ya
+
+    La capa ingerida es válida mientras el contenido de los archivos del shapefile no
+    cambie: si su fecha y tamaño coinciden no se leen, y si no coinciden (por ejemplo,
+    tras copiarlos) se compara su hash antes de volver a convertir.
+
+    Args:
+        ruta_shapefile: Ruta al shapefile (.shp)
+        directorio: Directorio de la caché de ingesta
+        forzar: Convertir aunque la capa ingerida esté al día
+
+    Returns:
+        Tupla (ruta_parquet, metadatos)
+    """
+    ruta_parquet, ruta_metadatos = rutas_ingesta(ruta_shapefile, directorio)
+    metadatos = _cargar_metadatos(ruta_metadatos)
+    fuente = describir_fuente(ruta_shapefile, metadatos["fuente"] if metadatos else None)
+
+    vigente = (not forzar and metadatos is not None and os.path.exists(ruta_parquet)
+               and metadatos.get("version") == VERSION_INGESTA and metadatos.get("crs") == CRS_INGESTA
+               and {nombre: datos["sha256"] for nombre, datos in metadatos["fuente"].items()}
+                   == {nombre: datos["sha256"] for nombre, datos in fuente.items()})
+    if vigente:
+        # Mismo contenido con otra fecha: actualizarla para no volver a calcular el hash
+        if metadatos["fuente"] != fuente:
+            metadatos["fuente"] = fuente
+            _guardar_metadatos(ruta_metadatos, metadatos)
+        return ruta_parquet, metadatos
+
+    print(f"Ingiriendo {ruta_shapefile} en {ruta_parquet}")
+    inicio = time.time()
+    gdf = gpd.read_file(ruta_shapefile)
+    if gdf.crs != CRS_INGESTA:
+        print(f"Convirtiendo de {gdf.crs} a {CRS_INGESTA}")
+        gdf = gdf.to_crs(CRS_INGESTA)
+
+    if "NATCODE" in gdf.columns:
+        gdf = gdf.sort_values("NATCODE", kind="stable", ignore_index=True)
+        indice = construir_indice(gdf)
+    else:
+        indice = None
+
+    os.makedirs(directorio, exist_ok=True)
+    temporal = ruta_parquet + ".tmp"
+    gdf.to_parquet(temporal, index=False, row_group_size=FILAS_POR_GRUPO)
+    os.replace(temporal, ruta_parquet)
+
+    # El índice se escribe compacto en su propio archivo para leerlo sin los metadatos
+    if indice is not None:
+        temporal = ruta_indice(ruta_shapefile, directorio) + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({"niveles": LONGITUDES_NIVEL, "regiones": indice}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporal, ruta_indice(ruta_shapefile, directorio))
+
+    metadatos = {
+        "version": VERSION_INGESTA,
+        "crs": CRS_INGESTA,
+        "shapefile": ruta_shapefile,
+        "filas": len(gdf),
+        "columnas": [columna for columna in gdf.columns if columna != gdf.geometry.name],
+        "indice": indice is not None,
+        "fuente": fuente
+    }
+    _guardar_metadatos(ruta_metadatos, metadatos)
+    print(f"Capa ingerida: {len(gdf)} filas en {time.time() - inicio:.1f} s")
+    return ruta_parquet, metadatos
+
+def cargar_indice(ruta_shapefile, directorio=DIRECTORIO_INGESTA):
+    """
+    Lee el índice de jerarquía de una capa (ver construir_indice), ingiriéndola si hace falta
+
+    Args:
+        ruta_shapefile: Ruta al shapefile (.shp)
+        directorio: Directorio de la caché de ingesta
+
+    Returns:
+        dict nivel -> {prefijo: región}, o None si no hay caché de ingesta o la capa no tiene NATCODE
+    """
+    if pyarrow is None:
+        return None
+    _, metadatos = ingestar_capa(ruta_shapefile, directorio)
+    if not metadatos.get("indice"):
+        return None
+    try:
+        with open(ruta_indice(ruta_shapefile, directorio), 'r', encoding='utf-8') as f:
+            return json.load(f)["regiones"]
+    except Exception as e:
+        print(f"No se pudo leer el índice de jerarquía de {ruta_shapefile}: {e}")
+        return None
+
+def _fin_prefijo(prefijo):
+    """
+    Primera cadena posterior a todas las que empiezan por el prefijo (límite superior del rango)
+    """
+    return prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+def leer_capa(ruta_shapefile, columnas=None, geometria=True, prefijo_natcode=None, bbox=None,
+              directorio=DIRECTORIO_INGESTA, otros_natcodes=None):
+    """
+    Lee una capa de lineas_limite desde la caché de ingesta, proyectada a CRS_INGESTA
+
+    La primera vez (o si el shapefile ha cambiado) se ingiere la capa; después solo
+    se leen del GeoParquet las columnas pedidas y, con prefijo_natcode, solo los grupos
+    de filas que pueden contener esos códigos. Sin pyarrow se lee el shapefile (con
+    pyogrio, pasándole los filtros para que OGR descarte las filas al leer).
+
+    Args:
+        ruta_shapefile: Ruta al shapefile (.shp)
+        columnas: Columnas de atributos a leer (None para todas). Las que no existan en la capa se ignoran
+        geometria: Leer también la geometría (si es False se devuelve un DataFrame)
+        prefijo_natcode: Leer solo las filas cuyo NATCODE empieza por este prefijo (opcional)
+        bbox: Devolver solo las filas que intersectan este rectángulo (minx, miny, maxx, maxy) en
+            CRS_INGESTA (opcional). En el GeoParquet es un filtro tras leer, no reduce la lectura
+        directorio: Directorio de la caché de ingesta
+        otros_natcodes: NATCODE que se leen además de los del prefijo (por ejemplo, los
+            municipios que la tabla de asignación pone en la comunidad por su ubicación)
+
+    Returns:
+        GeoDataFrame (o DataFrame sin geometría) con la capa
+    """
+    otros_natcodes = list(otros_natcodes or [])
+    if pyarrow is None:
+        print("pyarrow no está instalado: no se usa la caché de ingesta.")
+        return _leer_shapefile(ruta_shapefile, columnas, geometria, prefijo_natcode, bbox, otros_natcodes)
+
+    ruta_parquet, metadatos = ingestar_capa(ruta_shapefile, directorio)
+    if columnas is not None:
+        columnas = [columna for columna in columnas if columna in metadatos["columnas"]]
+
+    # El filtro se resuelve con las estadísticas de NATCODE de cada grupo de filas
+    # (lista de alternativas: el rango del prefijo o los otros NATCODE)
+    filtros = None
+    if prefijo_natcode:
+        filtros = [[("NATCODE", ">=", prefijo_natcode), ("NATCODE", "<", _fin_prefijo(prefijo_natcode))]]
+        if otros_natcodes:
+            filtros.append([("NATCODE", "in", otros_natcodes)])
+    if not geometria:
+        return pd.read_parquet(ruta_parquet, columns=columnas, filters=filtros)
+
+    gdf = gpd.read_parquet(ruta_parquet, columns=None if columnas is None else columnas + ["geometry"], filters=filtros)
+    # El GeoParquet no guarda el rectángulo de cada fila: el bbox se aplica sobre lo ya leído
+    if bbox is not None:
+        gdf = gdf[gdf.intersects(box(*bbox))]
+    return gdf
+
+def _leer_shapefile(ruta_shapefile, columnas, geometria, prefijo_natcode, bbox, otros_natcodes=()):
+    """
+    Lee directamente un shapefile proyectado a CRS_INGESTA, sin la caché de ingesta
+
+    Con pyogrio, las columnas, el prefijo y los otros NATCODE (cláusula WHERE) y el bbox
+    se aplican en OGR al leer, de modo que las filas descartadas no llegan a decodificarse.
+    Sin pyogrio se lee la capa entera y se filtra después.
+    """
+    if pyogrio is not None:
+        info = pyogrio.read_info(ruta_shapefile)
+        if columnas is not None:
+            columnas = [columna for columna in columnas if columna in info["fields"]]
+        donde = None
+        if prefijo_natcode and "NATCODE" in info["fields"]:
+            donde = f"NATCODE LIKE '{prefijo_natcode}%'"
+            if otros_natcodes:
+                donde += " OR NATCODE IN (" + ", ".join(f"'{natcode}'" for natcode in otros_natcodes) + ")"
+        # El bbox se pide en el CRS de la capa (ETRS89 en los shapefiles del IGN)
+        bbox_capa = None
+        if bbox is not None:
+            bbox_capa = tuple(Transformer.from_crs(CRS_INGESTA, info["crs"], always_xy=True).transform_bounds(*bbox))
+        gdf = pyogrio.read_dataframe(ruta_shapefile, columns=columnas, read_geometry=geometria,
+                                     where=donde, bbox=bbox_capa)
+        if not geometria:
+            return pd.DataFrame(gdf)
+    else:
+        gdf = gpd.read_file(ruta_shapefile)
+        if columnas is not None:
+            gdf = gdf[[columna for columna in columnas if columna in gdf.columns] + [gdf.geometry.name]]
+        if prefijo_natcode and "NATCODE" in gdf.columns:
+            gdf = gdf[gdf["NATCODE"].str.startswith(prefijo_natcode) | gdf["NATCODE"].isin(otros_natcodes)]
+        if not geometria:
+            return pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+
+    if gdf.crs != CRS_INGESTA:
+        print(f"Convirtiendo de {gdf.crs} a {CRS_INGESTA}")
+        gdf = gdf.to_crs(CRS_INGESTA)
+    if bbox is not None and pyogrio is None:
+        gdf = gdf[gdf.intersects(box(*bbox))]
+    return gdf
+
+def main():
+    # Ingerir todas las capas de lineas_limite (con "forzar", aunque estén al día)
+    base_dir = "lineas_limite"
+    forzar = "forzar" in sys.argv[1:]
+
+    shapefiles = sorted(glob.glob(os.path.join(base_dir, "**", "*.shp"), recursive=True))
+    if not shapefiles:
+        print(f"No se encontraron shapefiles en {base_dir}. Asegúrate de tener la estructura de carpetas correcta.")
+        return
+    if pyarrow is None:
+        print("pyarrow no está instalado. Instálalo para usar la caché de ingesta.")
+        return
+
+    for ruta_shapefile in shapefiles:
+        try:
+            ruta_parquet, metadatos = ingestar_capa(ruta_shapefile, forzar=forzar)
+            print(f" - {ruta_parquet}: {metadatos['filas']} filas")
+            if metadatos.get("indice"):
+                print(f"   índice de jerarquía: {ruta_indice(ruta_shapefile)}")
+        except Exception as e:
+            print(f"Error al ingerir {ruta_shapefile}: {e}")
+
+    print("Ingesta completada.")
+
+if __name__ == "__main__":
+    main()
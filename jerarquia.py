@@ -0,0 +1,221 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import shapely
+from ingesta import DIRECTORIO_INGESTA, LONGITUDES_NIVEL, describir_fuente
+
+# Un NATCODE es "34" + comunidad (2) + provincia (2) + municipio (5): los municipios
+# de una comunidad comparten con ella los 4 primeros caracteres, y los de una provincia los 6
+LONGITUD_PREFIJO_CCAA = LONGITUDES_NIVEL["comunidad"]
+LONGITUD_PREFIJO_PROVINCIA = LONGITUDES_NIVEL["provincia"]
+
+# Tabla de asignación municipio -> comunidad autónoma, junto a la caché de ingesta
+ARCHIVO_ASIGNACION = "asignacion_municipios.json"
+
+# Versión de la tabla: incrementarla si cambia la forma de asignar
+VERSION_ASIGNACION = 1
+
+def prefijo_comunidad(codigo):
+    """
+    Prefijo de NATCODE común a una comunidad autónoma y a todos sus municipios
+
+    Args:
+        codigo: NATCODE de la comunidad o de cualquiera de sus municipios
+
+    Returns:
+        Los LONGITUD_PREFIJO_CCAA primeros caracteres
+    """
+    return codigo[:LONGITUD_PREFIJO_CCAA]
+
+def prefijo_provincia(codigo):
+    """
+    Prefijo de NATCODE común a una provincia y a todos sus municipios
+
+    Args:
+        codigo: NATCODE de cualquiera de los municipios de la provincia
+
+    Returns:
+        Los LONGITUD_PREFIJO_PROVINCIA primeros caracteres
+    """
+    return codigo[:LONGITUD_PREFIJO_PROVINCIA]
+
+def listar_regiones(indice, nivel, prefijo=None):
+    """
+    Regiones de un nivel del índice de jerarquía, opcionalmente solo las de una región superior
+
+    Args:
+        indice: Índice devuelto por ingesta.cargar_indice
+        nivel: 'comunidad', 'provincia' o 'municipio'
+        prefijo: Prefijo de NATCODE de la región superior (opcional)
+
+    Returns:
+        dict prefijo -> región, ordenado por NATCODE
+    """
+    return {codigo: region for codigo, region in indice[nivel].items()
+            if prefijo is None or codigo.startswith(prefijo)}
+
+def resolver_region(indice, nivel, codigo, atributo=None):
+    """
+    Busca una región del índice por su prefijo de NATCODE o por el valor de un atributo
+
+    Args:
+        indice: Índice devuelto por ingesta.cargar_indice
+        nivel: 'comunidad', 'provincia' o 'municipio'
+        codigo: Prefijo de NATCODE de la región, o valor del atributo
+        atributo: Atributo por el que buscar si codigo no es un prefijo (p. ej. 'CODNUT3')
+
+    Returns:
+        Tupla (prefijo, región), o (None, None) si no existe
+    """
+    regiones = indice[nivel]
+    if codigo in regiones:
+        return codigo, regiones[codigo]
+    if atributo is not None:
+        for prefijo, region in regiones.items():
+            if region["atributos"].get(atributo) == codigo:
+                return prefijo, region
+    return None, None
+
+def calcular_asignacion(gdf_ccaa, gdf_municipios):
+    """
+    Asigna cada municipio a su comunidad autónoma
+
+    Los municipios se asignan por la jerarquía del NATCODE (su prefijo es el de su
+    comunidad). Los que no encajan en ninguna se asignan a la comunidad que contiene
+    un punto interior del municipio, buscada con un STRtree de las comunidades (o a la
+    más cercana si el punto queda fuera de todas por la precisión de la costa).
+
+    Args:
+        gdf_ccaa: GeoDataFrame con las comunidades autónomas
+        gdf_municipios: GeoDataFrame con los municipios
+
+    Returns:
+        dict codigo_ccaa -> lista de NATCODE de sus municipios
+    """
+    codigos = gdf_ccaa['NATCODE'].to_numpy()
+    natcodes = gdf_municipios['NATCODE'].to_numpy()
+    por_prefijo = {prefijo_comunidad(codigo): codigo for codigo in codigos}
+    asignadas = pd.Series(natcodes).str[:LONGITUD_PREFIJO_CCAA].map(por_prefijo).to_numpy()
+
+    sin_jerarquia = np.flatnonzero(pd.isna(asignadas))
+    if len(sin_jerarquia):
+        arbol = shapely.STRtree(gdf_ccaa.geometry.values)
+        puntos = shapely.point_on_surface(gdf_municipios.geometry.values[sin_jerarquia])
+        idx_puntos, idx_ccaa = arbol.query(puntos, predicate="within")
+        asignadas[sin_jerarquia[idx_puntos]] = codigos[idx_ccaa]
+
+        fuera = np.flatnonzero(pd.isna(asignadas[sin_jerarquia]))
+        if len(fuera):
+            idx_puntos, idx_ccaa = arbol.query_nearest(puntos[fuera], all_matches=False)
+            asignadas[sin_jerarquia[fuera[idx_puntos]]] = codigos[idx_ccaa]
+        print(f"{len(sin_jerarquia)} municipios sin comunidad autónoma por su NATCODE: asignados por su ubicación")
+
+    asignacion = {}
+    for natcode, codigo in zip(natcodes, asignadas):
+        asignacion.setdefault(codigo, {})[natcode] = None
+    # Un municipio con varios recintos aparece una sola vez
+    return {codigo: list(municipios) for codigo, municipios in asignacion.items()}
+
+def _leer_tabla_asignacion(ruta_ccaa, ruta_municipios, directorio):
+    """
+    Lee la tabla de asignación guardada y describe los shapefiles actuales
+
+    Returns:
+        Tupla (asignacion, fuentes): la tabla guardada, o None si no existe o los
+        shapefiles han cambiado, y la descripción actual de los shapefiles
+    """
+    ruta = os.path.join(directorio, ARCHIVO_ASIGNACION)
+    anterior = None
+    if os.path.exists(ruta):
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                anterior = json.load(f)
+        except Exception as e:
+            print(f"No se pudo leer la tabla de asignación {ruta}: {e}")
+
+    fuentes_anteriores = anterior["fuentes"] if anterior and anterior.get("version") == VERSION_ASIGNACION else {}
+    fuentes = {
+        "comunidades": describir_fuente(ruta_ccaa, fuentes_anteriores.get("comunidades")),
+        "municipios": describir_fuente(ruta_municipios, fuentes_anteriores.get("municipios"))
+    }
+
+    def hashes(descripcion):
+        return {capa: {nombre: datos["sha256"] for nombre, datos in archivos.items()}
+                for capa, archivos in descripcion.items()}
+
+    if fuentes_anteriores and hashes(fuentes_anteriores) == hashes(fuentes):
+        return anterior["asignacion"], fuentes
+    return None, fuentes
+
+def asignacion_guardada(ruta_ccaa, ruta_municipios, directorio=DIRECTORIO_INGESTA):
+    """
+    Devuelve la tabla de asignación guardada si sigue al día, sin leer las capas
+
+    Con ella se sabe qué municipios leer para una sola comunidad, incluidos los que
+    se le asignaron por su ubicación aunque su NATCODE tenga otro prefijo.
+
+    Args:
+        ruta_ccaa: Ruta al shapefile de comunidades autónomas
+        ruta_municipios: Ruta al shapefile de municipios
+        directorio: Directorio de la caché de ingesta
+
+    Returns:
+        dict codigo_ccaa -> lista de NATCODE de sus municipios, o None si no hay
+        tabla o los shapefiles han cambiado desde que se calculó
+    """
+    asignacion, _ = _leer_tabla_asignacion(ruta_ccaa, ruta_municipios, directorio)
+    return asignacion
+
+def cargar_asignacion(ruta_ccaa, ruta_municipios, gdf_ccaa, gdf_municipios, persistir=True,
+                      directorio=DIRECTORIO_INGESTA):
+    """
+    Devuelve la tabla de asignación municipio -> comunidad autónoma, calculándola solo si hace falta
+
+    La tabla se guarda junto a la caché de ingesta con la descripción de los shapefiles
+    de los que sale (ver ingesta.describir_fuente) y se reutiliza mientras su contenido
+    no cambie.
+
+    Args:
+        ruta_ccaa: Ruta al shapefile de comunidades autónomas
+        ruta_municipios: Ruta al shapefile de municipios
+        gdf_ccaa: GeoDataFrame con las comunidades autónomas
+        gdf_municipios: GeoDataFrame con los municipios
+        persistir: Guardar la tabla si se calcula (False si gdf_municipios no es la capa completa)
+        directorio: Directorio de la caché de ingesta
+
+    Returns:
+        dict codigo_ccaa -> lista de NATCODE de sus municipios
+    """
+    asignacion, fuentes = _leer_tabla_asignacion(ruta_ccaa, ruta_municipios, directorio)
+    if asignacion is not None:
+        return asignacion
+
+    asignacion = calcular_asignacion(gdf_ccaa, gdf_municipios)
+    if persistir:
+        ruta = os.path.join(directorio, ARCHIVO_ASIGNACION)
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            temporal = ruta + ".tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump({"version": VERSION_ASIGNACION, "fuentes": fuentes, "asignacion": asignacion}, f)
+            os.replace(temporal, ruta)
+        except Exception as e:
+            print(f"Error al guardar la tabla de asignación {ruta}: {e}")
+    return asignacion
+
+def asignar_comunidades(gdf_municipios, asignacion):
+    """
+    Añade a los municipios la columna CODIGO_CCAA con su comunidad autónoma
+
+    Args:
+        gdf_municipios: GeoDataFrame con los municipios
+        asignacion: Tabla devuelta por cargar_asignacion o calcular_asignacion
+
+    Returns:
+        GeoDataFrame con la columna CODIGO_CCAA
+    """
+    comunidad_de = {natcode: codigo for codigo, natcodes in asignacion.items() for natcode in natcodes}
+    gdf_municipios = gdf_municipios.copy()
+    gdf_municipios['CODIGO_CCAA'] = gdf_municipios['NATCODE'].map(comunidad_de)
+    return gdf_municipios
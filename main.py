@@ -2,8 +2,9 @@ import os
 import geopandas as gpd
 import json
 import uuid
-from shapely.geometry import mapping, shape, Polygon, MultiPolygon, Point
+from shapely.geometry import mapping, shape, Polygon, MultiPolygon
 import numpy as np
+import shapely
 from tqdm import tqdm
 import math
 import random
@@ -11,12 +12,40 @@ import sys
 import matplotlib.pyplot as plt
 import folium
 import colorsys
+import collections
 import concurrent.futures
+import contextlib
+import importlib
 import multiprocessing
 import unicodedata
 import re
 import time
+import signal
+import threading
 import traceback  # Para trackear errores en detalle
+try:
+    import resource  # Solo disponible en sistemas Unix, para medir la memoria máxima
+except ImportError:
+    resource = None
+from voronoi_utils import (generar_puntos_triangulacion, generar_semillas,
+                           poligonos_voronoi, poligonos_voronoi_global, crear_generador,
+                           relajar_lloyd, relajar_cvt, reiniciar_estadisticas, obtener_estadisticas,
+                           fijar_limite_tiempo, comprobar_limite_tiempo, TiempoAgotado, LIMITE_TIEMPO,
+                           ITERACIONES_CVT)
+from cache_particiones import (abrir_cache, cerrar_cache, clave_particion, leer_particion, guardar_particion,
+                               DIRECTORIO_CACHE, TAMANO_MAXIMO_CACHE_MB)
+from incremental import ARCHIVO_HUELLAS, huella_geometria, cargar_huellas, guardar_huellas, zonas_reutilizables
+from ingesta import leer_capa
+from jerarquia import (prefijo_comunidad, asignacion_guardada, cargar_asignacion, calcular_asignacion,
+                       asignar_comunidades)
+from diario import ARCHIVO_DIARIO, abrir_diario, recuperar_municipio, anotar_municipio, cerrar_diario
+from planificador import (caracteristicas_coste, cargar_coeficientes, estimar_costes, formar_lotes_lpt,
+                          municipios_elegibles_gpu, repartir_cpu_gpu, registrar_tiempos, resumir_prediccion,
+                          ACELERACION_GPU, NOMBRE_REGISTRO_TIEMPOS)
+
+# Backends de GPU: el real (CuPy) y uno simulado con NumPy para probar sin GPU
+MODULO_GPU = "gpu_voronoi_utils"
+MODULO_GPU_SIMULADO = "gpu_simulado"
 
 # Variables globales para GPU
 gpu_disponible = False
@@ -34,128 +63,13 @@ except ImportError:
     gpu_utils_importado = False
     print("Módulo gpu_voronoi_utils no encontrado. Utilizando funciones CPU estándar.")
 
-# ----------------------------------------
-# UTILIDADES PARA DIAGRAMA DE VORONOI
-# ----------------------------------------
-
-def generar_puntos_dentro_poligono(poligono, n_puntos):
-    """
-    Genera n_puntos puntos aleatorios dentro del polígono.
-    
-    Args:
-        poligono: Polígono (shapely.geometry.Polygon)
-        n_puntos: Número de puntos a generar
-    
-    Returns:
-        Lista de puntos (x, y)
-    """
-    # Obtener bounding box del polígono
-    minx, miny, maxx, maxy = poligono.bounds
-    
-    # Lista para almacenar los puntos generados
-    puntos = []
-    intentos_maximos = n_puntos * 1000  # Límite de intentos para evitar bucles infinitos
-    intentos = 0
-    
-    # Generar puntos aleatorios dentro del polígono
-    while len(puntos) < n_puntos and intentos < intentos_maximos:
-        # Generar punto aleatorio dentro del bounding box
-        x = random.uniform(minx, maxx)
-        y = random.uniform(miny, maxy)
-        punto = Point(x, y)
-        
-        # Verificar si el punto está dentro del polígono
-        if poligono.contains(punto):
-            puntos.append((x, y))
-        
-        intentos += 1
-    
-    return puntos
-
-def poligonos_voronoi(puntos, poligono_limite):
-    """
-    Genera un diagrama de Voronoi y recorta las regiones por el polígono límite.
-    
-    Args:
-        puntos: Lista de puntos (x, y)
-        poligono_limite: Polígono que limita las regiones (shapely.geometry.Polygon)
-    
-    Returns:
-        Lista de polígonos correspondientes a las regiones de Voronoi
-    """
-    from scipy.spatial import Voronoi
-    
-    # Si no hay suficientes puntos, devolver el polígono original
-    if len(puntos) <= 1:
-        return [poligono_limite]
-    
-    # Convertir puntos a array numpy
-    puntos_np = np.array(puntos)
-    
-    # Obtener bounding box del polígono
-    minx, miny, maxx, maxy = poligono_limite.bounds
-    
-    # Calcular el tamaño del bounding box
-    ancho = maxx - minx
-    alto = maxy - miny
-    
-    # Crear puntos adicionales fuera del polígono para cerrar regiones de Voronoi
-    puntos_adicionales = [
-        (minx - ancho, miny - alto),
-        (minx - ancho, maxy + alto),
-        (maxx + ancho, miny - alto),
-        (maxx + ancho, maxy + alto),
-        (minx - ancho, (miny + maxy) / 2),
-        (maxx + ancho, (miny + maxy) / 2),
-        ((minx + maxx) / 2, miny - alto),
-        ((minx + maxx) / 2, maxy + alto)
-    ]
-    
-    # Añadir puntos adicionales
-    puntos_voronoi = np.vstack([puntos_np, puntos_adicionales])
-    
-    # Calcular diagrama de Voronoi
-    vor = Voronoi(puntos_voronoi)
-    
-    # Lista para almacenar las regiones de Voronoi
-    regiones_voronoi = []
-    
-    # Procesar regiones de Voronoi para los puntos originales (no los adicionales)
-    for i in range(len(puntos)):
-        # Obtener región de Voronoi para el punto i
-        region_index = vor.point_region[i]
-        region_vertices = vor.regions[region_index]
-        
-        # Verificar si la región es válida
-        if -1 not in region_vertices and len(region_vertices) > 0:
-            # Obtener coordenadas de los vértices
-            polygon_vertices = [vor.vertices[v] for v in region_vertices]
-            
-            # Crear polígono
-            poligono_voronoi = Polygon(polygon_vertices)
-            
-            # Intersectar con el polígono límite
-            region_recortada = poligono_voronoi.intersection(poligono_limite)
-            
-            # Añadir a la lista si la intersección es válida
-            if not region_recortada.is_empty:
-                if isinstance(region_recortada, Polygon):
-                    regiones_voronoi.append(region_recortada)
-                elif isinstance(region_recortada, MultiPolygon):
-                    # Si la intersección es un multipolígono, añadir cada parte
-                    for geom in region_recortada.geoms:
-                        regiones_voronoi.append(geom)
-    
-    # Si no se generaron regiones, devolver el polígono original
-    if not regiones_voronoi:
-        return [poligono_limite]
-    
-    return regiones_voronoi
-
 # ----------------------------------------
 # FUNCIONES PARA DIVIDIR MUNICIPIOS
 # ----------------------------------------
 
+# Únicos atributos de los recintos que se usan (además de la geometría)
+COLUMNAS_RECINTOS = ["NATCODE", "NAMEUNIT"]
+
 def obtener_comunidades_autonomas(input_shapefile_recintos_autonomicos):
     """
     Obtiene la lista de comunidades autónomas del shapefile
@@ -167,34 +81,29 @@ def obtener_comunidades_autonomas(input_shapefile_recintos_autonomicos):
         GeoDataFrame con las comunidades autónomas
     """
     print(f"Leyendo comunidades autónomas de: {input_shapefile_recintos_autonomicos}")
-    gdf_ccaa = gpd.read_file(input_shapefile_recintos_autonomicos)
-    
-    # Asegurarse de que está en el sistema de coordenadas correcto (WGS84)
-    if gdf_ccaa.crs != "EPSG:4326":
-        print(f"Convirtiendo de {gdf_ccaa.crs} a EPSG:4326 (WGS84)")
-        gdf_ccaa = gdf_ccaa.to_crs("EPSG:4326")
-    
-    return gdf_ccaa
+    # La caché de ingesta ya guarda la capa en WGS84 (EPSG:4326)
+    return leer_capa(input_shapefile_recintos_autonomicos, COLUMNAS_RECINTOS)
 
-def obtener_municipios(input_shapefile_municipios):
+def obtener_municipios(input_shapefile_municipios, codigo_ccaa=None, natcodes_ccaa=None):
     """
-    Obtiene todos los municipios del shapefile
+    Obtiene los municipios del shapefile (todos, o solo los de una comunidad autónoma)
     
     Args:
         input_shapefile_municipios: Ruta al shapefile de municipios
+        codigo_ccaa: Leer solo los municipios de esta comunidad autónoma (opcional)
+        natcodes_ccaa: NATCODE de sus municipios según la tabla de asignación (opcional);
+            incluye los asignados por su ubicación, cuyo NATCODE tiene otro prefijo
     
     Returns:
-        GeoDataFrame con todos los municipios
+        GeoDataFrame con los municipios
     """
     print(f"Leyendo municipios de: {input_shapefile_municipios}")
-    gdf_municipios = gpd.read_file(input_shapefile_municipios)
-    
-    # Asegurarse de que está en el sistema de coordenadas correcto (WGS84)
-    if gdf_municipios.crs != "EPSG:4326":
-        print(f"Convirtiendo de {gdf_municipios.crs} a EPSG:4326 (WGS84)")
-        gdf_municipios = gdf_municipios.to_crs("EPSG:4326")
-    
-    return gdf_municipios
+    # La caché de ingesta ya guarda la capa en WGS84 (EPSG:4326). Con una comunidad, el filtro
+    # por NATCODE se aplica al leer, sin cargar los municipios del resto de España
+    prefijo_natcode = prefijo_comunidad(codigo_ccaa) if codigo_ccaa else None
+    otros_natcodes = [natcode for natcode in natcodes_ccaa or [] if not natcode.startswith(prefijo_natcode or "")]
+    return leer_capa(input_shapefile_municipios, COLUMNAS_RECINTOS, prefijo_natcode=prefijo_natcode,
+                     otros_natcodes=otros_natcodes)
 
 def determinar_numero_distritos(area_km2, poblacion=None):
     """
@@ -233,13 +142,35 @@ def determinar_numero_distritos(area_km2, poblacion=None):
     
     return num_distritos
 
-def dividir_poligono_voronoi(poligono, num_divisiones):
+def calcular_num_zonas(geometria):
+    """
+    Número de zonas objetivo de un municipio a partir de su geometría
+    
+    Args:
+        geometria: Geometría del municipio en EPSG:4326
+    
+    Returns:
+        Número de zonas (ver determinar_numero_distritos)
+    """
+    # Conversión aproximada de grados² a km²
+    return determinar_numero_distritos(geometria.area * 111 * 111)
+
+def dividir_poligono_voronoi(poligono, num_divisiones, metodo_muestreo="rechazo", motor_voronoi="scipy",
+                             iteraciones_lloyd=None, tolerancia_lloyd=None, metodo_relajacion="lloyd", rng=None):
     """
     Divide un polígono en múltiples partes aproximadamente iguales usando Voronoi
     
     Args:
         poligono: Polígono a dividir (shapely.geometry.Polygon)
         num_divisiones: Número de divisiones a crear
+        metodo_muestreo: Generación de semillas ('rechazo' o 'triangulacion')
+        motor_voronoi: Motor de cálculo del diagrama ('scipy' o 'geos')
+        iteraciones_lloyd: Máximo de iteraciones de relajación (por defecto, con
+            Lloyd 5 en GPU y ninguna en CPU; con CVT, ITERACIONES_CVT)
+        tolerancia_lloyd: Desplazamiento máximo de las semillas para detener
+            la relajación antes (por defecto, relativo al tamaño de celda)
+        metodo_relajacion: 'lloyd' (geométrico) o 'cvt' (k-means sobre muestras densas)
+        rng: Generador aleatorio de las semillas (None usa el estado global de NumPy)
     
     Returns:
         Lista de polígonos (shapely.geometry.Polygon)
@@ -260,13 +191,30 @@ def dividir_poligono_voronoi(poligono, num_divisiones):
         if num_divisiones <= 1:
             return [poligono]
             
-        # Intentar usar GPU para generar puntos aleatorios si está disponible
-        if gpu_disponible and gpu_utils_importado:
-            # Generar puntos optimizados con GPU
-            puntos = mejorar_puntos_aleatorios_gpu(poligono, num_divisiones)
+        usar_gpu = gpu_disponible and gpu_utils_importado
+        if iteraciones_lloyd is None:
+            if metodo_relajacion == "cvt":
+                iteraciones_lloyd = ITERACIONES_CVT
+            else:
+                iteraciones_lloyd = 5 if usar_gpu else 0
+        
+        if metodo_muestreo == "triangulacion":
+            # Muestreo sin rechazo sobre la triangulación del polígono
+            puntos = generar_puntos_triangulacion(poligono, num_divisiones, rng=rng)
+            
+            # Relajación de las semillas (se detiene antes si convergen)
+            if iteraciones_lloyd > 0 and len(puntos) > 2:
+                if metodo_relajacion == "cvt":
+                    puntos, _ = relajar_cvt(puntos, poligono, iteraciones_lloyd, tolerancia_lloyd, rng=rng)
+                else:
+                    puntos, _ = relajar_lloyd(puntos, poligono, iteraciones_lloyd, tolerancia_lloyd)
+        # Con GPU, los candidatos se filtran en la GPU; las semillas son las mismas que en CPU
+        elif usar_gpu:
+            puntos = mejorar_puntos_aleatorios_gpu(poligono, num_divisiones, iteraciones_lloyd, tolerancia_lloyd,
+                                                   metodo_relajacion, rng)
         else:
-            # Método CPU original
-            puntos = generar_puntos_dentro_poligono(poligono, num_divisiones)
+            puntos = generar_semillas(poligono, num_divisiones, iteraciones_lloyd, tolerancia_lloyd,
+                                      metodo_relajacion, rng)
         
         # Si no hay suficientes puntos, probar con grid como alternativa
         if len(puntos) < num_divisiones:
@@ -283,7 +231,7 @@ def dividir_poligono_voronoi(poligono, num_divisiones):
             return [poligono]
         
         # Generar diagrama de Voronoi
-        return poligonos_voronoi(puntos, poligono)
+        return poligonos_voronoi(puntos, poligono, motor_voronoi)
     except Exception as e:
         print(f"Error al dividir polígono: {e}")
         traceback.print_exc()  # Imprimir el traceback completo para depuración
@@ -296,6 +244,41 @@ def dividir_poligono_voronoi(poligono, num_divisiones):
             # En caso de error con grid también, devolver el polígono original
             return [poligono]
 
+def recortar_teselas(teselas, poligono):
+    """
+    Recorta un teselado (grid, hexágonos...) por un polígono
+    
+    Las teselas se clasifican con el polígono preparado: las exteriores se
+    descartan, las interiores se conservan sin recortar y solo las del borde
+    se intersectan, todas en una única llamada vectorizada.
+    
+    Args:
+        teselas: Array de polígonos que cubren el bounding box del polígono
+        poligono: Polígono por el que recortar (shapely.geometry.Polygon)
+    
+    Returns:
+        Lista de polígonos (shapely.geometry.Polygon)
+    """
+    shapely.prepare(poligono)
+    intersectan = shapely.intersects(poligono, teselas)
+    interiores = shapely.contains(poligono, teselas)
+    frontera = intersectan & ~interiores
+    
+    recortadas = np.full(len(teselas), None, dtype=object)
+    recortadas[interiores] = teselas[interiores]
+    if frontera.any():
+        recortadas[frontera] = shapely.intersection(teselas[frontera], poligono)
+    
+    celdas = []
+    for interseccion in recortadas[intersectan]:
+        if not interseccion.is_empty and interseccion.area > 0:
+            if isinstance(interseccion, Polygon):
+                celdas.append(interseccion)
+            elif isinstance(interseccion, MultiPolygon):
+                celdas.extend(list(interseccion.geoms))
+    
+    return celdas
+
 def dividir_poligono_grid(poligono, num_divisiones):
     """
     Divide un polígono en un grid aproximado
@@ -318,226 +301,758 @@ def dividir_poligono_grid(poligono, num_divisiones):
         ancho_celda = (maxx - minx) / lado
         alto_celda = (maxy - miny) / lado
         
-        # Crear grid de celdas
-        celdas = []
-        for i in range(lado):
-            for j in range(lado):
-                # Crear celda
-                x1 = minx + i * ancho_celda
-                y1 = miny + j * alto_celda
-                x2 = x1 + ancho_celda
-                y2 = y1 + alto_celda
-                celda = Polygon([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
-                
-                # Intersectar con el polígono original
-                interseccion = celda.intersection(poligono)
-                if not interseccion.is_empty and interseccion.area > 0:
-                    if isinstance(interseccion, Polygon):
-                        celdas.append(interseccion)
-                    elif isinstance(interseccion, MultiPolygon):
-                        celdas.extend(list(interseccion.geoms))
+        # Crear todas las celdas del grid a la vez (recorriendo columnas y, dentro, filas)
+        x1 = np.repeat(minx + np.arange(lado) * ancho_celda, lado)
+        y1 = np.tile(miny + np.arange(lado) * alto_celda, lado)
+        grid = shapely.box(x1, y1, x1 + ancho_celda, y1 + alto_celda)
         
-        return celdas
+        return recortar_teselas(grid, poligono)
     except Exception as e:
         print(f"Error al dividir polígono usando grid: {e}")
         return [poligono]
 
-def procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, codigo_ccaa, output_dir, metodo_division="voronoi", visualizar=False):
+def _generar_hexagonos(minx, miny, maxx, maxy, lado):
+    """
+    Genera los hexágonos (con vértice arriba) de lado dado que cubren un bounding box
+    
+    Returns:
+        Array de polígonos (shapely.geometry.Polygon)
+    """
+    ancho_hexagono = math.sqrt(3) * lado
+    alto_fila = 1.5 * lado
+    
+    # Centros de los hexágonos (filas impares desplazadas medio hexágono)
+    filas = np.arange(miny, maxy + alto_fila, alto_fila)
+    columnas = np.arange(minx, maxx + ancho_hexagono, ancho_hexagono)
+    cx, cy = np.meshgrid(columnas, filas)
+    cx = cx + (np.arange(len(filas)) % 2)[:, None] * ancho_hexagono / 2
+    centros = np.column_stack((cx.ravel(), cy.ravel()))
+    
+    # Vértices de todos los hexágonos: (n, 6, 2)
+    angulos = np.radians(30 + 60 * np.arange(6))
+    desplazamientos = lado * np.column_stack((np.cos(angulos), np.sin(angulos)))
+    vertices = centros[:, None, :] + desplazamientos[None, :, :]
+    
+    return shapely.polygons(vertices)
+
+def dividir_poligono_hexagonos(poligono, num_divisiones, ajustes=3):
+    """
+    Divide un polígono en un teselado de hexágonos regulares
+    
+    El tamaño inicial de los hexágonos hace que su área sea la del polígono
+    entre num_divisiones; después se ajusta con el número de hexágonos que
+    tocan el polígono para acercarse al objetivo contando los del borde.
+    Todos los hexágonos se generan como arrays de NumPy y se recortan en bloque.
+    
+    Args:
+        poligono: Polígono a dividir (shapely.geometry.Polygon)
+        num_divisiones: Número aproximado de divisiones a crear
+        ajustes: Número máximo de reajustes del tamaño de los hexágonos
+    
+    Returns:
+        Lista de polígonos (shapely.geometry.Polygon)
+    """
+    try:
+        if num_divisiones <= 1 or poligono.area <= 0:
+            return [poligono]
+        
+        minx, miny, maxx, maxy = poligono.bounds
+        shapely.prepare(poligono)
+        
+        # Lado del hexágono con área = área del polígono / número de divisiones
+        lado = math.sqrt(2 * poligono.area / (3 * math.sqrt(3) * num_divisiones))
+        hexagonos = _generar_hexagonos(minx, miny, maxx, maxy, lado)
+        
+        # Reajustar el lado según los hexágonos que realmente tocan el polígono
+        for _ in range(ajustes):
+            num_hexagonos = int(shapely.intersects(poligono, hexagonos).sum())
+            if num_hexagonos == 0 or abs(num_hexagonos - num_divisiones) <= max(1, 0.05 * num_divisiones):
+                break
+            lado *= math.sqrt(num_hexagonos / num_divisiones)
+            hexagonos = _generar_hexagonos(minx, miny, maxx, maxy, lado)
+        
+        return recortar_teselas(hexagonos, poligono)
+    except Exception as e:
+        print(f"Error al dividir polígono usando hexágonos: {e}")
+        return [poligono]
+
+def _buscar_corte_area(poligono, fraccion, eje, rondas=4, candidatos=16):
+    """
+    Busca la coordenada de corte perpendicular al eje que deja a su izquierda
+    (o debajo) la fracción indicada del área del polígono.
+    
+    En cada ronda se evalúan varios cortes a la vez con una intersección
+    vectorizada y se estrecha el intervalo alrededor del objetivo.
+    
+    Args:
+        poligono: Polígono a cortar
+        fraccion: Fracción del área que debe quedar antes del corte
+        eje: 0 para cortar en x, 1 para cortar en y
+        rondas: Número de rondas de refinamiento
+        candidatos: Cortes evaluados en cada ronda
+    
+    Returns:
+        Coordenada del corte
+    """
+    minx, miny, maxx, maxy = poligono.bounds
+    inicio, fin = (minx, maxx) if eje == 0 else (miny, maxy)
+    objetivo = fraccion * poligono.area
+    
+    for _ in range(rondas):
+        cortes = np.linspace(inicio, fin, candidatos + 2)[1:-1]
+        if eje == 0:
+            cajas = shapely.box(minx, miny, cortes, maxy)
+        else:
+            cajas = shapely.box(minx, miny, maxx, cortes)
+        areas = shapely.area(shapely.intersection(cajas, poligono))
+        
+        # El área acumulada crece con el corte: acotar el objetivo entre dos cortes
+        k = int(np.searchsorted(areas, objetivo))
+        inicio = cortes[k - 1] if k > 0 else inicio
+        fin = cortes[k] if k < len(cortes) else fin
+    
+    return (inicio + fin) / 2
+
+def _parte_poligonal(geometria):
+    """
+    Parte poligonal de una geometría como un único Polygon o MultiPolygon (None si no tiene)
+    
+    Cuando un corte coincide con una arista, la intersección devuelve una
+    GeometryCollection con el polígono y segmentos o puntos sueltos.
+    """
+    partes = shapely.get_parts(geometria)
+    partes = partes[(shapely.get_type_id(partes) == 3) & (shapely.area(partes) > 0)]
+    if len(partes) == 0:
+        return None
+    return partes[0] if len(partes) == 1 else MultiPolygon(list(partes))
+
+def dividir_poligono_biseccion(poligono, num_divisiones):
+    """
+    Divide un polígono en partes de área aproximadamente igual mediante
+    bisección recursiva: se corta por el eje más largo en la mediana de área
+    hasta obtener num_divisiones partes.
+    
+    Args:
+        poligono: Polígono a dividir (shapely.geometry.Polygon)
+        num_divisiones: Número de divisiones a crear
+    
+    Returns:
+        Lista de num_divisiones zonas (Polygon, o MultiPolygon si el corte deja una zona partida)
+    """
+    try:
+        comprobar_limite_tiempo()
+        poligono = _parte_poligonal(poligono)
+        if poligono is None:
+            return []
+        if num_divisiones <= 1:
+            # Los trozos que deja el corte forman una sola zona
+            return [poligono]
+        
+        # Repartir las divisiones entre las dos mitades
+        divisiones_izquierda = num_divisiones // 2
+        divisiones_derecha = num_divisiones - divisiones_izquierda
+        
+        # Cortar perpendicularmente al eje más largo del bounding box
+        minx, miny, maxx, maxy = poligono.bounds
+        eje_largo = 0 if (maxx - minx) >= (maxy - miny) else 1
+        
+        # Si el corte deja sin superficie uno de los lados, esa mitad perdería sus zonas:
+        # se corta por el otro eje y, si tampoco separa nada, se conserva la pieza entera
+        for eje in (eje_largo, 1 - eje_largo):
+            corte = _buscar_corte_area(poligono, divisiones_izquierda / num_divisiones, eje)
+            
+            if eje == 0:
+                caja_izquierda = shapely.box(minx, miny, corte, maxy)
+                caja_derecha = shapely.box(corte, miny, maxx, maxy)
+            else:
+                caja_izquierda = shapely.box(minx, miny, maxx, corte)
+                caja_derecha = shapely.box(minx, corte, maxx, maxy)
+            
+            parte_izquierda, parte_derecha = shapely.intersection([caja_izquierda, caja_derecha], poligono)
+            if _parte_poligonal(parte_izquierda) is not None and _parte_poligonal(parte_derecha) is not None:
+                return (dividir_poligono_biseccion(parte_izquierda, divisiones_izquierda) +
+                        dividir_poligono_biseccion(parte_derecha, divisiones_derecha))
+        
+        print(f"Advertencia: No se pudo cortar una pieza en {num_divisiones} zonas por bisección. Se conserva entera.")
+        return [poligono]
+    except Exception as e:
+        print(f"Error al dividir polígono usando bisección: {e}")
+        return [poligono]
+
+# Traducciones de nombres de comunidades autónomas de catalán a español
+TRADUCCIONES_CCAA = {
+    "Illes Balears": "Islas Baleares",
+    "Catalunya": "Cataluña",
+    "Euskadi": "País Vasco",
+    "Comunitat Valenciana": "Comunidad Valenciana",
+    "Galicia/Galiza": "Galicia"
+}
+
+# Municipios por tarea en el reparto por municipio
+TAMANO_LOTE_MUNICIPIOS = 8
+
+# Semilla global por defecto: cada municipio deriva de ella y de su NATCODE su propio
+# generador aleatorio, así que el resultado no depende del reparto entre procesos
+SEMILLA_POR_DEFECTO = 0
+
+# Tiempo máximo, en segundos, para dividir un municipio, y método rápido con el que
+# se divide si lo supera, para que una geometría patológica no retenga un proceso
+LIMITE_TIEMPO_MUNICIPIO = 120
+METODO_DEGRADADO = "grid"
+
+# Techo de memoria de los procesos por defecto, como fracción de la memoria física
+FRACCION_MEMORIA_MAXIMA = 0.8
+# Por debajo de esta fracción del techo se vuelven a aumentar las tareas simultáneas
+FRACCION_MEMORIA_REANUDAR = 0.85
+# Tareas tras las que se recicla cada proceso (None: sin reciclar). Cada tarea de voronoi_global
+# es una comunidad entera, que deja mucha memoria fragmentada; los lotes de municipios, poca
+TAREAS_POR_PROCESO_MUNICIPIOS = None
+TAREAS_POR_PROCESO_COMUNIDADES = 1
+
+# Espacio de nombres de los ids deterministas de las zonas (uuid5)
+ESPACIO_IDS_ZONAS = uuid.uuid5(uuid.NAMESPACE_URL, "generador-de-distritos/zonas")
+
+def seleccionar_municipios_comunidad(gdf_ccaa, gdf_municipios, codigo_ccaa):
+    """
+    Localiza una comunidad autónoma y los municipios que le pertenecen
+    
+    Args:
+        gdf_ccaa: GeoDataFrame con todas las comunidades autónomas
+        gdf_municipios: GeoDataFrame con todos los municipios
+        codigo_ccaa: Código de la comunidad autónoma
+    
+    Returns:
+        Tupla (ccaa, nombre_ccaa, municipios_ccaa), o (None, None, None) si no existe la comunidad
+    """
+    # Filtrar la comunidad autónoma
+    ccaa = gdf_ccaa[gdf_ccaa['NATCODE'] == codigo_ccaa]
+    
+    if ccaa.empty:
+        return None, None, None
+    
+    nombre_ccaa = ccaa.iloc[0]['NAMEUNIT']
+    
+    # Aplicar traducción si existe
+    nombre_ccaa = TRADUCCIONES_CCAA.get(nombre_ccaa, nombre_ccaa)
+    
+    # Los municipios ya llevan su comunidad si se asignaron al cargarlos (ver main); si no, se asignan ahora
+    if 'CODIGO_CCAA' not in gdf_municipios.columns:
+        gdf_municipios = asignar_comunidades(gdf_municipios, calcular_asignacion(gdf_ccaa, gdf_municipios))
+    municipios_ccaa = gdf_municipios[gdf_municipios['CODIGO_CCAA'].to_numpy() == codigo_ccaa]
+    
+    return ccaa, nombre_ccaa, municipios_ccaa
+
+def dividir_municipio(nombre_municipio, geometria, metodo_division="voronoi", metodo_muestreo="rechazo",
+                      motor_voronoi="scipy", iteraciones_lloyd=None, metodo_relajacion="lloyd",
+                      semilla=None, natcode=None):
+    """
+    Divide un municipio en zonas con el método indicado
+    
+    Args:
+        nombre_municipio: Nombre del municipio, usado para nombrar las zonas
+        geometria: Polígono o MultiPolígono del municipio
+        metodo_division: Método de división ('voronoi', 'biseccion', 'hex' o 'grid')
+        metodo_muestreo: Generación de semillas de Voronoi ('rechazo' o 'triangulacion')
+        motor_voronoi: Motor de cálculo del diagrama de Voronoi ('scipy' o 'geos')
+        iteraciones_lloyd: Máximo de iteraciones de relajación (None para el valor por defecto)
+        metodo_relajacion: Relajación de las semillas de Voronoi ('lloyd' o 'cvt')
+        semilla: Semilla global (None para no fijarla)
+        natcode: NATCODE del municipio, del que se deriva su generador aleatorio
+            junto con la semilla (si no se indica, se usa el nombre)
+    
+    Returns:
+        Lista de tuplas (nombre_distrito, geometria_distrito)
+    """
+    # Un generador propio por municipio: el resultado no depende del proceso ni del orden
+    rng = None
+    if semilla is not None:
+        rng = crear_generador(semilla, natcode if natcode is not None else nombre_municipio)
+    
+    def dividir(poligono, num_divisiones):
+        if metodo_division == "voronoi":
+            return dividir_poligono_voronoi(poligono, num_divisiones, metodo_muestreo, motor_voronoi,
+                                            iteraciones_lloyd, None, metodo_relajacion, rng)
+        elif metodo_division == "biseccion":
+            return dividir_poligono_biseccion(poligono, num_divisiones)
+        elif metodo_division == "hex":
+            return dividir_poligono_hexagonos(poligono, num_divisiones)
+        return dividir_poligono_grid(poligono, num_divisiones)
+    
+    # Determinar número de distritos
+    num_distritos = calcular_num_zonas(geometria)
+    
+    # Lista para almacenar los distritos generados
+    distritos = []
+    
+    # Manejar MultiPolygon vs Polygon
+    if isinstance(geometria, MultiPolygon):
+        for i, poligono in enumerate(geometria.geoms):
+            # Determinar número de distritos para este polígono basado en su área relativa
+            num_distritos_poligono = max(1, int(num_distritos * (poligono.area / geometria.area)))
+            
+            # Añadir identificador a cada distrito - cambiando "Parte" por "Distrito"
+            for j, distrito in enumerate(dividir(poligono, num_distritos_poligono)):
+                distritos.append((f"{nombre_municipio} - Distrito {i+1} - Zona {j+1}", distrito))
+    else:
+        # Añadir identificador a cada distrito
+        for j, distrito in enumerate(dividir(geometria, num_distritos)):
+            distritos.append((f"{nombre_municipio} - Zona {j+1}", distrito))
+    
+    return distritos
+
+def _alarma_tiempo_agotado(signum, frame):
+    """
+    Manejador de SIGALRM: interrumpe la división en curso si sigue teniendo límite
+    """
+    if LIMITE_TIEMPO["fin"] is not None:
+        raise TiempoAgotado()
+
+def _quitar_limite_tiempo(usar_alarma, manejador_anterior):
+    """
+    Quita el límite de tiempo (primero el del bucle, para que la alarma ya no interrumpa) y la alarma
+    """
+    fijar_limite_tiempo(None)
+    if usar_alarma:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, manejador_anterior)
+
+def dividir_municipio_con_limite(nombre_municipio, geometria, limite_tiempo=LIMITE_TIEMPO_MUNICIPIO, **opciones):
+    """
+    Divide un municipio con dividir_municipio sin dejar que supere un límite de tiempo
+    
+    El límite se comprueba en los bucles de muestreo, relajación y bisección y, donde
+    el sistema lo permite (SIGALRM en Linux y macOS), una alarma interrumpe además
+    cualquier otro cálculo. Si se supera, el municipio se divide con METODO_DEGRADADO.
+    
+    Args:
+        nombre_municipio: Nombre del municipio
+        geometria: Polígono o MultiPolígono del municipio
+        limite_tiempo: Segundos disponibles (None o 0 para no limitar)
+        **opciones: Parámetros de dividir_municipio
+    
+    Returns:
+        Tupla (distritos, degradado): las zonas como en dividir_municipio e indicador
+        de que se superó el límite y se usó METODO_DEGRADADO
+    """
+    if not limite_tiempo or opciones.get("metodo_division", "voronoi") == METODO_DEGRADADO:
+        return dividir_municipio(nombre_municipio, geometria, **opciones), False
+    
+    # La alarma solo se puede usar desde el hilo principal y no existe en Windows
+    usar_alarma = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    manejador_anterior = None
+    try:
+        fijar_limite_tiempo(limite_tiempo)
+        if usar_alarma:
+            manejador_anterior = signal.signal(signal.SIGALRM, _alarma_tiempo_agotado)
+            signal.setitimer(signal.ITIMER_REAL, limite_tiempo)
+        try:
+            return dividir_municipio(nombre_municipio, geometria, **opciones), False
+        finally:
+            _quitar_limite_tiempo(usar_alarma, manejador_anterior)
+    except TiempoAgotado:
+        # La alarma pudo saltar justo antes de quitarla: asegurarse de que no queda activa
+        _quitar_limite_tiempo(usar_alarma, manejador_anterior)
+    
+    print(f"Advertencia: {nombre_municipio} superó el límite de {limite_tiempo} s. Se divide con {METODO_DEGRADADO}.")
+    return dividir_municipio(nombre_municipio, geometria, metodo_division=METODO_DEGRADADO), True
+
+def mostrar_municipios_degradados(degradados, limite_tiempo):
+    """
+    Muestra los municipios que superaron el límite de tiempo y se dividieron con METODO_DEGRADADO
+    
+    Args:
+        degradados: Lista con la descripción de cada municipio
+        limite_tiempo: Límite de tiempo por municipio, en segundos
+    """
+    if degradados:
+        print(f"ADVERTENCIA: {len(degradados)} municipios superaron el límite de {limite_tiempo} s y se dividieron "
+              f"con {METODO_DEGRADADO} (no se guardan en la caché ni en la tabla de huellas): {', '.join(degradados)}")
+
+def parametros_particion(opciones, num_zonas):
+    """
+    Parámetros que determinan la partición de un municipio, para la clave de la caché
+    
+    Args:
+        opciones: dict con los parámetros de división de dividir_municipio
+        num_zonas: Número de zonas objetivo del municipio
+    
+    Returns:
+        dict con el método, el número de zonas y, en Voronoi, las opciones de muestreo y
+        relajación y la semilla
+    """
+    metodo_division = opciones.get("metodo_division", "voronoi")
+    parametros = {"metodo_division": metodo_division, "num_zonas": num_zonas}
+    if metodo_division == "voronoi":
+        # Se guardan las iteraciones efectivas: sin iteraciones explícitas dependen de si se usa
+        # GPU (como en dividir_poligono_voronoi); con las mismas, la CPU y la GPU dan las mismas semillas
+        metodo_relajacion = opciones.get("metodo_relajacion", "lloyd")
+        iteraciones_lloyd = opciones.get("iteraciones_lloyd")
+        if iteraciones_lloyd is None:
+            if metodo_relajacion == "cvt":
+                iteraciones_lloyd = ITERACIONES_CVT
+            else:
+                iteraciones_lloyd = 5 if gpu_disponible and gpu_utils_importado else 0
+        parametros.update({
+            "metodo_muestreo": opciones.get("metodo_muestreo", "rechazo"),
+            "motor_voronoi": opciones.get("motor_voronoi", "scipy"),
+            "iteraciones_lloyd": iteraciones_lloyd,
+            "metodo_relajacion": metodo_relajacion,
+            "semilla": opciones.get("semilla")
+        })
+    return parametros
+
+def leer_municipio_cache(cache, clave, nombre_municipio):
+    """
+    Recupera de la caché las zonas de un municipio
+    
+    Args:
+        cache: Caché de particiones devuelta por abrir_cache
+        clave: Clave de la partición (clave_particion)
+        nombre_municipio: Nombre del municipio, para nombrar las zonas
+    
+    Returns:
+        Lista de tuplas (nombre_distrito, geometria_distrito), o None si no está en la caché
+    """
+    zonas = leer_particion(cache, clave)
+    if zonas is None:
+        return None
+    return [(f"{nombre_municipio} - {sufijo}", geometria) for sufijo, geometria in zonas]
+
+def guardar_municipio_cache(cache, clave, nombre_municipio, distritos):
+    """
+    Guarda en la caché las zonas de un municipio (sin el nombre del municipio, que no forma parte de la clave)
+    
+    Args:
+        cache: Caché de particiones devuelta por abrir_cache
+        clave: Clave de la partición (clave_particion)
+        nombre_municipio: Nombre del municipio
+        distritos: Lista de tuplas (nombre_distrito, geometria_distrito) de dividir_municipio
+    """
+    prefijo = f"{nombre_municipio} - "
+    guardar_particion(cache, clave, [(nombre[len(prefijo):], geometria) for nombre, geometria in distritos])
+
+def prefijo_ids_zonas(semilla, natcode):
+    """
+    Prefijo de los ids deterministas de las zonas de un municipio
+    
+    Args:
+        semilla: Semilla global (None si no se fijó)
+        natcode: NATCODE del municipio
+    
+    Returns:
+        Cadena para crear_features_zonas, o None para ids aleatorios
+    """
+    if semilla is None:
+        return None
+    return f"{semilla}/{natcode}"
+
+def crear_features_zonas(distritos, prefijo_ids=None):
+    """
+    Crea los features GeoJSON de una lista de zonas
+    
+    Args:
+        distritos: Lista de tuplas (nombre_distrito, geometria_distrito)
+        prefijo_ids: Prefijo de prefijo_ids_zonas para que los ids sean siempre los
+            mismos (uuid5 del prefijo y la posición de la zona); None para ids aleatorios
+    
+    Returns:
+        Lista de features GeoJSON
+    """
+    features = []
+    for j, (nombre_distrito, geometria_distrito) in enumerate(distritos):
+        if prefijo_ids is None:
+            id_zona = uuid.uuid4()
+        else:
+            id_zona = uuid.uuid5(ESPACIO_IDS_ZONAS, f"{prefijo_ids}/{j}")
+        
+        # Crear un feature GeoJSON
+        feature = {
+            "type": "Feature",
+            "properties": {
+                "id": str(id_zona),
+                "name": nombre_distrito,
+                "description": "",
+                "isUnlocked": False
+            },
+            "geometry": mapping(geometria_distrito)
+        }
+        
+        # Añadir el feature a la colección
+        features.append(feature)
+    
+    return features
+
+def crear_geojson_zonas(nombre_ccaa, distritos=None, features=None):
+    """
+    Construye el FeatureCollection de las zonas de una comunidad autónoma
+    
+    Args:
+        nombre_ccaa: Nombre de la comunidad autónoma
+        distritos: Lista de tuplas (nombre_distrito, geometria_distrito)
+        features: Features ya creados, que se añaden antes de los de distritos
+    
+    Returns:
+        dict con la estructura del GeoJSON
+    """
+    geojson_data = {
+        "type": "FeatureCollection",
+        "region_name": nombre_ccaa,
+        "features": list(features or []) + crear_features_zonas(distritos or [])
+    }
+    
+    return geojson_data
+
+def sanitizar_nombre_archivo(nombre):
+    """
+    Sanitiza un nombre para usarlo como nombre de archivo, eliminando tildes y otros caracteres especiales
+    
+    Args:
+        nombre: Nombre original
+    
+    Returns:
+        Nombre en minúsculas con solo caracteres a-z, 0-9 y guiones bajos
+    """
+    # Convertir a minúsculas
+    nombre = nombre.lower()
+    
+    # Normalizar (descomponer caracteres acentuados)
+    nombre = unicodedata.normalize('NFKD', nombre)
+    
+    # Eliminar acentos y caracteres no ASCII
+    nombre = ''.join([c for c in nombre if not unicodedata.combining(c)])
+    
+    # Reemplazar espacios y caracteres no alfanuméricos por guiones bajos
+    nombre = re.sub(r'[^a-z0-9]', '_', nombre)
+    
+    # Eliminar guiones bajos múltiples
+    nombre = re.sub(r'_+', '_', nombre)
+    
+    # Eliminar guiones bajos al principio y al final
+    nombre = nombre.strip('_')
+    
+    return nombre
+
+def ruta_geojson_comunidad(codigo_ccaa, nombre_ccaa, output_dir):
+    """
+    Ruta del GeoJSON de zonas de una comunidad autónoma
+    
+    Args:
+        codigo_ccaa: Código de la comunidad autónoma
+        nombre_ccaa: Nombre de la comunidad autónoma
+        output_dir: Directorio de los archivos GeoJSON
+    
+    Returns:
+        Ruta {output_dir}/{codigo_ccaa}_{nombre sanitizado}.geojson
+    """
+    return os.path.join(output_dir, f"{codigo_ccaa}_{sanitizar_nombre_archivo(nombre_ccaa)}.geojson")
+
+def guardar_geojson_comunidad(geojson_data, codigo_ccaa, nombre_ccaa, output_dir):
+    """
+    Guarda el GeoJSON de zonas de una comunidad autónoma
+    
+    Args:
+        geojson_data: dict con el FeatureCollection
+        codigo_ccaa: Código de la comunidad autónoma
+        nombre_ccaa: Nombre de la comunidad autónoma
+        output_dir: Directorio donde se guardará el archivo
+    
+    Returns:
+        Ruta del archivo GeoJSON
+    """
+    # Guardar el GeoJSON
+    output_geojson = ruta_geojson_comunidad(codigo_ccaa, nombre_ccaa, output_dir)
+    print(f"Guardando GeoJSON en: {output_geojson}")
+    
+    try:
+        with open(output_geojson, 'w', encoding='utf-8') as f:
+            json.dump(geojson_data, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Error al guardar el archivo GeoJSON: {e}")
+        traceback.print_exc()  # Imprimir el traceback completo
+        # Intentar guardar con una versión reducida (sin indent)
+        try:
+            print("Intentando guardar versión sin formato...")
+            with open(output_geojson, 'w', encoding='utf-8') as f:
+                json.dump(geojson_data, f, ensure_ascii=False)
+            print("Archivo guardado sin formato (sin indentación).")
+        except Exception as e2:
+            print(f"Error al guardar versión sin formato: {e2}")
+    
+    print(f"Archivo GeoJSON creado exitosamente. Contiene {len(geojson_data['features'])} zonas.")
+    return output_geojson
+
+def mostrar_estadisticas(estadisticas):
+    """
+    Muestra los contadores de recortes de celdas y relajaciones de una comunidad
+    
+    Args:
+        estadisticas: dict devuelto por obtener_estadisticas (o la suma de varios)
+    """
+    if estadisticas.get("celdas", 0) > 0:
+        porcentaje = 100 * estadisticas["recortes_evitados"] / estadisticas["celdas"]
+        print(f"Recortes evitados: {estadisticas['recortes_evitados']} de {estadisticas['celdas']} "
+              f"celdas de Voronoi ({porcentaje:.1f}%) estaban completamente dentro de su municipio.")
+    if estadisticas.get("relajaciones", 0) > 0:
+        media = estadisticas["iteraciones_lloyd"] / estadisticas["relajaciones"]
+        print(f"Relajación de Lloyd: {estadisticas['relajaciones']} ejecuciones, {media:.1f} iteraciones de media.")
+    if estadisticas.get("relajaciones_cvt", 0) > 0:
+        media = estadisticas["iteraciones_cvt"] / estadisticas["relajaciones_cvt"]
+        print(f"Relajación CVT: {estadisticas['relajaciones_cvt']} ejecuciones, {media:.1f} iteraciones de media.")
+
+def dibujar_zonas(ax, distritos):
+    """
+    Dibuja las zonas en unos ejes de matplotlib
+    
+    Las zonas partidas (MultiPolygon, en 'voronoi_global' y 'biseccion') se dibujan parte a parte.
+    
+    Args:
+        ax: Ejes de matplotlib
+        distritos: Lista de tuplas (nombre_distrito, geometria_distrito)
+    """
+    for _, geometria_distrito in distritos:
+        for parte in shapely.get_parts(geometria_distrito):
+            x, y = parte.exterior.xy
+            ax.fill(x, y, alpha=0.5)
+
+def procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, codigo_ccaa, output_dir, metodo_division="voronoi", visualizar=False,
+                                metodo_muestreo="rechazo", motor_voronoi="scipy", iteraciones_lloyd=None,
+                                metodo_relajacion="lloyd", cache=None, semilla=None,
+                                limite_tiempo=LIMITE_TIEMPO_MUNICIPIO, huellas=None):
     """
     Procesa una comunidad autónoma, dividiendo sus municipios en distritos más pequeños
     
+    Con una tabla de huellas, anota en ella la comunidad como el reparto por municipios
+    (ver procesar_comunidades_por_municipio), para que el modo incremental compare
+    con lo que realmente contiene el GeoJSON escrito.
+    
     Args:
         gdf_ccaa: GeoDataFrame con todas las comunidades autónomas
         gdf_municipios: GeoDataFrame con todos los municipios
         codigo_ccaa: Código de la comunidad autónoma a procesar
         output_dir: Directorio donde se guardarán los archivos GeoJSON
-        metodo_division: Método de división de polígonos ('voronoi' o 'grid')
+        metodo_division: Método de división de polígonos ('voronoi', 'voronoi_global', 'biseccion', 'hex' o 'grid')
         visualizar: Si se debe visualizar el resultado con matplotlib
+        metodo_muestreo: Generación de semillas de Voronoi ('rechazo' o 'triangulacion')
+        motor_voronoi: Motor de cálculo del diagrama de Voronoi ('scipy' o 'geos')
+        iteraciones_lloyd: Máximo de iteraciones de relajación (None para el valor por defecto)
+        metodo_relajacion: Relajación de las semillas de Voronoi ('lloyd' o 'cvt')
+        cache: Caché de particiones devuelta por abrir_cache (None para no usarla; no aplica a 'voronoi_global')
+        semilla: Semilla global de la que se derivan los generadores aleatorios y los ids
+            de las zonas de cada municipio (None para no fijarla)
+        limite_tiempo: Segundos máximos por municipio antes de dividirlo con METODO_DEGRADADO
+            (None para no limitar; no aplica a 'voronoi_global')
+        huellas: Tabla de huellas (ver cargar_huellas) que se actualiza con esta comunidad
+            (None para no anotarla)
+    
+    Returns:
+        Ruta del GeoJSON generado (None si hubo un error)
     """
     try:
-        # Filtrar la comunidad autónoma
-        ccaa = gdf_ccaa[gdf_ccaa['NATCODE'] == codigo_ccaa]
+        ccaa, nombre_ccaa, municipios_ccaa = seleccionar_municipios_comunidad(gdf_ccaa, gdf_municipios, codigo_ccaa)
         
-        if ccaa.empty:
+        if ccaa is None:
             print(f"No se encontró la comunidad autónoma con código {codigo_ccaa}")
             return
         
-        nombre_ccaa = ccaa.iloc[0]['NAMEUNIT']
-        
-        # Traducciones de nombres de comunidades autónomas de catalán a español
-        traducciones = {
-            "Illes Balears": "Islas Baleares",
-            "Catalunya": "Cataluña",
-            "Euskadi": "País Vasco",
-            "Comunitat Valenciana": "Comunidad Valenciana",
-            "Galicia/Galiza": "Galicia"
-        }
-        
-        # Aplicar traducción si existe
-        if nombre_ccaa in traducciones:
-            nombre_ccaa = traducciones[nombre_ccaa]
-        
         print(f"\nProcesando comunidad autónoma: {nombre_ccaa} (código {codigo_ccaa})")
         
-        # Filtrar municipios de esta comunidad autónoma correctamente
-        # Extraer el código de la comunidad autónoma del NATCODE (los primeros 2 dígitos)
-        codigo_ccaa_prefijo = codigo_ccaa[:2]
-        
-        # Obtener la geometría de la comunidad autónoma para filtrar espacialmente
-        geometria_ccaa = ccaa.geometry.iloc[0]
-        
-        # Filtrar los municipios que están dentro de la comunidad autónoma espacialmente
-        # y que tienen el prefijo correcto en su NATCODE
-        municipios_dentro = gdf_municipios[gdf_municipios.intersects(geometria_ccaa)]
-        municipios_ccaa = municipios_dentro[municipios_dentro['NATCODE'].str.startswith(codigo_ccaa_prefijo)]
-        
         if municipios_ccaa.empty:
             print(f"No se encontraron municipios para la comunidad autónoma {nombre_ccaa}")
             return
         
         print(f"Encontrados {len(municipios_ccaa)} municipios en {nombre_ccaa}")
         
-        # Crear la estructura del GeoJSON
-        geojson_data = {
-            "type": "FeatureCollection",
-            "region_name": nombre_ccaa,
-            "features": []
-        }
+        # Contadores de recortes de celdas y relajaciones de Lloyd para esta comunidad
+        reiniciar_estadisticas()
         
-        # Para visualización
-        if visualizar:
-            fig, ax = plt.subplots(figsize=(15, 15))
-            ccaa.plot(ax=ax, color='none', edgecolor='black', linewidth=2)
+        # En modo Voronoi global se calcula un único diagrama para toda la comunidad
+        zonas_globales = {}
+        if metodo_division == "voronoi_global":
+            print(f"Calculando teselación de Voronoi única para {len(municipios_ccaa)} municipios...")
+            num_zonas = [calcular_num_zonas(geometria) for geometria in municipios_ccaa.geometry]
+            rng = None if semilla is None else crear_generador(semilla, codigo_ccaa)
+            zonas = poligonos_voronoi_global(list(municipios_ccaa.geometry), num_zonas, rng)
+            zonas_globales = dict(zip(municipios_ccaa.index, zonas))
+        
+        opciones = {
+            "metodo_division": metodo_division,
+            "metodo_muestreo": metodo_muestreo,
+            "motor_voronoi": motor_voronoi,
+            "iteraciones_lloyd": iteraciones_lloyd,
+            "metodo_relajacion": metodo_relajacion,
+            "semilla": semilla,
+            "limite_tiempo": limite_tiempo
+        }
         
         # Procesar cada municipio
-        total_distritos = 0
+        distritos = []
+        features = []
+        degradados = []
+        municipios_huellas = {}
         with tqdm(total=len(municipios_ccaa), desc=f"Procesando municipios de {nombre_ccaa}") as pbar:
             for idx, municipio in municipios_ccaa.iterrows():
                 try:
                     # Extraer nombre y geometría del municipio
                     nombre_municipio = municipio['NAMEUNIT']
+                    natcode = municipio['NATCODE']
+                    degradado = False
                     
-                    # Traducir nombres de municipios si están en catalán u otros idiomas
-                    # Aquí se podrían añadir más traducciones si fuera necesario
-                    
-                    geometria = municipio.geometry
-                    
-                    # Calcular área en km²
-                    area_km2 = geometria.area * 111 * 111  # Conversión aproximada de grados a km²
-                    
-                    # Determinar número de distritos
-                    num_distritos = determinar_numero_distritos(area_km2)
-                    
-                    # Lista para almacenar los distritos generados
-                    distritos = []
-                    
-                    # Manejar MultiPolygon vs Polygon
-                    if isinstance(geometria, MultiPolygon):
-                        for i, poligono in enumerate(geometria.geoms):
-                            # Determinar número de distritos para este polígono basado en su área relativa
-                            area_poligono = poligono.area
-                            area_total = geometria.area
-                            num_distritos_poligono = max(1, int(num_distritos * (area_poligono / area_total)))
-                            
-                            if metodo_division == "voronoi":
-                                distritos_poligono = dividir_poligono_voronoi(poligono, num_distritos_poligono)
-                            else:
-                                distritos_poligono = dividir_poligono_grid(poligono, num_distritos_poligono)
-                            
-                            # Añadir identificador a cada distrito - cambiando "Parte" por "Distrito"
-                            for j, distrito in enumerate(distritos_poligono):
-                                distritos.append((f"{nombre_municipio} - Distrito {i+1} - Zona {j+1}", distrito))
+                    if metodo_division == "voronoi_global":
+                        # Zonas ya calculadas con la teselación de toda la comunidad
+                        distritos_municipio = [(f"{nombre_municipio} - Zona {j+1}", distrito)
+                                               for j, distrito in enumerate(zonas_globales[idx])]
+                    elif cache is None:
+                        distritos_municipio, degradado = dividir_municipio_con_limite(nombre_municipio, municipio.geometry,
+                                                                                      natcode=natcode, **opciones)
                     else:
-                        if metodo_division == "voronoi":
-                            distritos_poligono = dividir_poligono_voronoi(geometria, num_distritos)
-                        else:
-                            distritos_poligono = dividir_poligono_grid(geometria, num_distritos)
-                        
-                        # Añadir identificador a cada distrito
-                        for j, distrito in enumerate(distritos_poligono):
-                            distritos.append((f"{nombre_municipio} - Zona {j+1}", distrito))
+                        # Reutilizar la partición de la caché o calcularla y guardarla
+                        parametros = parametros_particion(opciones, calcular_num_zonas(municipio.geometry))
+                        clave = clave_particion(municipio.geometry, parametros)
+                        distritos_municipio = leer_municipio_cache(cache, clave, nombre_municipio)
+                        if distritos_municipio is None:
+                            distritos_municipio, degradado = dividir_municipio_con_limite(nombre_municipio, municipio.geometry,
+                                                                                          natcode=natcode, **opciones)
+                            # Un municipio degradado se vuelve a intentar con el método pedido la próxima vez
+                            if not degradado and distritos_municipio:
+                                guardar_municipio_cache(cache, clave, nombre_municipio, distritos_municipio)
+                    if degradado:
+                        degradados.append(f"{nombre_municipio} ({natcode})")
+                    distritos.extend(distritos_municipio)
+                    features_municipio = crear_features_zonas(distritos_municipio, prefijo_ids_zonas(semilla, natcode))
+                    features.extend(features_municipio)
                     
-                    # Añadir distritos al GeoJSON
-                    for nombre_distrito, geometria_distrito in distritos:
-                        # Crear un feature GeoJSON
-                        feature = {
-                            "type": "Feature",
-                            "properties": {
-                                "id": str(uuid.uuid4()),
-                                "name": nombre_distrito,
-                                "description": "",
-                                "isUnlocked": False
-                            },
-                            "geometry": mapping(geometria_distrito)
+                    # Los degradados y los que no tienen zonas no se anotan, para que se recalculen
+                    if huellas is not None and not degradado and features_municipio:
+                        municipios_huellas[natcode] = {
+                            "huella": huella_geometria(municipio.geometry),
+                            "ids": [feature["properties"]["id"] for feature in features_municipio]
                         }
-                        
-                        # Añadir el feature a la colección
-                        geojson_data["features"].append(feature)
-                        
-                        # Para visualización
-                        if visualizar:
-                            x, y = geometria_distrito.exterior.xy
-                            ax.fill(x, y, alpha=0.5)
-                    
-                    total_distritos += len(distritos)
-                    pbar.update(1)
                 except Exception as e:
                     print(f"Error al procesar municipio {municipio['NAMEUNIT']}: {e}")
                     traceback.print_exc()  # Imprimir el traceback completo
-                    pbar.update(1)
-                    continue
+                pbar.update(1)
         
-        # Sanitizar el nombre de la comunidad autónoma para el nombre de archivo
-        # Eliminar tildes y otros caracteres especiales
-        def sanitizar_nombre_archivo(nombre):
-            # Convertir a minúsculas
-            nombre = nombre.lower()
-            
-            # Normalizar (descomponer caracteres acentuados)
-            nombre = unicodedata.normalize('NFKD', nombre)
-            
-            # Eliminar acentos y caracteres no ASCII
-            nombre = ''.join([c for c in nombre if not unicodedata.combining(c)])
-            
-            # Reemplazar espacios y caracteres no alfanuméricos por guiones bajos
-            nombre = re.sub(r'[^a-z0-9]', '_', nombre)
-            
-            # Eliminar guiones bajos múltiples
-            nombre = re.sub(r'_+', '_', nombre)
-            
-            # Eliminar guiones bajos al principio y al final
-            nombre = nombre.strip('_')
-            
-            return nombre
+        # Crear y guardar el GeoJSON
+        geojson_data = crear_geojson_zonas(nombre_ccaa, features=features)
+        output_geojson = guardar_geojson_comunidad(geojson_data, codigo_ccaa, nombre_ccaa, output_dir)
         
-        nombre_archivo = sanitizar_nombre_archivo(nombre_ccaa)
+        # La semilla también fija los ids de las zonas, así que forma parte de los parámetros
+        if huellas is not None:
+            huellas[codigo_ccaa] = {
+                "parametros": dict(parametros_particion(opciones, None), semilla=semilla),
+                "municipios": municipios_huellas
+            }
         
-        # Guardar el GeoJSON
-        filename = f"{codigo_ccaa}_{nombre_archivo}.geojson"
-        output_geojson = os.path.join(output_dir, filename)
-        print(f"Guardando GeoJSON en: {output_geojson}")
-        
-        try:
-            with open(output_geojson, 'w', encoding='utf-8') as f:
-                json.dump(geojson_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error al guardar el archivo GeoJSON: {e}")
-            traceback.print_exc()  # Imprimir el traceback completo
-            # Intentar guardar con una versión reducida (sin indent)
-            try:
-                print("Intentando guardar versión sin formato...")
-                with open(output_geojson, 'w', encoding='utf-8') as f:
-                    json.dump(geojson_data, f, ensure_ascii=False)
-                print("Archivo guardado sin formato (sin indentación).")
-            except Exception as e2:
-                print(f"Error al guardar versión sin formato: {e2}")
-        
-        print(f"Archivo GeoJSON creado exitosamente. Contiene {total_distritos} zonas.")
+        mostrar_estadisticas(obtener_estadisticas())
+        mostrar_municipios_degradados(degradados, limite_tiempo)
         
         # Mostrar visualización
         if visualizar:
+            fig, ax = plt.subplots(figsize=(15, 15))
+            ccaa.plot(ax=ax, color='none', edgecolor='black', linewidth=2)
+            dibujar_zonas(ax, distritos)
             plt.title(f"Zonas de {nombre_ccaa}")
-            plt.savefig(os.path.join(output_dir, f"{codigo_ccaa}_{nombre_archivo}.png"))
+            plt.savefig(os.path.splitext(output_geojson)[0] + ".png")
             plt.close()
         
         return output_geojson
@@ -674,17 +1189,595 @@ def visualizar_geojson_distritos(geojson_file):
 # FUNCIONES PARA PROCESAMIENTO PARALELO
 # ----------------------------------------
 
+# Datos que cada proceso trabajador recibe una sola vez al arrancar, en lugar de en cada tarea
+_DATOS_TRABAJADOR = {}
+
+def inicializar_trabajador_comunidades(gdf_ccaa, gdf_municipios):
+    """
+    Inicializador del pool por comunidades: guarda los GeoDataFrames en el proceso trabajador
+    
+    Args:
+        gdf_ccaa: GeoDataFrame con todas las comunidades autónomas
+        gdf_municipios: GeoDataFrame con todos los municipios
+    """
+    _DATOS_TRABAJADOR["gdf_ccaa"] = gdf_ccaa
+    _DATOS_TRABAJADOR["gdf_municipios"] = gdf_municipios
+
+def cargar_modulo_gpu(nombre_modulo):
+    """
+    Importa un backend de GPU y lo usa en la división (ver dividir_poligono_voronoi)
+    
+    Args:
+        nombre_modulo: MODULO_GPU (CuPy) o MODULO_GPU_SIMULADO (NumPy, para probar sin GPU)
+    """
+    global verificar_gpu_disponible, mejorar_puntos_aleatorios_gpu, gpu_utils_importado
+    modulo = importlib.import_module(nombre_modulo)
+    verificar_gpu_disponible = modulo.verificar_gpu_disponible
+    mejorar_puntos_aleatorios_gpu = modulo.mejorar_puntos_aleatorios_gpu
+    gpu_utils_importado = True
+
+def inicializar_trabajador_municipios(natcodes, nombres, geometrias_wkb, opciones):
+    """
+    Inicializador del pool por municipios: guarda las geometrías en WKB una vez por proceso
+    
+    Args:
+        natcodes: Lista con los NATCODE de los municipios
+        nombres: Lista con los nombres de los municipios, en el mismo orden
+        geometrias_wkb: Array de geometrías en WKB, en el mismo orden que nombres
+        opciones: dict con los parámetros de dividir_municipio_con_limite
+    """
+    global gpu_disponible
+    # Los procesos de CPU nunca usan la GPU: el contexto CUDA del proceso principal no sobrevive a fork
+    gpu_disponible = False
+    _DATOS_TRABAJADOR["natcodes"] = natcodes
+    _DATOS_TRABAJADOR["nombres"] = nombres
+    _DATOS_TRABAJADOR["geometrias_wkb"] = geometrias_wkb
+    _DATOS_TRABAJADOR["opciones"] = opciones
+
+def inicializar_trabajador_gpu(modulo_gpu, natcodes, nombres, geometrias_wkb, opciones):
+    """
+    Inicializador del proceso de GPU del reparto híbrido: carga el backend de GPU y los datos
+    
+    Args:
+        modulo_gpu: Nombre del backend de GPU (ver cargar_modulo_gpu)
+        natcodes, nombres, geometrias_wkb, opciones: Como en inicializar_trabajador_municipios
+    """
+    global gpu_disponible
+    inicializar_trabajador_municipios(natcodes, nombres, geometrias_wkb, opciones)
+    try:
+        cargar_modulo_gpu(modulo_gpu)
+        gpu_disponible, info = verificar_gpu_disponible()
+    except Exception as e:
+        print(f"Error al cargar {modulo_gpu} en el proceso de GPU: {e}")
+        gpu_disponible = False
+    
+    if gpu_disponible:
+        print(f"Proceso de GPU: {info['nombre']}")
+    else:
+        print("ADVERTENCIA: El proceso de GPU no encontró la GPU. Sus municipios se dividirán en CPU.")
+
 def procesar_comunidad_autonoma_wrapper(args):
     """
     Wrapper para la función procesar_comunidad_autonoma para poder usarla en ProcessPoolExecutor
     
+    Los GeoDataFrames se toman del inicializador del proceso (inicializar_trabajador_comunidades)
+    
     Args:
-        args: Tupla con los argumentos para procesar_comunidad_autonoma
+        args: Tupla con los argumentos de procesar_comunidad_autonoma a partir de codigo_ccaa
     
     Returns:
-        Resultado de procesar_comunidad_autonoma
+        Tupla (ruta del GeoJSON, dict con la entrada de la comunidad en la tabla de huellas,
+        vacío si no se pudo procesar)
     """
-    return procesar_comunidad_autonoma(*args)
+    huellas = {}
+    geojson_file = procesar_comunidad_autonoma(_DATOS_TRABAJADOR["gdf_ccaa"], _DATOS_TRABAJADOR["gdf_municipios"], *args,
+                                               huellas=huellas)
+    return geojson_file, huellas
+
+def procesar_lote_municipios(lote):
+    """
+    Divide un lote de municipios en zonas
+    
+    Las geometrías y opciones se toman del inicializador del proceso (inicializar_trabajador_municipios)
+    
+    Args:
+        lote: Lista de tuplas (codigo_ccaa, posicion, indice_municipio)
+    
+    Returns:
+        Tupla (resultados, inicio), donde resultados es una lista de tuplas
+        (codigo_ccaa, posicion, distritos, duracion, estadisticas, degradado, fallido) por
+        municipio (fallido indica que su división lanzó una excepción, y entonces duracion
+        es None) e inicio el instante en que el trabajador empezó el lote
+    """
+    inicio = time.time()
+    resultados = []
+    for codigo_ccaa, posicion, indice in lote:
+        nombre_municipio = _DATOS_TRABAJADOR["nombres"][indice]
+        inicio_municipio = time.perf_counter()
+        reiniciar_estadisticas()
+        fallido = False
+        try:
+            # Decodificar solo el municipio de la tarea evita duplicar toda España en cada proceso
+            geometria = shapely.from_wkb(_DATOS_TRABAJADOR["geometrias_wkb"][indice])
+            distritos, degradado = dividir_municipio_con_limite(nombre_municipio, geometria,
+                                                                natcode=_DATOS_TRABAJADOR["natcodes"][indice],
+                                                                **_DATOS_TRABAJADOR["opciones"])
+        except Exception as e:
+            print(f"Error al procesar municipio {nombre_municipio}: {e}")
+            traceback.print_exc()  # Imprimir el traceback completo
+            distritos = []
+            degradado = False
+            fallido = True
+        duracion = None if fallido else time.perf_counter() - inicio_municipio
+        resultados.append((codigo_ccaa, posicion, distritos, duracion, obtener_estadisticas(), degradado, fallido))
+    return resultados, inicio
+
+def memoria_maxima_mb():
+    """
+    Memoria residente máxima (RSS) del proceso principal y de sus procesos hijos ya terminados
+    
+    Returns:
+        Tupla (principal_mb, trabajadores_mb), o (None, None) si el sistema no lo permite
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss está en kB en Linux y en bytes en macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    principal = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    trabajadores = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    return principal, trabajadores
+
+def mostrar_rendimiento_despacho(latencias):
+    """
+    Muestra la latencia de despacho de las tareas y la memoria máxima de la ejecución
+    (la latencia es el tiempo entre el envío de una tarea y su inicio en un trabajador)
+    
+    Args:
+        latencias: Lista de segundos entre el envío de cada tarea y su inicio en un trabajador
+    """
+    if latencias:
+        # La mínima refleja el coste del envío en sí; la mediana y la máxima incluyen la espera en cola
+        latencias = sorted(latencias)
+        print(f"Latencia de despacho: mínima {1000 * latencias[0]:.1f} ms, mediana {1000 * latencias[len(latencias) // 2]:.1f} ms, "
+              f"máxima {1000 * latencias[-1]:.1f} ms ({len(latencias)} tareas)")
+    principal, trabajadores = memoria_maxima_mb()
+    if principal is not None:
+        print(f"Memoria máxima (RSS): proceso principal {principal:.0f} MB, trabajadores {trabajadores:.0f} MB")
+
+def memoria_fisica_mb():
+    """
+    Memoria física total del equipo
+    
+    Returns:
+        MB de memoria física, o None si el sistema no lo permite
+    """
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def memoria_proceso_mb(pid):
+    """
+    Memoria actual de un proceso (solo Linux)
+    
+    Se usa la PSS, que reparte entre los procesos las páginas que comparten tras fork
+    (las geometrías heredadas del proceso principal no se cuentan una vez por trabajador).
+    Si no está disponible, se usa la RSS.
+    
+    Args:
+        pid: Identificador del proceso
+    
+    Returns:
+        MB de memoria, o None si no se puede leer
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for linea in f:
+                if linea.startswith("Pss:"):
+                    return int(linea.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def memoria_pools_mb():
+    """
+    Memoria actual del proceso principal y de sus procesos hijos (los trabajadores de los pools)
+    
+    Returns:
+        MB de memoria, o None si no se puede medir
+    """
+    principal = memoria_proceso_mb(os.getpid())
+    if principal is None:
+        return None
+    # Un trabajador puede terminar entre que se lista y se lee: se ignora
+    trabajadores = [memoria_proceso_mb(proceso.pid) for proceso in multiprocessing.active_children()]
+    return principal + sum(memoria for memoria in trabajadores if memoria is not None)
+
+def crear_pool(num_workers, tareas_por_proceso=None, **opciones_pool):
+    """
+    Crea un pool de procesos que, opcionalmente, recicla cada proceso tras un número de tareas
+    
+    Reciclar los procesos devuelve al sistema la memoria fragmentada que acumulan. Como
+    max_tasks_per_child no admite fork, con reciclado los procesos se crean con forkserver
+    (o spawn) y los argumentos del inicializador se envían a cada proceso nuevo.
+    
+    Args:
+        num_workers: Número de procesos
+        tareas_por_proceso: Tareas tras las que se reemplaza cada proceso (None para no reciclar)
+        opciones_pool: Resto de argumentos de ProcessPoolExecutor (initializer, initargs...)
+    
+    Returns:
+        concurrent.futures.ProcessPoolExecutor
+    """
+    if tareas_por_proceso and sys.version_info < (3, 11):
+        print("ADVERTENCIA: Reciclar los procesos requiere Python 3.11 o superior. No se reciclarán.")
+        tareas_por_proceso = None
+    if not tareas_por_proceso:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, **opciones_pool)
+    
+    if "mp_context" not in opciones_pool:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            # El servidor importa una sola vez este módulo y sus dependencias (geopandas, shapely...),
+            # así que cada proceso nuevo arranca en milisegundos
+            opciones_pool["mp_context"] = multiprocessing.get_context("forkserver")
+            opciones_pool["mp_context"].set_forkserver_preload(["main"])
+        else:
+            opciones_pool["mp_context"] = multiprocessing.get_context("spawn")
+    return concurrent.futures.ProcessPoolExecutor(max_workers=num_workers, max_tasks_per_child=tareas_por_proceso,
+                                                  **opciones_pool)
+
+def ejecutar_con_limite_memoria(pools, funcion, memoria_maxima_mb=None):
+    """
+    Envía tareas a uno o varios pools sin superar un techo de memoria, y las devuelve según terminan
+    
+    Cada pool tiene como mucho una tarea en cola además de las que están ejecutando sus
+    procesos, de forma que el resto de tareas sigue en el proceso principal. Tras cada tarea
+    terminada se mide la memoria del proceso principal y de los trabajadores: por encima del
+    techo no se envían tareas nuevas (la concurrencia baja una tarea cada vez que termina
+    otra, hasta un mínimo de una por pool) y por debajo de FRACCION_MEMORIA_REANUDAR del
+    techo vuelve a subir de una en una.
+    
+    Args:
+        pools: Lista de tuplas (executor, tareas, num_workers), con las tareas en orden de envío
+        funcion: Función a ejecutar con cada tarea
+        memoria_maxima_mb: Techo de memoria en MB (None para no limitar)
+    
+    Yields:
+        Tuplas (tarea, future, envio) según terminan, con envio el instante en que se envió la tarea
+    """
+    carriles = [{"executor": executor, "cola": collections.deque(tareas), "en_vuelo": 0,
+                 "maximo": num_workers + 1, "limite": num_workers + 1}
+                for executor, tareas, num_workers in pools]
+    en_vuelo = {}
+    frenado = False
+    while True:
+        for carril in carriles:
+            while carril["cola"] and carril["en_vuelo"] < carril["limite"]:
+                tarea = carril["cola"].popleft()
+                en_vuelo[carril["executor"].submit(funcion, tarea)] = (carril, tarea, time.time())
+                carril["en_vuelo"] += 1
+        if not en_vuelo:
+            break
+        
+        terminados, _ = concurrent.futures.wait(en_vuelo, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in terminados:
+            carril, tarea, envio = en_vuelo.pop(future)
+            carril["en_vuelo"] -= 1
+            yield tarea, future, envio
+        
+        if memoria_maxima_mb is None or not any(carril["cola"] for carril in carriles):
+            continue
+        memoria = memoria_pools_mb()
+        if memoria is None:
+            continue
+        if memoria >= memoria_maxima_mb:
+            for carril in carriles:
+                carril["limite"] = max(1, carril["en_vuelo"])
+            if not frenado:
+                print(f"\nMemoria de los procesos: {memoria:.0f} MB (techo {memoria_maxima_mb:.0f} MB). "
+                      f"Se reduce el número de tareas simultáneas.")
+                frenado = True
+        elif memoria < FRACCION_MEMORIA_REANUDAR * memoria_maxima_mb:
+            for carril in carriles:
+                carril["limite"] = min(carril["maximo"], carril["limite"] + 1)
+            if frenado and all(carril["limite"] == carril["maximo"] for carril in carriles):
+                print(f"\nMemoria de los procesos: {memoria:.0f} MB. Se recupera el número de tareas simultáneas.")
+                frenado = False
+
+def procesar_comunidades_por_municipio(gdf_ccaa, gdf_municipios, codigos_ccaa, output_dir, num_workers, opciones,
+                                       tamano_lote=TAMANO_LOTE_MUNICIPIOS, cache=None, incremental=False, reanudar=False,
+                                       modulo_gpu=None, memoria_maxima_mb=None,
+                                       tareas_por_proceso=TAREAS_POR_PROCESO_MUNICIPIOS):
+    """
+    Procesa varias comunidades autónomas repartiendo el trabajo por lotes de municipios
+    
+    Los lotes de todas las comunidades comparten el mismo pool de procesos, de modo que
+    una comunidad grande no deja al resto de procesos ociosos al final de la ejecución.
+    Los lotes se forman y envían por coste estimado decreciente (LPT, ver planificador.py)
+    y el tiempo real de cada municipio se anota junto a su estimación en el registro de tiempos.
+    Los municipios presentes en la caché de particiones no llegan a enviarse al pool.
+    El GeoJSON de cada comunidad se escribe en cuanto terminan todos sus municipios.
+    
+    Cada ejecución actualiza en output_dir la tabla de huellas (NATCODE -> hash de la
+    geometría e ids de sus zonas). En modo incremental, los municipios cuya geometría no
+    ha cambiado conservan tal cual sus zonas del GeoJSON anterior y las comunidades sin
+    ningún cambio no se reescriben.
+    
+    Con una semilla en opciones, cada municipio usa su propio generador aleatorio y sus
+    zonas reciben ids deterministas, así que el resultado es idéntico sea cual sea el
+    número de procesos o el orden en que se completen los lotes.
+    
+    Cada municipio calculado se anota en el diario de output_dir (ver diario.py) en
+    cuanto termina. Si la ejecución se interrumpe, al reanudarla los municipios del
+    diario no se recalculan y los GeoJSON se reconstruyen a partir de él. El diario
+    se borra al terminar sin errores.
+    
+    Los municipios que superan el límite de tiempo (opciones["limite_tiempo"]) se
+    dividen con METODO_DEGRADADO y se señalan al final; no se guardan en la caché,
+    el diario ni la tabla de huellas, para que la próxima ejecución los reintente.
+    
+    Con modulo_gpu, el reparto es híbrido: un proceso propietario de la GPU divide los
+    municipios grandes y complejos (los que el muestreo en GPU no devolvería a la CPU)
+    mientras el resto de procesos divide los demás en CPU. Qué municipios van a la GPU
+    lo decide el modelo de coste (ver planificador.repartir_cpu_gpu).
+    
+    Los lotes se envían poco a poco y, si la memoria de los procesos se acerca a
+    memoria_maxima_mb, se reduce el número de lotes simultáneos (ver ejecutar_con_limite_memoria).
+    
+    Args:
+        gdf_ccaa: GeoDataFrame con todas las comunidades autónomas
+        gdf_municipios: GeoDataFrame con todos los municipios
+        codigos_ccaa: Códigos de las comunidades autónomas a procesar
+        output_dir: Directorio donde se guardarán los archivos GeoJSON
+        num_workers: Número de procesos
+        opciones: dict con los parámetros de dividir_municipio_con_limite
+        tamano_lote: Máximo de municipios por tarea
+        cache: Caché de particiones devuelta por abrir_cache (None para no usarla)
+        incremental: Reutilizar las zonas de los municipios que no han cambiado
+        reanudar: Recuperar del diario los municipios ya terminados por una ejecución interrumpida
+        modulo_gpu: Backend de GPU del reparto híbrido (ver cargar_modulo_gpu); None para usar solo CPU
+        memoria_maxima_mb: Techo de memoria de los procesos en MB (None para no limitar)
+        tareas_por_proceso: Lotes tras los que se recicla cada proceso de CPU (None para no reciclar)
+    
+    Returns:
+        Lista con las rutas de los GeoJSON generados
+    """
+    # Sin iteraciones explícitas, los procesos de CPU relajan las semillas como el de GPU,
+    # para que las zonas no dependan del proceso que divide el municipio
+    if modulo_gpu is not None and opciones.get("iteraciones_lloyd") is None and opciones.get("metodo_relajacion", "lloyd") == "lloyd":
+        opciones = dict(opciones, iteraciones_lloyd=5)
+    
+    ruta_huellas = os.path.join(output_dir, ARCHIVO_HUELLAS)
+    huellas = cargar_huellas(ruta_huellas)
+    semilla = opciones.get("semilla")
+    # La semilla también fija los ids de las zonas, así que cambiarla invalida las zonas previas
+    parametros = dict(parametros_particion(opciones, None), semilla=semilla)
+    diario = abrir_diario(os.path.join(output_dir, ARCHIVO_DIARIO), parametros, reanudar)
+    
+    # Reparto: una entrada por comunidad y una tarea por municipio.
+    # Las tareas solo llevan índices; nombres y geometrías viajan una vez por proceso
+    comunidades = {}
+    tareas = []
+    natcodes = []
+    nombres = []
+    geometrias = []
+    for codigo_ccaa in codigos_ccaa:
+        ccaa, nombre_ccaa, municipios_ccaa = seleccionar_municipios_comunidad(gdf_ccaa, gdf_municipios, codigo_ccaa)
+        if ccaa is None:
+            print(f"No se encontró la comunidad autónoma con código {codigo_ccaa}")
+            continue
+        if municipios_ccaa.empty:
+            print(f"No se encontraron municipios para la comunidad autónoma {nombre_ccaa}")
+            continue
+        
+        # Comparar con la ejecución anterior para reutilizar los municipios sin cambios
+        huellas_ccaa = [huella_geometria(geometria) for geometria in municipios_ccaa.geometry]
+        features_previas = {}
+        if incremental:
+            features_previas, sin_cambios = zonas_reutilizables(huellas, codigo_ccaa, parametros, list(municipios_ccaa['NATCODE']),
+                                                                huellas_ccaa, ruta_geojson_comunidad(codigo_ccaa, nombre_ccaa, output_dir))
+            if sin_cambios:
+                print(f"{nombre_ccaa}: sin cambios desde la última ejecución, no se reescribe")
+                continue
+            print(f"{nombre_ccaa}: {len(features_previas)} de {len(municipios_ccaa)} municipios sin cambios")
+        
+        comunidades[codigo_ccaa] = {
+            "nombre": nombre_ccaa,
+            "pendientes": len(municipios_ccaa),
+            "degradados": set(),
+            "fallidos": set(),
+            "features": {},
+            "estadisticas": {},
+            "natcodes": list(municipios_ccaa['NATCODE']),
+            "huellas": huellas_ccaa,
+            "previas": features_previas
+        }
+        tareas.extend((codigo_ccaa, posicion, len(nombres) + posicion) for posicion in range(len(municipios_ccaa)))
+        natcodes.extend(municipios_ccaa['NATCODE'])
+        nombres.extend(municipios_ccaa['NAMEUNIT'])
+        geometrias.extend(municipios_ccaa.geometry)
+    
+    resultados = []
+    
+    def reunir_comunidad(codigo_ccaa):
+        # Escribir el GeoJSON de la comunidad con sus municipios en el orden original
+        comunidad = comunidades[codigo_ccaa]
+        posiciones = sorted(comunidad["features"])
+        features_ccaa = [feature for posicion in posiciones for feature in comunidad["features"][posicion]]
+        geojson_data = crear_geojson_zonas(comunidad["nombre"], features=features_ccaa)
+        resultados.append(guardar_geojson_comunidad(geojson_data, codigo_ccaa, comunidad["nombre"], output_dir))
+        mostrar_estadisticas(comunidad["estadisticas"])
+        
+        # Anotar la huella y los ids de las zonas de cada municipio para la próxima ejecución
+        # (salvo los degradados y los fallidos, que así se recalculan aunque no cambien)
+        excluidos = comunidad["degradados"] | comunidad["fallidos"]
+        huellas[codigo_ccaa] = {
+            "parametros": parametros,
+            "municipios": {comunidad["natcodes"][posicion]: {
+                               "huella": comunidad["huellas"][posicion],
+                               "ids": [feature["properties"]["id"] for feature in comunidad["features"][posicion]]
+                           } for posicion in posiciones if posicion not in excluidos}
+        }
+        comunidad["features"].clear()
+    
+    # Reutilizar los municipios sin cambios, los del diario y los de la caché: ninguno de ellos se recalcula
+    total_municipios = len(tareas)
+    num_zonas = [calcular_num_zonas(geometria) for geometria in geometrias]
+    claves = [None] * total_municipios
+    pendientes = []
+    for indice, (codigo_ccaa, posicion, _) in enumerate(tareas):
+        comunidad = comunidades[codigo_ccaa]
+        features = None
+        if posicion in comunidad["previas"]:
+            features = comunidad["previas"].pop(posicion)
+        if features is None and diario["indice"]:
+            features = recuperar_municipio(diario, codigo_ccaa, natcodes[indice], comunidad["huellas"][posicion])
+        if features is None and cache is not None:
+            claves[indice] = clave_particion(geometrias[indice], parametros_particion(opciones, num_zonas[indice]))
+            distritos = leer_municipio_cache(cache, claves[indice], nombres[indice])
+            if distritos is not None:
+                features = crear_features_zonas(distritos, prefijo_ids_zonas(semilla, natcodes[indice]))
+        if features is None:
+            pendientes.append(indice)
+            continue
+        
+        comunidad["features"][posicion] = features
+        comunidad["pendientes"] -= 1
+        # Reunir ya las comunidades completas para no acumular sus features en memoria
+        if comunidad["pendientes"] == 0:
+            reunir_comunidad(codigo_ccaa)
+    
+    # Estimar el coste de cada municipio
+    metodo_division = opciones.get("metodo_division", "voronoi")
+    variables, relleno = caracteristicas_coste(geometrias, num_zonas)
+    costes = estimar_costes(variables, metodo_division, cargar_coeficientes())
+    
+    # Con GPU, los municipios que se muestrearían en GPU y más pesan van al proceso de GPU
+    pendientes = np.array(pendientes, dtype=int)
+    en_gpu = np.zeros(len(pendientes), dtype=bool)
+    num_workers_cpu = num_workers
+    if (modulo_gpu is not None and len(pendientes) > 0 and metodo_division == "voronoi"
+            and opciones.get("metodo_muestreo", "rechazo") != "triangulacion"):
+        num_workers_cpu = max(1, num_workers - 1)
+        elegibles = municipios_elegibles_gpu(np.asarray(geometrias, dtype=object)[pendientes],
+                                             np.asarray(num_zonas)[pendientes])
+        en_gpu = repartir_cpu_gpu(costes[pendientes], elegibles, num_workers_cpu)
+    pendientes_cpu = pendientes[~en_gpu]
+    pendientes_gpu = pendientes[en_gpu]
+    
+    # Formar los lotes de mayor a menor coste
+    lotes_cpu = [[tareas[pendientes_cpu[i]] for i in lote]
+                 for lote in formar_lotes_lpt(costes[pendientes_cpu], num_workers_cpu, tamano_lote)]
+    lotes_gpu = [[tareas[pendientes_gpu[i]] for i in lote]
+                 for lote in formar_lotes_lpt(costes[pendientes_gpu] / ACELERACION_GPU, 1, tamano_lote)]
+    
+    print(f"Repartiendo {len(pendientes)} municipios de {len(comunidades)} comunidades autónomas "
+          f"en {len(lotes_cpu)} lotes entre {num_workers_cpu} procesos (coste estimado {costes[pendientes].sum():.1f} s)")
+    if modulo_gpu is not None:
+        print(f"Reparto híbrido: {len(pendientes_gpu)} municipios al proceso de GPU "
+              f"({costes[pendientes_gpu].sum() / ACELERACION_GPU:.1f} s estimados) y {len(pendientes_cpu)} a los de CPU "
+              f"({costes[pendientes_cpu].sum() / num_workers_cpu:.1f} s estimados por proceso)")
+    
+    tiempos = np.full(total_municipios, np.nan)
+    latencias = []
+    fallidos = 0
+    degradados = []
+    if lotes_cpu or lotes_gpu:
+        geometrias_wkb = shapely.to_wkb(geometrias)
+        with contextlib.ExitStack() as pila:
+            pools = []
+            if lotes_gpu:
+                # El proceso de GPU se arranca con spawn (CUDA no admite fork) y solo recibe sus geometrías
+                geometrias_gpu = np.full(len(geometrias_wkb), None, dtype=object)
+                geometrias_gpu[pendientes_gpu] = geometrias_wkb[pendientes_gpu]
+                executor_gpu = pila.enter_context(concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=inicializar_trabajador_gpu,
+                    initargs=(modulo_gpu, natcodes, nombres, geometrias_gpu, opciones)))
+                pools.append((executor_gpu, lotes_gpu, 1))
+            if lotes_cpu:
+                executor = pila.enter_context(crear_pool(num_workers_cpu, tareas_por_proceso,
+                                                         initializer=inicializar_trabajador_municipios,
+                                                         initargs=(natcodes, nombres, geometrias_wkb, opciones)))
+                pools.append((executor, lotes_cpu, num_workers_cpu))
+            
+            with tqdm(total=total_municipios, initial=total_municipios - len(pendientes),
+                      desc="Procesando municipios") as pbar:
+                for lote, future, envio in ejecutar_con_limite_memoria(pools, procesar_lote_municipios, memoria_maxima_mb):
+                    try:
+                        resultados_lote, inicio = future.result()
+                        latencias.append(inicio - envio)
+                    except Exception as e:
+                        print(f"Error al procesar un lote de municipios: {e}")
+                        resultados_lote = [(codigo_ccaa, posicion, [], None, {}, False, True) for codigo_ccaa, posicion, _ in lote]
+                    
+                    for (codigo_ccaa, posicion, distritos, duracion, estadisticas, degradado, fallido), (_, _, indice) in zip(resultados_lote, lote):
+                        comunidad = comunidades[codigo_ccaa]
+                        comunidad["features"][posicion] = crear_features_zonas(distritos, prefijo_ids_zonas(semilla, natcodes[indice]))
+                        if fallido:
+                            # Sin zonas: no se anota en la tabla de huellas, el diario ni la caché para
+                            # recalcularlo la próxima vez (y se conserva el diario para reanudar)
+                            comunidad["fallidos"].add(posicion)
+                            fallidos += 1
+                        elif degradado:
+                            # Su tiempo no es el del método pedido: tampoco se usa para el modelo de coste
+                            comunidad["degradados"].add(posicion)
+                            degradados.append(f"{nombres[indice]} ({natcodes[indice]})")
+                        elif duracion is not None and distritos:
+                            tiempos[indice] = duracion
+                            anotar_municipio(diario, codigo_ccaa, natcodes[indice], comunidad["huellas"][posicion],
+                                             comunidad["features"][posicion])
+                            if cache is not None:
+                                guardar_municipio_cache(cache, claves[indice], nombres[indice], distritos)
+                        
+                        # Acumular los contadores en la comunidad del municipio
+                        for clave, valor in estadisticas.items():
+                            comunidad["estadisticas"][clave] = comunidad["estadisticas"].get(clave, 0) + valor
+                        comunidad["pendientes"] -= 1
+                        pbar.update(1)
+                        
+                        # Reunir la comunidad en cuanto se completan todos sus municipios
+                        if comunidad["pendientes"] == 0:
+                            reunir_comunidad(codigo_ccaa)
+    
+    mostrar_rendimiento_despacho(latencias)
+    mostrar_municipios_degradados(degradados, opciones.get("limite_tiempo"))
+    
+    # Conservar el diario si algún lote falló, para poder reintentar solo esos municipios
+    cerrar_diario(diario, eliminar=fallidos == 0)
+    if fallidos:
+        print(f"{fallidos} municipios no se pudieron procesar. Ejecuta de nuevo con 'reanudar' para reintentarlos.")
+    
+    try:
+        guardar_huellas(ruta_huellas, huellas)
+    except Exception as e:
+        print(f"Error al guardar la tabla de huellas {ruta_huellas}: {e}")
+    
+    # El modelo de coste es de CPU: los tiempos de GPU solo sirven para medir su aceleración
+    medidos_gpu = np.zeros(total_municipios, dtype=bool)
+    medidos_gpu[pendientes_gpu] = True
+    medidos_gpu &= ~np.isnan(tiempos)
+    if medidos_gpu.any():
+        print(f"Proceso de GPU: {medidos_gpu.sum()} municipios en {tiempos[medidos_gpu].sum():.1f} s, aceleración medida "
+              f"{costes[medidos_gpu].sum() / max(tiempos[medidos_gpu].sum(), 1e-9):.2f} (estimada {ACELERACION_GPU:g}, "
+              f"ACELERACION_GPU en planificador.py)")
+    
+    # Registrar la estimación junto al tiempo real para poder recalibrar el modelo
+    medidos = ~np.isnan(tiempos) & ~medidos_gpu
+    if medidos.any():
+        resumir_prediccion(costes[medidos], tiempos[medidos])
+        try:
+            ruta_registro = os.path.join(output_dir, NOMBRE_REGISTRO_TIEMPOS)
+            registrar_tiempos(ruta_registro, np.flatnonzero(medidos), natcodes, nombres, metodo_division,
+                              variables, relleno, costes, tiempos)
+            print(f"Tiempos estimados y reales añadidos a {ruta_registro} (recalibrar con: python planificador.py {ruta_registro})")
+        except Exception as e:
+            print(f"Error al escribir el registro de tiempos: {e}")
+    
+    return resultados
 
 # ----------------------------------------
 # FUNCIÓN PRINCIPAL
@@ -701,10 +1794,23 @@ def main():
     # Forzar modo CPU o GPU si se especifica como argumento
     forzar_cpu = False
     forzar_gpu = False
+    gpu_simulada = False
     modo_rapido = False
     modo_preciso = False
     codigo_ccaa_especifico = None
     metodo_division = "voronoi"
+    metodo_muestreo = "rechazo"
+    motor_voronoi = "scipy"
+    iteraciones_lloyd = None
+    metodo_relajacion = "lloyd"
+    usar_cache = True
+    incremental = False
+    reanudar = False
+    semilla = SEMILLA_POR_DEFECTO
+    limite_tiempo = LIMITE_TIEMPO_MUNICIPIO
+    memoria_fisica = memoria_fisica_mb()
+    memoria_maxima = FRACCION_MEMORIA_MAXIMA * memoria_fisica if memoria_fisica else None
+    tareas_por_proceso = None
     
     # Procesar argumentos de línea de comandos
     for arg in sys.argv[1:]:
@@ -715,9 +1821,58 @@ def main():
         elif arg_lower == "gpu":
             forzar_gpu = True
             print("Modo GPU forzado por línea de comandos")
-        elif arg_lower in ["voronoi", "grid"]:
+        elif arg_lower == "gpu_simulada":
+            gpu_simulada = True
+            print(f"GPU simulada en CPU ({MODULO_GPU_SIMULADO}.py) para probar el reparto híbrido sin GPU")
+        elif arg_lower in ["voronoi", "voronoi_global", "biseccion", "hex", "grid"]:
             metodo_division = arg_lower
             print(f"Método de división: {metodo_division}")
+        elif arg_lower == "triangulacion":
+            metodo_muestreo = arg_lower
+            print("Muestreo de semillas por triangulación (sin rechazo)")
+        elif arg_lower in ["scipy", "geos"]:
+            motor_voronoi = arg_lower
+            print(f"Motor de Voronoi: {motor_voronoi}")
+        elif arg_lower == "lloyd":
+            iteraciones_lloyd = 5
+            print("Relajación de Lloyd activada (máximo 5 iteraciones, con parada por convergencia)")
+        elif arg_lower.startswith("lloyd="):
+            iteraciones_lloyd = int(arg_lower.split("=", 1)[1])
+            print(f"Relajación de Lloyd: máximo {iteraciones_lloyd} iteraciones, con parada por convergencia")
+        elif arg_lower == "cvt":
+            metodo_relajacion = arg_lower
+            print("Relajación de semillas con Voronoi centroidal discreto (k-means sobre muestras densas)")
+        elif arg_lower.startswith("semilla="):
+            valor = arg_lower.split("=", 1)[1]
+            semilla = None if valor == "aleatoria" else abs(int(valor))
+            print(f"Semilla: {semilla if semilla is not None else 'aleatoria (resultados no reproducibles)'}")
+        elif arg_lower.startswith("limite="):
+            limite_tiempo = float(arg_lower.split("=", 1)[1]) or None
+            if limite_tiempo:
+                print(f"Límite de tiempo por municipio: {limite_tiempo:g} s (después se divide con {METODO_DEGRADADO})")
+            else:
+                print("Sin límite de tiempo por municipio")
+        elif arg_lower.startswith("memoria="):
+            memoria_maxima = float(arg_lower.split("=", 1)[1]) or None
+            if memoria_maxima:
+                print(f"Techo de memoria de los procesos: {memoria_maxima:.0f} MB")
+            else:
+                print("Sin techo de memoria para los procesos")
+        elif arg_lower.startswith("reciclar="):
+            tareas_por_proceso = int(arg_lower.split("=", 1)[1])
+            if tareas_por_proceso:
+                print(f"Cada proceso se reemplaza tras {tareas_por_proceso} tareas")
+            else:
+                print("Los procesos no se reciclan")
+        elif arg_lower == "sin_cache":
+            usar_cache = False
+            print("Caché de particiones desactivada: se recalcularán todos los municipios")
+        elif arg_lower == "incremental":
+            incremental = True
+            print("Modo incremental: solo se recalculan los municipios cuya geometría ha cambiado")
+        elif arg_lower == "reanudar":
+            reanudar = True
+            print(f"Reanudar: se recuperan los municipios terminados del diario {ARCHIVO_DIARIO}")
         elif arg_lower == "rapido":
             modo_rapido = True
             print("Modo rápido activado: se priorizará la velocidad sobre la precisión")
@@ -758,7 +1913,18 @@ def main():
     
     # Obtener comunidades autónomas y municipios
     gdf_ccaa = obtener_comunidades_autonomas(shapefile_ccaa)
-    gdf_municipios = obtener_municipios(shapefile_municipios)
+    # Con una sola comunidad, leer solo sus municipios: los que le da la tabla de asignación
+    # (guardada junto a la caché de ingesta), incluidos los asignados por su ubicación
+    ccaa = gdf_ccaa[gdf_ccaa['NATCODE'] == codigo_ccaa_especifico] if codigo_ccaa_especifico else gdf_ccaa.iloc[:0]
+    asignacion = None if ccaa.empty else asignacion_guardada(shapefile_ccaa, shapefile_municipios)
+    if asignacion is not None:
+        gdf_municipios = obtener_municipios(shapefile_municipios, codigo_ccaa_especifico,
+                                            asignacion.get(codigo_ccaa_especifico, []))
+    else:
+        # Sin tabla al día se lee la capa completa para calcularla una sola vez y guardarla
+        gdf_municipios = obtener_municipios(shapefile_municipios)
+        asignacion = cargar_asignacion(shapefile_ccaa, shapefile_municipios, gdf_ccaa, gdf_municipios)
+    gdf_municipios = asignar_comunidades(gdf_municipios, asignacion)
     
     # ----------------------------------------
     # AJUSTAR PARÁMETROS SEGÚN EL MODO
@@ -797,8 +1963,12 @@ def main():
     # DETECCIÓN DE GPU MEJORADA
     # ----------------------------------------
 
+    # La GPU simulada sustituye a la detección: el proceso de GPU cargará el backend simulado
+    if gpu_simulada:
+        cargar_modulo_gpu(MODULO_GPU_SIMULADO)
+        gpu_disponible, gpu_info = verificar_gpu_disponible()
     # Si se fuerza el modo CPU, no intentar detectar GPU
-    if forzar_cpu:
+    elif forzar_cpu:
         gpu_disponible = False
         print("Usando modo CPU como se especificó")
     else:
@@ -834,52 +2004,6 @@ def main():
                         "nombre": gpu_nombre,
                         "memoria_total_gb": gpu_memoria
                     }
-                    
-                    # Reemplazar la función original con la versión GPU
-                    if not gpu_utils_importado:
-                        generar_puntos_dentro_poligono_original = generar_puntos_dentro_poligono
-                        
-                        # Función para generar puntos aleatorios usando CuPy
-                        def gpu_generar_puntos_aleatorios(n, minx, miny, maxx, maxy):
-                            """Genera n puntos aleatorios en el rango especificado usando GPU"""
-                            # Generar coordenadas x e y aleatorias en GPU
-                            x = cp.random.uniform(minx, maxx, n)
-                            y = cp.random.uniform(miny, maxy, n)
-                            # Transferir de vuelta a CPU para procesamiento posterior
-                            return cp.asnumpy(x), cp.asnumpy(y)
-                        
-                        # Reemplazar la función normal por la versión GPU
-                        def generar_puntos_dentro_poligono_gpu(poligono, n_puntos):
-                            """Versión acelerada por GPU de generar_puntos_dentro_poligono"""
-                            # Obtener bounding box del polígono
-                            minx, miny, maxx, maxy = poligono.bounds
-                            
-                            # Lista para almacenar los puntos generados
-                            puntos = []
-                            
-                            # Generar lotes de puntos en GPU y filtrar en CPU
-                            batch_size = min(100000, n_puntos * 10)  # Tamaño de lote óptimo
-                            intentos = 0
-                            max_intentos = n_puntos * 10000
-                            
-                            while len(puntos) < n_puntos and intentos < max_intentos:
-                                # Generar un lote de puntos aleatorios usando GPU
-                                x_batch, y_batch = gpu_generar_puntos_aleatorios(batch_size, minx, maxx, miny, maxy)
-                                
-                                # Filtrar puntos en CPU (shapely no trabaja directamente con GPU)
-                                for i in range(len(x_batch)):
-                                    punto = Point(x_batch[i], y_batch[i])
-                                    if poligono.contains(punto):
-                                        puntos.append((x_batch[i], y_batch[i]))
-                                        if len(puntos) >= n_puntos:
-                                            break
-                                
-                                intentos += batch_size
-                            
-                            return puntos
-                        
-                        # Reemplazar la función original con la versión GPU
-                        generar_puntos_dentro_poligono = generar_puntos_dentro_poligono_gpu
                 else:
                     print("CUDA está instalado pero no disponible. Verificando otras opciones de GPU...")
             except ImportError:
@@ -912,55 +2036,11 @@ def main():
                 # Intentar usar PyTorch si está disponible
                 import torch
                 if torch.cuda.is_available():
-                    device = torch.device("cuda:0")
                     gpu_nombre = torch.cuda.get_device_name(0)
                     gpu_memoria = torch.cuda.get_device_properties(0).total_memory / (1024**3)
                     
                     print(f"Utilizando aceleración limitada GPU con PyTorch en: {gpu_nombre} ({gpu_memoria:.2f} GB)")
-                    
-                    # Función para generar puntos aleatorios usando PyTorch
-                    def torch_generar_puntos_aleatorios(n, minx, miny, maxx, maxy):
-                        # Generar coordenadas x e y aleatorias en GPU
-                        x = torch.rand(n, device=device) * (maxx - minx) + minx
-                        y = torch.rand(n, device=device) * (maxy - miny) + miny
-                        # Transferir de vuelta a CPU
-                        return x.cpu().numpy(), y.cpu().numpy()
-                    
-                    # Implementar la versión GPU con PyTorch
-                    def generar_puntos_dentro_poligono_torch(poligono, n_puntos):
-                        # Obtener bounding box del polígono
-                        minx, miny, maxx, maxy = poligono.bounds
-                        
-                        # Lista para almacenar los puntos generados
-                        puntos = []
-                        
-                        # Generar lotes de puntos en GPU y filtrar en CPU
-                        batch_size = min(100000, n_puntos * 10)
-                        intentos = 0
-                        max_intentos = n_puntos * 20
-                        
-                        while len(puntos) < n_puntos and intentos < max_intentos:
-                            # Generar un lote de puntos aleatorios usando PyTorch
-                            x_batch, y_batch = torch_generar_puntos_aleatorios(batch_size, minx, maxx, miny, maxy)
-                            
-                            # Filtrar puntos en CPU
-                            for i in range(len(x_batch)):
-                                punto = Point(x_batch[i], y_batch[i])
-                                if poligono.contains(punto):
-                                    puntos.append((x_batch[i], y_batch[i]))
-                                    if len(puntos) >= n_puntos:
-                                        break
-                            
-                            intentos += batch_size
-                        
-                        return puntos
-                    
-                    # Reemplazar la función original con la versión PyTorch
-                    generar_puntos_dentro_poligono_original = generar_puntos_dentro_poligono
-                    generar_puntos_dentro_poligono = generar_puntos_dentro_poligono_torch
-                    
                     gpu_disponible = True
-                    print("Optimizaciones GPU activadas para generación de puntos aleatorios (PyTorch).")
                 else:
                     print("PyTorch está instalado pero CUDA no está disponible.")
             except ImportError:
@@ -970,14 +2050,70 @@ def main():
     
     print(f"Modo de procesamiento: {'GPU' if gpu_disponible else 'CPU'}")
     
+    # Caché persistente de particiones (la teselación global depende de toda la comunidad y no la usa)
+    cache = None
+    if usar_cache and metodo_division != "voronoi_global":
+        try:
+            cache = abrir_cache(DIRECTORIO_CACHE, TAMANO_MAXIMO_CACHE_MB)
+        except Exception as e:
+            print(f"No se pudo abrir la caché de particiones en {DIRECTORIO_CACHE}: {e}")
+    
     # Lista de comunidades autónomas
     codigos_ccaa = gdf_ccaa['NATCODE'].unique()
     
+    opciones = {
+        "metodo_division": metodo_division,
+        "metodo_muestreo": metodo_muestreo,
+        "motor_voronoi": motor_voronoi,
+        "iteraciones_lloyd": iteraciones_lloyd,
+        "metodo_relajacion": metodo_relajacion,
+        "semilla": semilla,
+        "limite_tiempo": limite_tiempo
+    }
+    
+    # Los modos incremental y reanudar usan siempre el reparto por municipios, que mantiene
+    # la tabla de huellas y el diario
+    if incremental and metodo_division == "voronoi_global":
+        print("ADVERTENCIA: El modo incremental no admite voronoi_global (sus zonas dependen de toda la comunidad). Se procesará todo.")
+        incremental = False
+    if reanudar and metodo_division == "voronoi_global":
+        print("ADVERTENCIA: reanudar no admite voronoi_global (no se procesa por municipios). Se procesará todo.")
+        reanudar = False
+    por_municipio = incremental or reanudar
+    num_workers = min(16, multiprocessing.cpu_count())
+    if tareas_por_proceso is None:
+        tareas_por_proceso_municipios = TAREAS_POR_PROCESO_MUNICIPIOS
+    else:
+        tareas_por_proceso_municipios = tareas_por_proceso
+    
+    # Con GPU, un proceso propietario de la GPU trabaja a la vez que los de CPU (reparto híbrido)
+    modulo_gpu = None
+    if gpu_disponible and gpu_utils_importado:
+        modulo_gpu = MODULO_GPU_SIMULADO if gpu_simulada else MODULO_GPU
+    
     # Si se proporciona un código de comunidad autónoma específico
     if codigo_ccaa_especifico:
         if codigo_ccaa_especifico in codigos_ccaa:
             print(f"Procesando solo la comunidad autónoma con código: {codigo_ccaa_especifico}")
-            geojson_file = procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, codigo_ccaa_especifico, output_dir, metodo_division)
+            if por_municipio or (modulo_gpu is not None and metodo_division != "voronoi_global"):
+                generados = procesar_comunidades_por_municipio(gdf_ccaa, gdf_municipios, [codigo_ccaa_especifico], output_dir,
+                                                               num_workers, opciones, cache=cache, incremental=incremental,
+                                                               reanudar=reanudar, modulo_gpu=modulo_gpu,
+                                                               memoria_maxima_mb=memoria_maxima,
+                                                               tareas_por_proceso=tareas_por_proceso_municipios)
+                geojson_file = generados[0] if generados else None
+            else:
+                ruta_huellas = os.path.join(output_dir, ARCHIVO_HUELLAS)
+                huellas = cargar_huellas(ruta_huellas)
+                geojson_file = procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, codigo_ccaa_especifico, output_dir, metodo_division,
+                                                           False, metodo_muestreo, motor_voronoi,
+                                                           iteraciones_lloyd, metodo_relajacion, cache, semilla,
+                                                           limite_tiempo, huellas)
+                if geojson_file:
+                    try:
+                        guardar_huellas(ruta_huellas, huellas)
+                    except Exception as e:
+                        print(f"Error al guardar la tabla de huellas {ruta_huellas}: {e}")
             # Visualizar el resultado
             if geojson_file:
                 visualizar_geojson_distritos(geojson_file)
@@ -985,53 +2121,64 @@ def main():
             print(f"No se encontró la comunidad autónoma con código {codigo_ccaa_especifico}")
             print(f"Comunidades disponibles: {codigos_ccaa}")
     else:
-        # Determinar el número óptimo de trabajadores basado en GPU vs CPU
-        if gpu_disponible:
-            # Si hay GPU, procesar secuencialmente para aprovechar toda la memoria GPU
-            # Esto evita fragmentación y competición por recursos GPU
-            print(f"Procesando {len(codigos_ccaa)} comunidades autónomas secuencialmente con GPU")
-            
-            resultados = []
-            for i, codigo_ccaa in enumerate(codigos_ccaa):
-                print(f"Procesando comunidad {i+1} de {len(codigos_ccaa)}")
-                geojson_file = procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, codigo_ccaa, output_dir, metodo_division, False)
-                resultados.append(geojson_file)
-                
-                # Liberar memoria GPU después de cada comunidad
-                if 'cp' in globals():
-                    cp.get_default_memory_pool().free_all_blocks()
-                if 'torch' in globals() and 'cuda' in dir(torch):
-                    torch.cuda.empty_cache()
-                    
-        else:
-            # Si no hay GPU, procesar en paralelo con CPU
+        if metodo_division == "voronoi_global":
+            # La teselación global necesita todos los municipios de la comunidad en el mismo proceso
             num_workers = min(16, len(codigos_ccaa), multiprocessing.cpu_count())
             print(f"Procesando {len(codigos_ccaa)} comunidades autónomas con {num_workers} hilos en paralelo (CPU)")
             
             # Preparar argumentos para cada comunidad autónoma
-            args_list = [(gdf_ccaa, gdf_municipios, codigo_ccaa, output_dir, metodo_division, False) 
-                         for codigo_ccaa in codigos_ccaa]
+            # Enviar primero las comunidades más extensas (orden LPT aproximado por superficie)
+            areas_ccaa = dict(zip(gdf_ccaa['NATCODE'], shapely.area(gdf_ccaa.geometry.values)))
+            codigos_ordenados = sorted(codigos_ccaa, key=lambda codigo: -areas_ccaa.get(codigo, 0))
+            
+            # Los GeoDataFrames se envían una vez a cada proceso mediante el inicializador del pool
+            args_list = [(codigo_ccaa, output_dir, metodo_division, False, metodo_muestreo, motor_voronoi,
+                          iteraciones_lloyd, metodo_relajacion, None, semilla)
+                         for codigo_ccaa in codigos_ordenados]
             
-            # Lista para almacenar los resultados
+            # Lista para almacenar los resultados y tabla de huellas que se actualiza con cada comunidad
             resultados = []
+            ruta_huellas = os.path.join(output_dir, ARCHIVO_HUELLAS)
+            huellas = cargar_huellas(ruta_huellas)
             
-            # Procesar en paralelo con límite de tiempo para evitar bloqueos
-            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
-                # Iniciar las tareas y obtener los futuros
-                futures = [executor.submit(procesar_comunidad_autonoma_wrapper, args) for args in args_list]
-                
+            # Procesar en paralelo (el límite de tiempo por municipio no aplica: la teselación es de toda la comunidad).
+            # Cada proceso retiene el GeoJSON entero de su comunidad: se limita la memoria y se reciclan los procesos
+            with crear_pool(num_workers, TAREAS_POR_PROCESO_COMUNIDADES if tareas_por_proceso is None else tareas_por_proceso,
+                            initializer=inicializar_trabajador_comunidades, initargs=(gdf_ccaa, gdf_municipios)) as executor:
                 # Monitorear el progreso
                 completados = 0
-                for future in concurrent.futures.as_completed(futures):
+                for _, future, _ in ejecutar_con_limite_memoria([(executor, args_list, num_workers)],
+                                                                procesar_comunidad_autonoma_wrapper, memoria_maxima):
                     try:
-                        geojson_file = future.result(timeout=600)  # Timeout de 10 minutos por comunidad
+                        geojson_file, huellas_comunidad = future.result()
                         completados += 1
                         resultados.append(geojson_file)
+                        huellas.update(huellas_comunidad)
                         print(f"Completado {completados}/{len(codigos_ccaa)} comunidades autónomas")
-                    except concurrent.futures.TimeoutError:
-                        print(f"Timeout al procesar una comunidad autónoma. Continuando con las demás.")
                     except Exception as e:
                         print(f"Error al procesar una comunidad autónoma: {e}")
+            
+            try:
+                guardar_huellas(ruta_huellas, huellas)
+            except Exception as e:
+                print(f"Error al guardar la tabla de huellas {ruta_huellas}: {e}")
+            
+            mostrar_rendimiento_despacho([])
+        else:
+            # Repartir los municipios de todas las comunidades entre los procesos (y la GPU, si la hay)
+            if modulo_gpu is not None:
+                print(f"Procesando {len(codigos_ccaa)} comunidades autónomas por municipios con 1 proceso de GPU "
+                      f"y {max(1, num_workers - 1)} de CPU en paralelo")
+            else:
+                print(f"Procesando {len(codigos_ccaa)} comunidades autónomas por municipios con {num_workers} hilos en paralelo (CPU)")
+            resultados = procesar_comunidades_por_municipio(gdf_ccaa, gdf_municipios, codigos_ccaa, output_dir,
+                                                            num_workers, opciones, cache=cache, incremental=incremental,
+                                                            reanudar=reanudar, modulo_gpu=modulo_gpu,
+                                                            memoria_maxima_mb=memoria_maxima,
+                                                            tareas_por_proceso=tareas_por_proceso_municipios)
+    
+    if cache is not None:
+        cerrar_cache(cache)
     
     # Calcular tiempo total
     tiempo_total = time.time() - tiempo_inicio
@@ -1056,15 +2203,35 @@ def main():
     print("\n2. Modo de hardware:")
     print(f"   py {__file__} cpu          # Fuerza el uso de CPU")
     print(f"   py {__file__} gpu          # Fuerza el uso de GPU")
+    print(f"   py {__file__} gpu_simulada # Reparto híbrido CPU+GPU con una GPU simulada (para probar sin GPU)")
     
     print("\n3. Método de división:")
     print(f"   py {__file__} voronoi      # Usa el método de Voronoi (más preciso, más lento)")
+    print(f"   py {__file__} voronoi_global # Un único diagrama de Voronoi por comunidad autónoma")
+    print(f"   py {__file__} biseccion    # Bisección recursiva en partes de igual área (rápido, zonas equilibradas)")
+    print(f"   py {__file__} hex          # Teselado hexagonal (zonas uniformes, tan rápido como grid)")
     print(f"   py {__file__} grid         # Usa el método de Grid (menos preciso, más rápido)")
+    print(f"   py {__file__} triangulacion # Semillas de Voronoi por triangulación (polígonos muy irregulares)")
+    
+    print(f"   py {__file__} geos         # Calcula el diagrama de Voronoi con GEOS en lugar de scipy")
+    print(f"   py {__file__} lloyd        # Relaja las semillas de Voronoi con Lloyd (lloyd=N para N iteraciones)")
+    print(f"   py {__file__} cvt          # Relaja las semillas con Voronoi centroidal discreto (k-means)")
     
     print("\n4. Optimización automática:")
     print(f"   py {__file__} rapido       # Prioriza velocidad (usa grid y CPU por defecto)")
     print(f"   py {__file__} preciso      # Prioriza precisión (usa voronoi y GPU si disponible)")
     
+    print("\n5. Caché, reproducibilidad y ejecuciones largas:")
+    print(f"   py {__file__} sin_cache    # No reutiliza ni guarda particiones en {DIRECTORIO_CACHE}/")
+    print(f"   py {__file__} incremental  # Solo recalcula los municipios que han cambiado desde la última ejecución")
+    print(f"   py {__file__} reanudar     # Continúa una ejecución interrumpida a partir de su diario")
+    print(f"   py {__file__} limite=N     # Segundos máximos por municipio antes de usar {METODO_DEGRADADO} "
+          f"(por defecto {LIMITE_TIEMPO_MUNICIPIO}; limite=0 sin límite)")
+    print(f"   py {__file__} semilla=N    # Semilla de las zonas (por defecto {SEMILLA_POR_DEFECTO}; semilla=aleatoria para no fijarla)")
+    print(f"   py {__file__} memoria=N    # Techo de memoria de los procesos en MB (por defecto el "
+          f"{FRACCION_MEMORIA_MAXIMA:.0%} de la memoria física; memoria=0 sin techo)")
+    print(f"   py {__file__} reciclar=N   # Reemplaza cada proceso tras N tareas para liberar memoria (reciclar=0 nunca)")
+    
     print("\nLos parámetros se pueden combinar:")
     print(f"   py {__file__} 34010000000 cpu rapido  # Procesa Andalucía con CPU en modo rápido")
     
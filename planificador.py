@@ -0,0 +1,286 @@
+import csv
+import json
+import os
+import sys
+import numpy as np
+import shapely
+from scipy.optimize import nnls
+from voronoi_utils import muestreo_en_gpu
+
+# Archivo con los coeficientes calibrados del modelo de coste
+RUTA_COEFICIENTES = "coeficientes_coste.json"
+
+# Nombre del registro de tiempos estimados y reales que se escribe en cada ejecución
+NOMBRE_REGISTRO_TIEMPOS = "registro_tiempos.csv"
+
+# Variables del modelo de coste, en el orden de los coeficientes
+VARIABLES_COSTE = ["constante", "partes", "vertices", "zonas", "zonas_relleno", "vertices_zonas"]
+
+# Coeficientes por defecto (segundos) para cada método de división, ajustados con
+# municipios sintéticos; se sustituyen por los de RUTA_COEFICIENTES si existe.
+# El de "partes" no se pudo ajustar (sin multipolígonos) y es una estimación
+COEFICIENTES_POR_DEFECTO = {
+    "voronoi": [7.6e-4, 1e-3, 3.6e-7, 2.7e-5, 1.6e-5, 2.3e-7],
+    "biseccion": [1.1e-2, 1e-2, 7.4e-5, 1.0e-3, 0.0, 9.3e-6],
+    "hex": [5.4e-4, 1e-3, 1.4e-6, 3.8e-6, 2.8e-5, 0.0],
+    "grid": [2.7e-4, 1e-3, 1.0e-6, 1.8e-5, 0.0, 7.4e-8],
+}
+
+# Aceleración estimada de un municipio en el proceso de GPU respecto a un proceso de CPU
+# (cada ejecución híbrida muestra la medida, con la que se puede ajustar)
+ACELERACION_GPU = 2.0
+
+# Columnas del registro de tiempos
+COLUMNAS_REGISTRO = ["natcode", "nombre", "metodo"] + VARIABLES_COSTE[1:] + ["relleno", "coste_estimado", "tiempo_real"]
+
+def caracteristicas_coste(geometrias, num_zonas):
+    """
+    Calcula las variables del modelo de coste de cada municipio
+
+    Args:
+        geometrias: Secuencia de polígonos o multipolígonos
+        num_zonas: Secuencia con el número de zonas objetivo de cada municipio
+
+    Returns:
+        Tupla (variables, relleno): matriz (n, len(VARIABLES_COSTE)) y la proporción
+        área/bounding box de cada municipio
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    zonas = np.asarray(num_zonas, dtype=float)
+    n = len(geometrias)
+
+    # Vértices del anillo exterior de cada parte, sumados por municipio
+    partes, indices = shapely.get_parts(geometrias, return_index=True)
+    vertices_partes = shapely.get_num_coordinates(shapely.get_exterior_ring(partes))
+    vertices = np.bincount(indices, weights=vertices_partes, minlength=n)
+    num_partes = shapely.get_num_geometries(geometrias).astype(float)
+
+    # Proporción del bounding box ocupada: el muestreo por rechazo escala con su inversa
+    limites = shapely.bounds(geometrias)
+    area_bbox = (limites[:, 2] - limites[:, 0]) * (limites[:, 3] - limites[:, 1])
+    relleno = np.clip(shapely.area(geometrias) / np.maximum(area_bbox, 1e-300), 1e-3, 1.0)
+
+    variables = np.column_stack([np.ones(n), num_partes, vertices, zonas, zonas / relleno, vertices * np.sqrt(zonas)])
+    return variables, relleno
+
+def cargar_coeficientes(ruta=RUTA_COEFICIENTES):
+    """
+    Carga los coeficientes del modelo de coste
+
+    Args:
+        ruta: Archivo JSON con coeficientes calibrados
+
+    Returns:
+        dict método -> lista de coeficientes, con los valores por defecto
+        para los métodos que no estén calibrados
+    """
+    coeficientes = {metodo: list(valores) for metodo, valores in COEFICIENTES_POR_DEFECTO.items()}
+    if ruta and os.path.exists(ruta):
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                coeficientes.update(json.load(f))
+        except Exception as e:
+            print(f"No se pudieron leer los coeficientes de coste de {ruta}: {e}")
+    return coeficientes
+
+def estimar_costes(variables, metodo_division, coeficientes=None):
+    """
+    Estima el tiempo de división de cada municipio
+
+    Args:
+        variables: Matriz devuelta por caracteristicas_coste
+        metodo_division: Método de división ('voronoi', 'biseccion', 'hex' o 'grid')
+        coeficientes: dict devuelto por cargar_coeficientes (None para cargarlos)
+
+    Returns:
+        Array con el coste estimado de cada municipio, en segundos
+    """
+    if coeficientes is None:
+        coeficientes = cargar_coeficientes()
+    c = np.asarray(coeficientes.get(metodo_division, coeficientes["grid"]), dtype=float)
+    return variables @ c
+
+def formar_lotes_lpt(costes, num_workers, tamano_maximo, lotes_por_trabajador=4):
+    """
+    Agrupa las tareas en lotes por orden de coste decreciente (LPT)
+
+    Las tareas se ordenan de mayor a menor coste y se van llenando lotes hasta
+    alcanzar un coste objetivo o tamano_maximo tareas, de forma que los municipios
+    caros van solos y los baratos se agrupan. Enviar los lotes en el orden devuelto
+    hace que el pool procese primero el trabajo largo y termine con lotes pequeños.
+
+    Args:
+        costes: Coste estimado de cada tarea
+        num_workers: Número de procesos
+        tamano_maximo: Máximo de tareas por lote
+        lotes_por_trabajador: Lotes por proceso con los que se fija el coste objetivo
+
+    Returns:
+        Lista de lotes (listas de índices de tareas), de mayor a menor coste
+    """
+    costes = np.asarray(costes, dtype=float)
+    if len(costes) == 0:
+        return []
+
+    objetivo = costes.sum() / max(1, num_workers * lotes_por_trabajador)
+    lotes = []
+    lote = []
+    coste_lote = 0.0
+    for indice in np.argsort(-costes, kind="stable"):
+        lote.append(int(indice))
+        coste_lote += costes[indice]
+        if coste_lote >= objetivo or len(lote) >= tamano_maximo:
+            lotes.append(lote)
+            lote = []
+            coste_lote = 0.0
+    if lote:
+        lotes.append(lote)
+    return lotes
+
+def municipios_elegibles_gpu(geometrias, num_zonas):
+    """
+    Indica qué municipios se muestrearían en GPU (ver voronoi_utils.muestreo_en_gpu)
+
+    Un municipio es elegible si alguna de sus partes lo es, con las zonas repartidas
+    entre las partes por área como en dividir_municipio.
+
+    Args:
+        geometrias: Secuencia de polígonos o multipolígonos
+        num_zonas: Secuencia con el número de zonas objetivo de cada municipio
+
+    Returns:
+        Array de bool, uno por municipio
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    zonas = np.asarray(num_zonas, dtype=float)
+    partes, indices = shapely.get_parts(geometrias, return_index=True)
+    area_partes = shapely.area(partes)
+    area_total = shapely.area(geometrias)[indices]
+    multiparte = shapely.get_num_geometries(geometrias)[indices] > 1
+    zonas_partes = np.where(multiparte, np.maximum(1, np.floor(zonas[indices] * area_partes / np.maximum(area_total, 1e-300))),
+                            zonas[indices])
+    vertices = shapely.get_num_coordinates(shapely.get_exterior_ring(partes))
+    en_gpu = muestreo_en_gpu(vertices, area_partes, zonas_partes)
+    return np.bincount(indices, weights=en_gpu, minlength=len(geometrias)) > 0
+
+def repartir_cpu_gpu(costes, elegibles, num_workers_cpu, aceleracion=ACELERACION_GPU):
+    """
+    Decide qué municipios se envían al proceso de GPU
+
+    Recorre los municipios elegibles de mayor a menor coste y pasa cada uno a la GPU
+    mientras su carga estimada (coste / aceleracion) no supere la carga por proceso
+    que quedaría en la CPU, de forma que los dos terminen a la vez.
+
+    Args:
+        costes: Coste estimado de cada municipio en CPU, en segundos
+        elegibles: Array de bool de municipios_elegibles_gpu
+        num_workers_cpu: Número de procesos de CPU
+        aceleracion: Aceleración estimada en GPU
+
+    Returns:
+        Array de bool: True para los municipios asignados a la GPU
+    """
+    costes = np.asarray(costes, dtype=float)
+    en_gpu = np.zeros(len(costes), dtype=bool)
+    carga_gpu = 0.0
+    total_cpu = costes.sum()
+    for indice in np.argsort(-costes, kind="stable"):
+        if not elegibles[indice]:
+            continue
+        if carga_gpu + costes[indice] / aceleracion <= (total_cpu - costes[indice]) / max(1, num_workers_cpu):
+            en_gpu[indice] = True
+            carga_gpu += costes[indice] / aceleracion
+            total_cpu -= costes[indice]
+    return en_gpu
+
+def registrar_tiempos(ruta, indices, natcodes, nombres, metodo_division, variables, relleno, costes, tiempos):
+    """
+    Añade al registro CSV el tiempo estimado y el real de los municipios indicados
+
+    Args:
+        ruta: Archivo CSV del registro (se crea con cabecera si no existe)
+        indices: Índices de los municipios a registrar
+        natcodes: NATCODE de cada municipio
+        nombres: Nombre de cada municipio
+        metodo_division: Método de división usado
+        variables: Matriz devuelta por caracteristicas_coste
+        relleno: Proporción área/bounding box de cada municipio
+        costes: Coste estimado de cada municipio, en segundos
+        tiempos: Tiempo real de cada municipio, en segundos
+    """
+    nuevo = not os.path.exists(ruta)
+    with open(ruta, 'a', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        if nuevo:
+            escritor.writerow(COLUMNAS_REGISTRO)
+        for i in indices:
+            escritor.writerow([natcodes[i], nombres[i], metodo_division]
+                              + [f"{valor:g}" for valor in variables[i, 1:]]
+                              + [f"{relleno[i]:.4f}", f"{costes[i]:.6f}", f"{tiempos[i]:.6f}"])
+
+def resumir_prediccion(estimados, reales):
+    """
+    Muestra la calidad de las estimaciones de coste de una ejecución
+
+    Args:
+        estimados: Costes estimados, en segundos
+        reales: Tiempos medidos, en segundos
+    """
+    estimados = np.asarray(estimados, dtype=float)
+    reales = np.asarray(reales, dtype=float)
+    if len(reales) < 2:
+        return
+
+    # Correlación en escala logarítmica: importa el orden relativo más que la escala
+    correlacion = np.corrcoef(np.log(estimados + 1e-6), np.log(reales + 1e-6))[0, 1]
+    ratio = np.median(reales / np.maximum(estimados, 1e-9))
+    print(f"Modelo de coste: correlación {correlacion:.2f} entre tiempo estimado y real (escala logarítmica), "
+          f"tiempo real / estimado mediano {ratio:.2f}. "
+          f"Total estimado {estimados.sum():.1f} s, real {reales.sum():.1f} s.")
+
+def calibrar_coeficientes(ruta_registro, ruta_coeficientes=RUTA_COEFICIENTES):
+    """
+    Ajusta los coeficientes del modelo de coste con los tiempos de un registro
+
+    Usa mínimos cuadrados no negativos por método de división y guarda el resultado
+    en ruta_coeficientes, conservando los métodos que no aparecen en el registro.
+
+    Args:
+        ruta_registro: Registro CSV escrito por registrar_tiempos
+        ruta_coeficientes: Archivo JSON donde se guardan los coeficientes
+
+    Returns:
+        dict método -> lista de coeficientes ajustados
+    """
+    filas_por_metodo = {}
+    with open(ruta_registro, 'r', encoding='utf-8') as f:
+        for fila in csv.DictReader(f):
+            filas_por_metodo.setdefault(fila["metodo"], []).append(fila)
+
+    coeficientes = cargar_coeficientes(ruta_coeficientes)
+    for metodo, filas in filas_por_metodo.items():
+        if len(filas) < len(VARIABLES_COSTE):
+            print(f"Muy pocas muestras para calibrar '{metodo}' ({len(filas)}). Se mantienen sus coeficientes.")
+            continue
+        variables = np.array([[1.0] + [float(fila[v]) for v in VARIABLES_COSTE[1:]] for fila in filas])
+        reales = np.array([float(fila["tiempo_real"]) for fila in filas])
+
+        # Escalar columnas para que el ajuste no dependa de sus órdenes de magnitud
+        escala = np.maximum(np.abs(variables).max(axis=0), 1e-12)
+        ajuste, _ = nnls(variables / escala, reales)
+        coeficientes[metodo] = (ajuste / escala).tolist()
+
+        estimados = variables @ np.asarray(coeficientes[metodo])
+        print(f"Método '{metodo}' calibrado con {len(filas)} municipios.")
+        resumir_prediccion(estimados, reales)
+
+    with open(ruta_coeficientes, 'w', encoding='utf-8') as f:
+        json.dump(coeficientes, f, indent=2)
+    print(f"Coeficientes guardados en {ruta_coeficientes}")
+    return coeficientes
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python planificador.py <registro_tiempos.csv> [coeficientes.json]")
+        sys.exit(1)
+    calibrar_coeficientes(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else RUTA_COEFICIENTES)
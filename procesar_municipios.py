@@ -1,8 +1,8 @@
 import os
-import geopandas as gpd
 import json
 from shapely.geometry import mapping
 import uuid
+from ingesta import leer_capa
 
 def procesar_municipios(input_shapefile, output_geojson, region_name):
     """
@@ -13,14 +13,9 @@ def procesar_municipios(input_shapefile, output_geojson, region_name):
         output_geojson: Ruta donde se guardará el archivo GeoJSON
         region_name: Nombre de la región para incluir en el GeoJSON
     """
-    # Leer el shapefile con geopandas
+    # Leer la capa desde la caché de ingesta (ya en WGS84)
     print(f"Leyendo shapefile: {input_shapefile}")
-    gdf = gpd.read_file(input_shapefile)
-    
-    # Asegurarse de que está en el sistema de coordenadas correcto (WGS84)
-    if gdf.crs != "EPSG:4326":
-        print(f"Convirtiendo de {gdf.crs} a EPSG:4326 (WGS84)")
-        gdf = gdf.to_crs("EPSG:4326")
+    gdf = leer_capa(input_shapefile, ["NAMEUNIT"])
     
     # Crear la estructura del GeoJSON
     geojson_data = {
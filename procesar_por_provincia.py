@@ -1,9 +1,15 @@
 import os
-import geopandas as gpd
 import json
 from shapely.geometry import mapping
 import uuid
 import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ingesta import leer_capa, cargar_indice
+from jerarquia import LONGITUD_PREFIJO_PROVINCIA, resolver_region
+
+# Atributos de los municipios que se usan (además de la geometría)
+COLUMNAS_MUNICIPIOS = ["CODNUT3", "NATCODE", "NAMEUNIT"]
 
 def obtener_provincias(input_shapefile):
     """
@@ -15,14 +21,20 @@ def obtener_provincias(input_shapefile):
     Returns:
         Lista de códigos de provincia
     """
-    gdf = gpd.read_file(input_shapefile)
+    # Con la caché de ingesta, las provincias (prefijos de NATCODE) salen del índice de
+    # jerarquía sin leer la capa. No se usa CODNUT3: en las islas hay varias NUTS3 por provincia
+    indice = cargar_indice(input_shapefile)
+    if indice is not None:
+        return sorted(indice["provincia"])
+    
+    # Solo hacen falta los códigos: no se lee la geometría
+    gdf = leer_capa(input_shapefile, ["CODNUT3", "NATCODE"], geometria=False)
     if 'CODNUT3' in gdf.columns:
         # Los códigos NUT3 corresponden a provincias en España
         return sorted(gdf['CODNUT3'].unique())
     elif 'NATCODE' in gdf.columns:
-        # NATCODE también puede contener códigos de provincia
-        # Los códigos de provincia en España son de 2 dígitos
-        return sorted(gdf['NATCODE'].apply(lambda x: x[:2]).unique())
+        # NATCODE también contiene la provincia: "34" + comunidad (2) + provincia (2)
+        return sorted(gdf['NATCODE'].str[:LONGITUD_PREFIJO_PROVINCIA].unique())
     else:
         print("No se encontraron columnas para identificar provincias")
         return []
@@ -34,22 +46,28 @@ def procesar_por_provincia(input_shapefile, output_dir, codigo_provincia):
     Args:
         input_shapefile: Ruta al shapefile de municipios
         output_dir: Directorio donde se guardarán los archivos GeoJSON
-        codigo_provincia: Código de la provincia a procesar
+        codigo_provincia: Código de la provincia a procesar (CODNUT3 o prefijo de NATCODE)
     """
     # Crear directorio de salida si no existe
     os.makedirs(output_dir, exist_ok=True)
     
-    # Leer el shapefile con geopandas
+    # Resolver la provincia en el índice de jerarquía para leer solo sus filas
+    prefijo_natcode = None
+    indice = cargar_indice(input_shapefile)
+    if indice is not None:
+        prefijo_natcode, _ = resolver_region(indice, "provincia", codigo_provincia, "CODNUT3")
+    
+    # Leer la capa desde la caché de ingesta (ya en WGS84)
     print(f"Leyendo shapefile: {input_shapefile}")
-    gdf = gpd.read_file(input_shapefile)
+    gdf = leer_capa(input_shapefile, COLUMNAS_MUNICIPIOS, prefijo_natcode=prefijo_natcode)
     
     # Filtrar por provincia
-    if 'CODNUT3' in gdf.columns:
+    if prefijo_natcode is not None:
+        provincia_gdf = gdf
+    elif 'CODNUT3' in gdf.columns:
         provincia_gdf = gdf[gdf['CODNUT3'] == codigo_provincia]
-        nombre_provincia = provincia_gdf['NAMEUNIT'].iloc[0] if not provincia_gdf.empty and 'NAMEUNIT' in provincia_gdf.columns else f"Provincia_{codigo_provincia}"
     elif 'NATCODE' in gdf.columns:
-        provincia_gdf = gdf[gdf['NATCODE'].apply(lambda x: x[:2]) == codigo_provincia]
-        nombre_provincia = provincia_gdf['NAMEUNIT'].iloc[0] if not provincia_gdf.empty and 'NAMEUNIT' in provincia_gdf.columns else f"Provincia_{codigo_provincia}"
+        provincia_gdf = gdf[gdf['NATCODE'].str[:LONGITUD_PREFIJO_PROVINCIA] == codigo_provincia]
     else:
         print("No se encontraron columnas para filtrar por provincia")
         return
@@ -58,10 +76,21 @@ def procesar_por_provincia(input_shapefile, output_dir, codigo_provincia):
         print(f"No se encontraron municipios para la provincia con código {codigo_provincia}")
         return
     
-    # Asegurarse de que está en el sistema de coordenadas correcto (WGS84)
-    if provincia_gdf.crs != "EPSG:4326":
-        print(f"Convirtiendo de {provincia_gdf.crs} a EPSG:4326 (WGS84)")
-        provincia_gdf = provincia_gdf.to_crs("EPSG:4326")
+    return escribir_geojson_provincia(provincia_gdf, output_dir, codigo_provincia)
+
+def escribir_geojson_provincia(provincia_gdf, output_dir, codigo_provincia):
+    """
+    Escribe el GeoJSON con los municipios de una provincia
+    
+    Args:
+        provincia_gdf: GeoDataFrame con los municipios de la provincia
+        output_dir: Directorio donde se guardará el archivo GeoJSON
+        codigo_provincia: Código de la provincia (para nombrarla si no hay NAMEUNIT)
+    
+    Returns:
+        Ruta del archivo GeoJSON creado
+    """
+    nombre_provincia = provincia_gdf['NAMEUNIT'].iloc[0] if 'NAMEUNIT' in provincia_gdf.columns else f"Provincia_{codigo_provincia}"
     
     # Crear la estructura del GeoJSON
     geojson_data = {
@@ -101,6 +130,59 @@ def procesar_por_provincia(input_shapefile, output_dir, codigo_provincia):
         json.dump(geojson_data, f, ensure_ascii=False, indent=4)
     
     print(f"Archivo GeoJSON creado exitosamente. Contiene {len(geojson_data['features'])} distritos.")
+    return output_geojson
+
+def procesar_todas_las_provincias(input_shapefile, output_dir, num_workers=None):
+    """
+    Convierte en GeoJSON todas las provincias leyendo la capa de municipios una sola vez
+    
+    Los municipios se agrupan por provincia (prefijo de NATCODE, o CODNUT3 si no hay
+    NATCODE) y cada grupo se escribe en paralelo en un proceso distinto.
+    
+    Args:
+        input_shapefile: Ruta al shapefile de municipios
+        output_dir: Directorio donde se guardarán los archivos GeoJSON
+        num_workers: Número de procesos (por defecto, uno por CPU hasta 16)
+    
+    Returns:
+        Lista de archivos GeoJSON creados
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    print(f"Leyendo shapefile: {input_shapefile}")
+    gdf = leer_capa(input_shapefile, COLUMNAS_MUNICIPIOS)
+    if 'NATCODE' in gdf.columns:
+        provincias = gdf['NATCODE'].str[:LONGITUD_PREFIJO_PROVINCIA]
+    elif 'CODNUT3' in gdf.columns:
+        provincias = gdf['CODNUT3']
+    else:
+        print("No se encontraron columnas para identificar provincias")
+        return []
+    
+    # Solo se envía a los procesos lo que se escribe en el GeoJSON
+    columnas = [columna for columna in ['NAMEUNIT'] if columna in gdf.columns] + [gdf.geometry.name]
+    grupos = [(codigo, grupo[columnas]) for codigo, grupo in gdf.groupby(provincias.to_numpy(), sort=True)]
+    print(f"Provincias disponibles: {[codigo for codigo, _ in grupos]}")
+    
+    if num_workers is None:
+        num_workers = min(16, multiprocessing.cpu_count())
+    num_workers = max(1, min(num_workers, len(grupos)))
+    
+    generados = []
+    if num_workers == 1:
+        for codigo, grupo in grupos:
+            generados.append(escribir_geojson_provincia(grupo, output_dir, codigo))
+        return generados
+    
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {executor.submit(escribir_geojson_provincia, grupo, output_dir, codigo): codigo
+                   for codigo, grupo in grupos}
+        for future in as_completed(futures):
+            try:
+                generados.append(future.result())
+            except Exception as e:
+                print(f"Error al procesar la provincia {futures[future]}: {e}")
+    return generados
 
 def main():
     # Definir las rutas de los archivos
@@ -120,13 +202,8 @@ def main():
         codigo_provincia = sys.argv[1]
         procesar_por_provincia(input_shapefile, output_dir, codigo_provincia)
     else:
-        # Obtener lista de provincias
-        provincias = obtener_provincias(input_shapefile)
-        print(f"Provincias disponibles: {provincias}")
-        
-        # Procesar cada provincia
-        for codigo_provincia in provincias:
-            procesar_por_provincia(input_shapefile, output_dir, codigo_provincia)
+        # Procesar todas las provincias con una sola lectura de la capa
+        procesar_todas_las_provincias(input_shapefile, output_dir)
     
     print("Proceso completado.")
 
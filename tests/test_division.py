@@ -0,0 +1,107 @@
+import numpy as np
+import shapely
+from shapely.geometry import Point, Polygon
+from voronoi_utils import _triangular_por_recorte, _triangular_por_franjas, poligonos_voronoi_global
+
+# Peine: una base de 10 x 1 con 10 dientes de 0.5 x 3 (superficie 25)
+PEINE = shapely.union_all([shapely.box(0, 0, 10, 1)] + [shapely.box(i, 1, i + 0.5, 4) for i in range(10)])
+
+def estrella_irregular(semilla, n=40):
+    rng = np.random.default_rng(semilla)
+    angulos = np.sort(rng.uniform(0, 2 * np.pi, n))
+    radios = rng.uniform(0.05, 1, n)
+    return Polygon(np.column_stack((radios * np.cos(angulos), radios * np.sin(angulos)))).buffer(0)
+
+def comprobar_triangulacion(poligono, triangulos):
+    assert all(len(t.exterior.coords) == 4 for t in triangulos)
+    assert np.isclose(sum(t.area for t in triangulos), poligono.area)
+    assert shapely.union_all(triangulos).symmetric_difference(poligono).area < 1e-9 * max(1, poligono.area)
+
+def test_triangulacion_por_franjas_es_exacta():
+    # Polígonos en los que los triángulos de Delaunay con el centroide dentro no los cubren
+    for semilla in range(20):
+        poligono = estrella_irregular(semilla)
+        comprobar_triangulacion(poligono, _triangular_por_franjas(poligono))
+    con_agujero = PEINE.difference(Point(5, 0.5).buffer(0.3))
+    comprobar_triangulacion(con_agujero, _triangular_por_franjas(con_agujero))
+
+def test_triangulacion_por_recorte_cubre_el_poligono():
+    estrella = Polygon([(np.cos(t) * (1 + 0.6 * (k % 2)), np.sin(t) * (1 + 0.6 * (k % 2)))
+                        for k, t in enumerate(np.linspace(0, 2 * np.pi, 41)[:-1])]).difference(Point(0, 0).buffer(0.3))
+    for poligono in (PEINE, estrella, estrella_irregular(0), estrella_irregular(1)):
+        for profundidad in (0, 3):
+            comprobar_triangulacion(poligono, _triangular_por_recorte(poligono, profundidad))
+
+def test_voronoi_global_respeta_el_numero_de_zonas():
+    # El peine y su vecino: las celdas del peine quedan partidas por los dientes
+    vecino = shapely.box(0, 4, 10, 6)
+    for semilla in range(20):
+        zonas = poligonos_voronoi_global([PEINE, vecino], [8, 8], np.random.default_rng(semilla))
+        assert [len(z) for z in zonas] == [8, 8]
+        for municipio, zonas_municipio in zip((PEINE, vecino), zonas):
+            assert np.isclose(sum(z.area for z in zonas_municipio), municipio.area)
+            assert shapely.union_all(zonas_municipio).symmetric_difference(municipio).area < 1e-9
+
+def test_biseccion_cubre_el_poligono_con_el_numero_de_zonas():
+    from main import dividir_poligono_biseccion
+    # Los cortes del peine caen sobre las aristas de los dientes
+    for num_divisiones in (2, 5, 8, 10, 16):
+        zonas = dividir_poligono_biseccion(PEINE, num_divisiones)
+        assert len(zonas) == num_divisiones
+        assert all(shapely.get_type_id(zona) in (3, 6) for zona in zonas)
+        assert np.isclose(sum(zona.area for zona in zonas), PEINE.area)
+        assert shapely.union_all(zonas).symmetric_difference(PEINE).area < 1e-9
+
+def test_filtro_contiene_coincide_con_shapely():
+    from voronoi_utils import crear_filtro_contiene
+    rng = np.random.default_rng(0)
+    for poligono in (PEINE.difference(Point(5, 0.5).buffer(0.3)), estrella_irregular(2)):
+        minx, miny, maxx, maxy = poligono.bounds
+        # Puntos al azar, los vértices y puntos sobre las aristas
+        vertices = shapely.get_coordinates(poligono.boundary)
+        t = rng.uniform(0, 1, len(vertices) - 1)[:, None]
+        puntos = np.concatenate((rng.uniform((minx, miny), (maxx, maxy), (20000, 2)), vertices,
+                                 vertices[:-1] + t * (vertices[1:] - vertices[:-1])))
+        x, y = puntos[:, 0], puntos[:, 1]
+        assert np.array_equal(crear_filtro_contiene(poligono)(x, y), shapely.contains_xy(poligono, x, y))
+
+def test_gpu_simulada_genera_las_semillas_de_cpu():
+    import gpu_simulado
+    from voronoi_utils import crear_generador, generar_semillas
+    for metodo_relajacion in ("lloyd", "cvt"):
+        cpu = generar_semillas(PEINE, 30, 3, None, metodo_relajacion, crear_generador(0, "peine"))
+        gpu = gpu_simulado.mejorar_puntos_aleatorios_gpu(PEINE, 30, 3, None, metodo_relajacion,
+                                                         crear_generador(0, "peine"))
+        assert np.array_equal(cpu, gpu)
+
+def test_zonas_del_voronoi_global_se_exportan_y_dibujan():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from main import crear_features_zonas, dibujar_zonas
+    zonas = poligonos_voronoi_global([PEINE, shapely.box(0, 4, 10, 6)], [8, 8], np.random.default_rng(0))
+    distritos = [(f"Zona {j + 1}", zona) for zonas_municipio in zonas for j, zona in enumerate(zonas_municipio)]
+    # Con esta semilla alguna celda del peine queda partida por los dientes
+    assert any(zona.geom_type == "MultiPolygon" for _, zona in distritos)
+    features = crear_features_zonas(distritos, "0/peine")
+    assert [feature["geometry"]["type"] for feature in features] == [zona.geom_type for _, zona in distritos]
+    fig, ax = plt.subplots()
+    dibujar_zonas(ax, distritos)
+    assert len(ax.patches) == sum(len(shapely.get_parts(zona)) for _, zona in distritos)
+    plt.close(fig)
+
+def test_biseccion_no_pierde_zonas_si_un_corte_no_separa_nada(monkeypatch):
+    import main
+    buscar_corte_area = main._buscar_corte_area
+    
+    # Los cortes verticales caen en el borde: la mitad izquierda se queda sin superficie
+    def corte_en_el_borde(poligono, fraccion, eje, *args, **kwargs):
+        if eje == 0:
+            return poligono.bounds[0]
+        return buscar_corte_area(poligono, fraccion, eje, *args, **kwargs)
+    
+    monkeypatch.setattr(main, "_buscar_corte_area", corte_en_el_borde)
+    rectangulo = shapely.box(0, 0, 8, 1)
+    zonas = main.dividir_poligono_biseccion(rectangulo, 6)
+    assert len(zonas) == 6
+    assert shapely.union_all(zonas).symmetric_difference(rectangulo).area < 1e-9
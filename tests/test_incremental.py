@@ -0,0 +1,17 @@
+import json
+from incremental import zonas_reutilizables
+
+def test_no_se_reutilizan_municipios_sin_zonas(tmp_path):
+    ruta = tmp_path / "comunidad.geojson"
+    ruta.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"id": "a-1"}, "geometry": None}
+    ]}), encoding="utf-8")
+    huellas = {"3417": {"parametros": {"metodo_division": "grid"}, "municipios": {
+        "34170000001": {"huella": "h1", "ids": ["a-1"]},
+        # Un municipio cuya división falló se quedaba anotado sin zonas
+        "34170000002": {"huella": "h2", "ids": []}
+    }}}
+    features, sin_cambios = zonas_reutilizables(huellas, "3417", {"metodo_division": "grid"},
+                                                ["34170000001", "34170000002"], ["h1", "h2"], str(ruta))
+    assert list(features) == [0]
+    assert not sin_cambios
@@ -0,0 +1,34 @@
+import geopandas as gpd
+import shapely
+from ingesta import leer_capa, _leer_shapefile
+from jerarquia import asignacion_guardada, cargar_asignacion, prefijo_comunidad
+
+def capas(tmp_path):
+    # La Rioja y Cantabria; el tercer municipio tiene un NATCODE sin comunidad pero está en La Rioja
+    gdf_ccaa = gpd.GeoDataFrame({"NATCODE": ["34170000000", "34060000000"], "NAMEUNIT": ["La Rioja", "Cantabria"]},
+                                geometry=[shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1)], crs="EPSG:4326")
+    gdf_municipios = gpd.GeoDataFrame({"NATCODE": ["34172626001", "34063939001", "34992626002"],
+                                       "NAMEUNIT": ["A", "B", "C"]},
+                                      geometry=[shapely.box(0, 0, 0.5, 1), shapely.box(1, 0, 2, 1),
+                                                shapely.box(0.5, 0, 1, 1)], crs="EPSG:4326")
+    ruta_ccaa, ruta_municipios = str(tmp_path / "ccaa.shp"), str(tmp_path / "municipios.shp")
+    gdf_ccaa.to_file(ruta_ccaa)
+    gdf_municipios.to_file(ruta_municipios)
+    return ruta_ccaa, ruta_municipios, gdf_ccaa, gdf_municipios
+
+def test_una_comunidad_lee_los_municipios_de_la_tabla_de_asignacion(tmp_path):
+    ruta_ccaa, ruta_municipios, gdf_ccaa, gdf_municipios = capas(tmp_path)
+    directorio = str(tmp_path / "cache_ingesta")
+    assert asignacion_guardada(ruta_ccaa, ruta_municipios, directorio) is None
+    asignacion = cargar_asignacion(ruta_ccaa, ruta_municipios, gdf_ccaa, gdf_municipios, directorio=directorio)
+    assert asignacion_guardada(ruta_ccaa, ruta_municipios, directorio) == asignacion
+    
+    natcodes = asignacion["34170000000"]
+    assert sorted(natcodes) == ["34172626001", "34992626002"]
+    prefijo = prefijo_comunidad("34170000000")
+    otros = [natcode for natcode in natcodes if not natcode.startswith(prefijo)]
+    # Desde la caché de ingesta y directamente del shapefile
+    leidos = leer_capa(ruta_municipios, ["NATCODE"], prefijo_natcode=prefijo, directorio=directorio, otros_natcodes=otros)
+    assert sorted(leidos["NATCODE"]) == sorted(natcodes)
+    leidos = _leer_shapefile(ruta_municipios, ["NATCODE"], True, prefijo, None, otros)
+    assert sorted(leidos["NATCODE"]) == sorted(natcodes)
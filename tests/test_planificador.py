@@ -0,0 +1,21 @@
+import numpy as np
+import shapely
+from planificador import municipios_elegibles_gpu
+from voronoi_utils import muestreo_en_gpu
+
+def municipio_real(lado_grados, vertices):
+    # Polígono dentado en EPSG:4326 con el tamaño y el detalle de un municipio del IGN
+    angulos = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    radios = lado_grados / 2 * (1 + 0.05 * np.sin(37 * angulos))
+    return shapely.Polygon(np.column_stack((-3.7 + radios * np.cos(angulos), 40.4 + radios * np.sin(angulos))))
+
+def test_municipios_de_tamano_real_pueden_ir_a_la_gpu():
+    # Unos 60 km² con 3000 vértices y 50 zonas: el muestreo compensa en GPU
+    grande = municipio_real(0.08, 3000)
+    assert muestreo_en_gpu(len(grande.exterior.coords), grande.area, 50)
+    # Un casco urbano de 0.5 km² con 3000 vértices tiene demasiados vértices por km²
+    denso = municipio_real(0.007, 3000)
+    assert not muestreo_en_gpu(len(denso.exterior.coords), denso.area, 50)
+    # Con pocos vértices se queda en CPU
+    sencillo = municipio_real(0.08, 12)
+    assert list(municipios_elegibles_gpu([grande, denso, sencillo], [50, 50, 50])) == [True, False, False]
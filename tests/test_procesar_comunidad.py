@@ -0,0 +1,77 @@
+import json
+import geopandas as gpd
+import shapely
+import main
+from incremental import huella_geometria, zonas_reutilizables
+
+CODIGO_CCAA = "34170000000"
+NATCODES = ["34172626001", "34172626002", "34172626003"]
+
+def capas_comunidad():
+    # Tres municipios de 0.01° x 0.01° (unos 1.2 km², 5 zonas cada uno) ya asignados a la comunidad
+    municipios = [shapely.box(i * 0.01, 0, (i + 1) * 0.01, 0.01) for i in range(3)]
+    gdf_ccaa = gpd.GeoDataFrame({"NATCODE": [CODIGO_CCAA], "NAMEUNIT": ["La Rioja"]},
+                                geometry=[shapely.union_all(municipios)], crs="EPSG:4326")
+    gdf_municipios = gpd.GeoDataFrame({"NATCODE": NATCODES, "NAMEUNIT": ["A", "B", "C"],
+                                       "CODIGO_CCAA": [CODIGO_CCAA] * 3},
+                                      geometry=municipios, crs="EPSG:4326")
+    return gdf_ccaa, gdf_municipios
+
+def sin_zonas_en(natcode_vacio, monkeypatch):
+    # El municipio natcode_vacio se divide sin producir zonas
+    dividir = main.dividir_municipio_con_limite
+    
+    def dividir_municipio(nombre_municipio, geometria, natcode=None, **opciones):
+        if natcode == natcode_vacio:
+            return [], False
+        return dividir(nombre_municipio, geometria, natcode=natcode, **opciones)
+    
+    monkeypatch.setattr(main, "dividir_municipio_con_limite", dividir_municipio)
+
+def test_procesar_comunidad_anota_la_tabla_de_huellas(tmp_path, monkeypatch):
+    gdf_ccaa, gdf_municipios = capas_comunidad()
+    sin_zonas_en(NATCODES[2], monkeypatch)
+    huellas = {}
+    ruta = main.procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, CODIGO_CCAA, str(tmp_path), "grid",
+                                            semilla=0, huellas=huellas)
+    
+    with open(ruta, encoding="utf-8") as f:
+        ids = [feature["properties"]["id"] for feature in json.load(f)["features"]]
+    municipios = huellas[CODIGO_CCAA]["municipios"]
+    # El municipio sin zonas no se anota, así que se recalcula en la próxima ejecución
+    assert list(municipios) == NATCODES[:2]
+    assert sum(len(entrada["ids"]) for entrada in municipios.values()) == len(ids)
+    
+    # El modo incremental con los mismos parámetros reutiliza los municipios anotados
+    parametros = dict(main.parametros_particion({"metodo_division": "grid"}, None), semilla=0)
+    features, sin_cambios = zonas_reutilizables(huellas, CODIGO_CCAA, parametros, NATCODES,
+                                                [huella_geometria(g) for g in gdf_municipios.geometry], ruta)
+    assert list(features) == [0, 1]
+    assert not sin_cambios
+
+def test_procesar_comunidad_guarda_en_la_cache_los_municipios_con_zonas(tmp_path, monkeypatch):
+    from cache_particiones import abrir_cache, cerrar_cache, clave_particion
+    gdf_ccaa, gdf_municipios = capas_comunidad()
+    sin_zonas_en(NATCODES[1], monkeypatch)
+    guardados = []
+    guardar = main.guardar_municipio_cache
+    
+    def guardar_municipio_cache(cache, clave, nombre_municipio, distritos):
+        guardados.append(nombre_municipio)
+        guardar(cache, clave, nombre_municipio, distritos)
+    
+    monkeypatch.setattr(main, "guardar_municipio_cache", guardar_municipio_cache)
+    cache = abrir_cache(str(tmp_path / "cache"))
+    try:
+        main.procesar_comunidad_autonoma(gdf_ccaa, gdf_municipios, CODIGO_CCAA, str(tmp_path), "grid",
+                                         cache=cache, semilla=0)
+        
+        # El primer municipio también se guarda; el que no tiene zonas, no
+        assert guardados == ["A", "C"]
+        opciones = {"metodo_division": "grid", "semilla": 0}
+        claves = {clave_particion(geometria, main.parametros_particion(opciones, main.calcular_num_zonas(geometria)))
+                  for geometria in gdf_municipios.geometry[[0, 2]]}
+        filas = {clave for (clave,) in cache["conexion"].execute("SELECT clave FROM particiones")}
+        assert filas == claves
+    finally:
+        cerrar_cache(cache)
@@ -1,49 +1,537 @@
+import hashlib
+import math
+import time
 import numpy as np
-from scipy.spatial import Voronoi
-from shapely.geometry import Polygon, MultiPolygon, Point
-import random
+import shapely
+from scipy.spatial import Voronoi, cKDTree
+from shapely.geometry import Polygon, MultiPolygon
 
-def generar_puntos_dentro_poligono(poligono, n_puntos):
+# Tamaño máximo de cada lote de puntos candidatos (limita el uso de memoria)
+TAMANO_LOTE_MAXIMO = 200000
+
+# Proporción mínima área/bounding box considerada al dimensionar los lotes
+PROPORCION_MINIMA = 0.001
+
+# Desplazamiento máximo de las semillas (relativo al tamaño medio de una celda)
+# por debajo del cual se considera que la relajación de Lloyd ha convergido
+TOLERANCIA_LLOYD_RELATIVA = 0.001
+
+# Puntos de muestra por semilla y máximo de iteraciones para el CVT discreto
+MUESTRAS_POR_SEMILLA_CVT = 100
+ITERACIONES_CVT = 10
+
+# Contadores de la división: celdas recortadas, recortes evitados por ser
+# celdas interiores, relajaciones (Lloyd y CVT) e iteraciones usadas en ellas
+ESTADISTICAS = {"celdas": 0, "recortes_evitados": 0, "relajaciones": 0, "iteraciones_lloyd": 0,
+                "relajaciones_cvt": 0, "iteraciones_cvt": 0}
+
+# Criterio del muestreo en GPU: con menos vértices o semillas, o con más vértices por
+# km², la transferencia a la GPU no compensa y se muestrea en CPU
+VERTICES_MINIMOS_GPU = 20
+PUNTOS_MINIMOS_GPU = 10
+COMPLEJIDAD_MAXIMA_GPU = 1000
+
+# Conversión aproximada de grados² (EPSG:4326) a km², como en main.calcular_num_zonas
+KM2_POR_GRADO2 = 111 * 111
+
+# Filtro de pertenencia por aristas (GPU): elementos punto x arista por bloque y distancia,
+# relativa al tamaño del polígono, por debajo de la cual el resultado se comprueba con shapely
+ELEMENTOS_MAXIMOS_FILTRO = 4000000
+TOLERANCIA_FILTRO_RELATIVA = 1e-9
+
+def muestreo_en_gpu(vertices_exterior, area, n_puntos):
+    """
+    Indica si el muestreo de semillas de un polígono se hace en GPU
+    
+    Acepta escalares o arrays de NumPy (un elemento por polígono).
+    
+    Args:
+        vertices_exterior: Número de vértices del anillo exterior
+        area: Área del polígono en grados² (EPSG:4326); la complejidad se mide en vértices por km²
+        n_puntos: Número de semillas a generar
+    
+    Returns:
+        bool (o array de bool)
+    """
+    vertices_exterior = np.asarray(vertices_exterior, dtype=float)
+    area = np.asarray(area, dtype=float) * KM2_POR_GRADO2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        complejidad = np.where(area > 0, vertices_exterior / np.where(area > 0, area, 1), np.inf)
+    return ((vertices_exterior >= VERTICES_MINIMOS_GPU) & (np.asarray(n_puntos) >= PUNTOS_MINIMOS_GPU)
+            & (complejidad <= COMPLEJIDAD_MAXIMA_GPU))
+
+# Instante (time.monotonic) en que se agota el tiempo de la división en curso (None sin límite)
+LIMITE_TIEMPO = {"fin": None}
+
+class TiempoAgotado(BaseException):
+    """
+    Se lanza cuando la división de un municipio supera su límite de tiempo.
+    
+    Hereda de BaseException para que no la capturen los "except Exception" que,
+    dentro de la división, recurren a otros métodos en caso de error.
+    """
+
+def fijar_limite_tiempo(segundos):
+    """
+    Fija el límite de tiempo de la división en curso
+    
+    Args:
+        segundos: Tiempo disponible a partir de ahora (None para quitar el límite)
+    """
+    LIMITE_TIEMPO["fin"] = None if segundos is None else time.monotonic() + segundos
+
+def comprobar_limite_tiempo():
+    """
+    Lanza TiempoAgotado si se ha superado el límite fijado con fijar_limite_tiempo
+    """
+    if LIMITE_TIEMPO["fin"] is not None and time.monotonic() > LIMITE_TIEMPO["fin"]:
+        raise TiempoAgotado()
+
+def crear_generador(semilla, clave):
+    """
+    Crea un generador aleatorio propio de una unidad de trabajo (un municipio
+    o una comunidad autónoma).
+    
+    El flujo de números depende solo de la semilla global y de la clave, no del
+    proceso ni del orden en que se procese la unidad, de modo que el resultado
+    es idéntico con cualquier número de trabajadores.
+    
+    Args:
+        semilla: Semilla global (entero no negativo)
+        clave: Identificador de la unidad, normalmente su NATCODE
+    
+    Returns:
+        numpy.random.Generator
+    """
+    resumen = hashlib.sha256(str(clave).encode("utf-8")).digest()
+    return np.random.default_rng([int(semilla), int.from_bytes(resumen[:8], "little")])
+
+def generar_puntos_dentro_poligono(poligono, n_puntos, rng=None, filtro=None):
     """
     Genera n_puntos puntos aleatorios dentro del polígono.
     
+    Los puntos se generan por lotes de NumPy dentro del bounding box y se
+    filtran todos a la vez con shapely.contains_xy sobre la geometría
+    preparada. El tamaño de cada lote se estima a partir de la proporción
+    entre el área del polígono y la de su bounding box.
+    
     Args:
         poligono: Polígono (shapely.geometry.Polygon)
         n_puntos: Número de puntos a generar
+        rng: Generador aleatorio (numpy.random.Generator); None usa el estado global de NumPy
+        filtro: Función (x, y) -> array de bool que sustituye a shapely.contains_xy con el
+            mismo resultado (por ejemplo, el de crear_filtro_contiene en GPU); los candidatos
+            son los mismos, así que los puntos también
     
     Returns:
-        Lista de puntos (x, y)
+        Array NumPy de forma (n, 2) con los puntos (x, y); n puede ser menor
+        que n_puntos si se agota el límite de intentos
     """
+    generador = np.random if rng is None else rng
+    puntos = np.empty((0, 2))
+    if n_puntos <= 0 or poligono.is_empty:
+        return puntos
+    
     # Obtener bounding box del polígono
     minx, miny, maxx, maxy = poligono.bounds
+    area_bbox = (maxx - minx) * (maxy - miny)
+    if area_bbox <= 0:
+        return puntos
+    
+    # Proporción esperada de aceptación de cada punto
+    proporcion = max(poligono.area / area_bbox, PROPORCION_MINIMA)
     
-    # Lista para almacenar los puntos generados
-    puntos = []
+    # Preparar la geometría para acelerar los tests de pertenencia
+    shapely.prepare(poligono)
+    
+    lotes = []
+    aceptados = 0
     intentos_maximos = n_puntos * 1000  # Límite de intentos para evitar bucles infinitos
     intentos = 0
     
-    # Generar puntos aleatorios dentro del polígono
-    while len(puntos) < n_puntos and intentos < intentos_maximos:
-        # Generar punto aleatorio dentro del bounding box
-        x = random.uniform(minx, maxx)
-        y = random.uniform(miny, maxy)
-        punto = Point(x, y)
+    while aceptados < n_puntos and intentos < intentos_maximos:
+        comprobar_limite_tiempo()
+        
+        # Tamaño de lote suficiente para obtener los puntos que faltan con margen
+        faltan = n_puntos - aceptados
+        tamano_lote = int(math.ceil(faltan / proporcion * 1.2)) + 16
+        tamano_lote = min(tamano_lote, TAMANO_LOTE_MAXIMO, intentos_maximos - intentos)
         
-        # Verificar si el punto está dentro del polígono
-        if poligono.contains(punto):
-            puntos.append((x, y))
+        x = generador.uniform(minx, maxx, tamano_lote)
+        y = generador.uniform(miny, maxy, tamano_lote)
         
-        intentos += 1
+        # Verificar todos los puntos del lote a la vez
+        dentro = shapely.contains_xy(poligono, x, y) if filtro is None else filtro(x, y)
+        if dentro.any():
+            lote = np.column_stack((x[dentro], y[dentro]))[:faltan]
+            lotes.append(lote)
+            aceptados += len(lote)
+        
+        intentos += tamano_lote
+    
+    if not lotes:
+        return puntos
+    
+    return np.concatenate(lotes)
+
+def aristas_poligono(poligono):
+    """
+    Aristas de todos los anillos (exterior e interiores) de un polígono
+    
+    Returns:
+        Array NumPy de forma (m, 4) con (x0, y0, x1, y1) por arista
+    """
+    aristas = []
+    for anillo in shapely.get_rings(poligono):
+        coordenadas = shapely.get_coordinates(anillo)
+        aristas.append(np.hstack((coordenadas[:-1], coordenadas[1:])))
+    return np.concatenate(aristas) if aristas else np.empty((0, 4))
+
+def contiene_xy_aristas(xp, aristas, x, y, tolerancia):
+    """
+    Regla par-impar (número de cruces de un rayo horizontal) para muchos puntos a la vez
+    
+    Funciona con NumPy o con CuPy (xp), en bloques de ELEMENTOS_MAXIMOS_FILTRO
+    elementos punto x arista. Además del resultado marca los puntos dudosos: los que
+    están a menos de la tolerancia de una arista en horizontal o de la altura de un
+    vértice, donde el redondeo podría cambiarlo.
+    
+    Args:
+        xp: Módulo de arrays (numpy o cupy)
+        aristas: Array (m, 4) de aristas_poligono en el módulo xp
+        x, y: Arrays de coordenadas en el módulo xp
+        tolerancia: Distancia por debajo de la cual un punto es dudoso
+    
+    Returns:
+        Tupla de arrays de bool del módulo xp (dentro, dudosos)
+    """
+    x0, y0, x1, y1 = aristas[:, 0], aristas[:, 1], aristas[:, 2], aristas[:, 3]
+    pendiente = xp.where(y1 != y0, (x1 - x0) / xp.where(y1 != y0, y1 - y0, 1), 0)
+    alturas = xp.concatenate((y0, y1))
+    dentro = xp.zeros(len(x), dtype=bool)
+    dudosos = xp.zeros(len(x), dtype=bool)
+    bloque = max(1, ELEMENTOS_MAXIMOS_FILTRO // max(1, len(aristas)))
+    for inicio in range(0, len(x), bloque):
+        px = x[inicio:inicio + bloque, None]
+        py = y[inicio:inicio + bloque, None]
+        cruza = (y0 > py) != (y1 > py)
+        corte = x0 + (py - y0) * pendiente
+        dentro[inicio:inicio + bloque] = (xp.count_nonzero(cruza & (px < corte), axis=1) % 2) == 1
+        dudosos[inicio:inicio + bloque] = (xp.any(cruza & (xp.abs(px - corte) <= tolerancia), axis=1)
+                                           | xp.any(xp.abs(py - alturas) <= tolerancia, axis=1))
+    return dentro, dudosos
+
+def crear_filtro_contiene(poligono, xp=np, a_numpy=np.asarray):
+    """
+    Filtro de pertenencia para generar_puntos_dentro_poligono calculado con el módulo xp
+    
+    Devuelve exactamente lo mismo que shapely.contains_xy: los puntos dudosos para la
+    regla par-impar (ver contiene_xy_aristas) se comprueban con shapely.
+    
+    Args:
+        poligono: Polígono (shapely.geometry.Polygon)
+        xp: Módulo de arrays en el que se filtra (numpy o cupy)
+        a_numpy: Función que copia un array de xp a NumPy
+    
+    Returns:
+        Función (x, y) -> array NumPy de bool
+    """
+    aristas = xp.asarray(aristas_poligono(poligono))
+    minx, miny, maxx, maxy = poligono.bounds
+    tolerancia = TOLERANCIA_FILTRO_RELATIVA * max(maxx - minx, maxy - miny)
+    
+    def filtro(x, y):
+        dentro, dudosos = contiene_xy_aristas(xp, aristas, xp.asarray(x), xp.asarray(y), tolerancia)
+        dentro = np.array(a_numpy(dentro), dtype=bool)
+        dudosos = np.asarray(a_numpy(dudosos), dtype=bool)
+        if dudosos.any():
+            dentro[dudosos] = shapely.contains_xy(poligono, x[dudosos], y[dudosos])
+        return dentro
+    
+    return filtro
+
+def _es_triangulo(poligono):
+    """
+    Indica si un polígono es un triángulo simple (sin agujeros)
+    """
+    return len(poligono.interiors) == 0 and len(poligono.exterior.coords) == 4
+
+def _triangular_por_franjas(poligono):
+    """
+    Triangula exactamente un polígono cortándolo en franjas horizontales a la
+    altura de cada uno de sus vértices. Dentro de una franja no hay vértices,
+    así que cada pieza es un trapecio (convexo) que se triangula en abanico.
+    
+    Args:
+        poligono: Polígono a triangular (shapely.geometry.Polygon)
+    
+    Returns:
+        Lista de triángulos (shapely.geometry.Polygon)
+    """
+    alturas = np.unique(shapely.get_coordinates(poligono)[:, 1])
+    if len(alturas) < 2:
+        return []
+    minx, _, maxx, _ = poligono.bounds
+    franjas = shapely.box(minx, alturas[:-1], maxx, alturas[1:])
+    piezas = shapely.get_parts(shapely.intersection(franjas, poligono))
+    piezas = piezas[(shapely.get_type_id(piezas) == 3) & (shapely.area(piezas) > 0)]
+    
+    triangulos = []
+    for pieza in piezas:
+        vertices = shapely.get_coordinates(pieza.exterior)[:-1]
+        for i in range(1, len(vertices) - 1):
+            triangulo = shapely.Polygon([vertices[0], vertices[i], vertices[i + 1]])
+            # Los vértices colineales que deja el recorte dan triángulos degenerados
+            if triangulo.area > 0:
+                triangulos.append(triangulo)
+    return triangulos
+
+def _triangular_por_recorte(poligono, profundidad=3):
+    """
+    Triangula un polígono con Delaunay recortando los triángulos que se salen
+    de él. Las piezas recortadas que no son triángulos se vuelven a triangular
+    hasta agotar la profundidad; a partir de ahí se triangulan exactamente por
+    franjas, de modo que los triángulos cubren el polígono sin salirse de él.
+    
+    Args:
+        poligono: Polígono a triangular (shapely.geometry.Polygon)
+        profundidad: Número máximo de niveles de re-triangulación
+    
+    Returns:
+        Lista de triángulos (shapely.geometry.Polygon)
+    """
+    triangulos = shapely.get_parts(shapely.delaunay_triangles(poligono))
+    if len(triangulos) == 0:
+        return []
+    
+    shapely.prepare(poligono)
+    dentro = shapely.within(triangulos, poligono)
+    resultado = list(triangulos[dentro])
+    
+    # Recortar los triángulos que cruzan el borde y quedarse con las partes poligonales
+    piezas = shapely.get_parts(shapely.intersection(triangulos[~dentro], poligono))
+    piezas = piezas[(shapely.get_type_id(piezas) == 3) & (shapely.area(piezas) > 0)]
+    
+    for pieza in piezas:
+        if _es_triangulo(pieza):
+            resultado.append(pieza)
+        elif profundidad > 0:
+            resultado.extend(_triangular_por_recorte(pieza, profundidad - 1))
+        else:
+            resultado.extend(_triangular_por_franjas(pieza))
+    
+    return resultado
+
+def triangular_poligono(poligono):
+    """
+    Descompone un polígono en triángulos que lo cubren sin solaparse.
+    
+    Usa la triangulación de Delaunay restringida de GEOS cuando está disponible
+    (shapely >= 2.1) y, si no, una triangulación de Delaunay recortada.
+    
+    Args:
+        poligono: Polígono a triangular (shapely.geometry.Polygon o MultiPolygon)
+    
+    Returns:
+        Array NumPy de forma (m, 3, 2) con los vértices de cada triángulo
+    """
+    if poligono.is_empty:
+        return np.empty((0, 3, 2))
+    
+    if hasattr(shapely, "constrained_delaunay_triangles"):
+        triangulos = shapely.get_parts(shapely.constrained_delaunay_triangles(poligono))
+    else:
+        partes = shapely.get_parts(poligono)
+        triangulos = [t for parte in partes for t in _triangular_por_recorte(parte)]
+    
+    if len(triangulos) == 0:
+        return np.empty((0, 3, 2))
+    
+    # Cada triángulo tiene 4 coordenadas (la última repite la primera)
+    return shapely.get_coordinates(triangulos).reshape(-1, 4, 2)[:, :3]
+
+def generar_puntos_triangulacion(poligono, n_puntos, triangulos=None, rng=None):
+    """
+    Genera n_puntos puntos aleatorios uniformes dentro del polígono sin
+    rechazo: elige triángulos en proporción a su área y muestrea
+    uniformemente dentro de cada uno con coordenadas baricéntricas.
+    
+    El coste por punto es constante sea cual sea la forma del polígono, por lo
+    que es adecuado para archipiélagos, franjas costeras y otros polígonos que
+    ocupan una fracción mínima de su bounding box.
+    
+    Args:
+        poligono: Polígono (shapely.geometry.Polygon o MultiPolygon)
+        n_puntos: Número de puntos a generar
+        triangulos: Triangulación ya calculada con triangular_poligono (opcional)
+        rng: Generador aleatorio (numpy.random.Generator); None usa el estado global de NumPy
+    
+    Returns:
+        Array NumPy de forma (n, 2) con los puntos (x, y)
+    """
+    generador = np.random if rng is None else rng
+    if n_puntos <= 0:
+        return np.empty((0, 2))
+    
+    if triangulos is None:
+        triangulos = triangular_poligono(poligono)
+    
+    if len(triangulos) == 0:
+        return np.empty((0, 2))
+    
+    a = triangulos[:, 0]
+    ab = triangulos[:, 1] - a
+    ac = triangulos[:, 2] - a
+    areas = 0.5 * np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+    area_total = areas.sum()
+    if area_total <= 0:
+        return np.empty((0, 2))
+    
+    # Elegir triángulo en proporción a su área
+    indices = generador.choice(len(areas), size=n_puntos, p=areas / area_total)
+    
+    # Muestreo uniforme en el triángulo reflejando los puntos del paralelogramo
+    r1 = generador.random(n_puntos)
+    r2 = generador.random(n_puntos)
+    fuera = r1 + r2 > 1
+    r1[fuera] = 1 - r1[fuera]
+    r2[fuera] = 1 - r2[fuera]
+    
+    return a[indices] + r1[:, None] * ab[indices] + r2[:, None] * ac[indices]
+
+def generar_semillas(poligono, n_puntos, iteraciones=0, tolerancia=None, metodo_relajacion="lloyd", rng=None,
+                     filtro=None):
+    """
+    Genera y relaja las semillas de Voronoi de un polígono
+    
+    Es el muestreo de todos los procesos (CPU y GPU, real o simulada): con el mismo
+    generador aleatorio las semillas son las mismas, filtre quien filtre los candidatos.
+    
+    Args:
+        poligono: Polígono (shapely.geometry.Polygon)
+        n_puntos: Número de semillas
+        iteraciones: Máximo de iteraciones de relajación (0 para no relajar)
+        tolerancia: Desplazamiento máximo para detener antes las iteraciones (opcional)
+        metodo_relajacion: 'lloyd' (geométrico) o 'cvt' (k-means sobre muestras densas)
+        rng: Generador aleatorio (numpy.random.Generator); None usa el estado global de NumPy
+        filtro: Filtro de pertenencia de los candidatos (ver generar_puntos_dentro_poligono)
+    
+    Returns:
+        Array NumPy de forma (n, 2) con las semillas
+    """
+    puntos = generar_puntos_dentro_poligono(poligono, n_puntos, rng, filtro)
     
+    # Si el muestreo por rechazo no alcanza (polígonos muy irregulares), usar triangulación
+    if len(puntos) < n_puntos:
+        print(f"Advertencia: Muestreo por rechazo insuficiente ({len(puntos)}/{n_puntos} puntos). Usando triangulación.")
+        puntos = generar_puntos_triangulacion(poligono, n_puntos, rng=rng)
+    
+    # Relajación de las semillas (se detiene antes si convergen)
+    if iteraciones > 0 and len(puntos) > 2:
+        if metodo_relajacion == "cvt":
+            puntos, _ = relajar_cvt(puntos, poligono, iteraciones, tolerancia, rng=rng)
+        else:
+            puntos, _ = relajar_lloyd(puntos, poligono, iteraciones, tolerancia)
     return puntos
 
-def poligonos_voronoi(puntos, poligono_limite):
+def _puntos_envolventes(minx, miny, maxx, maxy):
+    """
+    Puntos adicionales alrededor del bounding box que cierran las regiones de
+    Voronoi de los puntos interiores
+    """
+    ancho = maxx - minx
+    alto = maxy - miny
+    return [
+        (minx - ancho, miny - alto),
+        (minx - ancho, maxy + alto),
+        (maxx + ancho, miny - alto),
+        (maxx + ancho, maxy + alto),
+        (minx - ancho, (miny + maxy) / 2),
+        (maxx + ancho, (miny + maxy) / 2),
+        ((minx + maxx) / 2, miny - alto),
+        ((minx + maxx) / 2, maxy + alto)
+    ]
+
+def reiniciar_estadisticas():
+    """
+    Pone a cero los contadores de la división
+    """
+    for clave in ESTADISTICAS:
+        ESTADISTICAS[clave] = 0
+
+def obtener_estadisticas():
+    """
+    Devuelve una copia de los contadores de la división
+    
+    Returns:
+        dict con las celdas recortadas, los recortes evitados, las relajaciones
+        de Lloyd y CVT ejecutadas y el total de iteraciones que han usado
+    """
+    return dict(ESTADISTICAS)
+
+def recortar_celdas(celdas, poligono_limite):
+    """
+    Recorta celdas por el polígono límite evitando la intersección en las
+    celdas que están completamente en su interior.
+    
+    Las celdas se clasifican con la geometría límite preparada: las
+    interiores se devuelven tal cual y solo las que cruzan el borde se
+    recortan, todas en una única llamada vectorizada.
+    
+    Args:
+        celdas: Secuencia de polígonos (puede contener None)
+        poligono_limite: Polígono que limita las celdas
+    
+    Returns:
+        Array de geometrías recortadas, en el mismo orden que celdas
+    """
+    celdas = np.asarray(celdas, dtype=object)
+    if len(celdas) == 0:
+        return celdas
+    
+    shapely.prepare(poligono_limite)
+    interiores = shapely.contains_properly(poligono_limite, celdas)
+    
+    recortadas = celdas.copy()
+    frontera = ~interiores
+    if frontera.any():
+        recortadas[frontera] = shapely.intersection(celdas[frontera], poligono_limite)
+    
+    ESTADISTICAS["celdas"] += len(celdas)
+    ESTADISTICAS["recortes_evitados"] += int(interiores.sum())
+    
+    return recortadas
+
+def _poligonos_voronoi_geos(puntos, poligono_limite):
+    """
+    Genera el diagrama de Voronoi con GEOS (shapely.voronoi_polygons) extendido
+    hasta el polígono límite y recorta todas las celdas con una única llamada
+    vectorizada a shapely.intersection.
+    
+    Args:
+        puntos: Array de puntos (n, 2)
+        poligono_limite: Polígono que limita las regiones (shapely.geometry.Polygon)
+    
+    Returns:
+        Lista de polígonos correspondientes a las regiones de Voronoi
+    """
+    diagrama = shapely.voronoi_polygons(shapely.multipoints(puntos), extend_to=poligono_limite)
+    celdas = shapely.get_parts(diagrama)
+    
+    # Recortar solo las celdas que cruzan el borde
+    recortadas = shapely.get_parts(recortar_celdas(celdas, poligono_limite))
+    
+    # Quedarse solo con las partes poligonales no vacías
+    return [geom for geom in recortadas if isinstance(geom, Polygon) and not geom.is_empty]
+
+def poligonos_voronoi(puntos, poligono_limite, motor="scipy"):
     """
     Genera un diagrama de Voronoi y recorta las regiones por el polígono límite.
     
     Args:
         puntos: Lista de puntos (x, y)
         poligono_limite: Polígono que limita las regiones (shapely.geometry.Polygon)
+        motor: Motor de cálculo del diagrama ('scipy' o 'geos')
     
     Returns:
         Lista de polígonos correspondientes a las regiones de Voronoi
@@ -52,27 +540,18 @@ def poligonos_voronoi(puntos, poligono_limite):
     if len(puntos) <= 1:
         return [poligono_limite]
     
+    if motor == "geos":
+        regiones_voronoi = _poligonos_voronoi_geos(np.asarray(puntos), poligono_limite)
+        return regiones_voronoi if regiones_voronoi else [poligono_limite]
+    
     # Convertir puntos a array numpy
     puntos_np = np.array(puntos)
     
     # Obtener bounding box del polígono
     minx, miny, maxx, maxy = poligono_limite.bounds
     
-    # Calcular el tamaño del bounding box
-    ancho = maxx - minx
-    alto = maxy - miny
-    
     # Crear puntos adicionales fuera del polígono para cerrar regiones de Voronoi
-    puntos_adicionales = [
-        (minx - ancho, miny - alto),
-        (minx - ancho, maxy + alto),
-        (maxx + ancho, miny - alto),
-        (maxx + ancho, maxy + alto),
-        (minx - ancho, (miny + maxy) / 2),
-        (maxx + ancho, (miny + maxy) / 2),
-        ((minx + maxx) / 2, miny - alto),
-        ((minx + maxx) / 2, maxy + alto)
-    ]
+    puntos_adicionales = _puntos_envolventes(minx, miny, maxx, maxy)
     
     # Añadir puntos adicionales
     puntos_voronoi = np.vstack([puntos_np, puntos_adicionales])
@@ -80,10 +559,8 @@ def poligonos_voronoi(puntos, poligono_limite):
     # Calcular diagrama de Voronoi
     vor = Voronoi(puntos_voronoi)
     
-    # Lista para almacenar las regiones de Voronoi
-    regiones_voronoi = []
-    
-    # Procesar regiones de Voronoi para los puntos originales (no los adicionales)
+    # Polígonos de las regiones de Voronoi de los puntos originales (no los adicionales)
+    celdas = []
     for i in range(len(puntos)):
         # Obtener región de Voronoi para el punto i
         region_index = vor.point_region[i]
@@ -91,26 +568,266 @@ def poligonos_voronoi(puntos, poligono_limite):
         
         # Verificar si la región es válida
         if -1 not in region_vertices and len(region_vertices) > 0:
-            # Obtener coordenadas de los vértices
-            polygon_vertices = [vor.vertices[v] for v in region_vertices]
-            
-            # Crear polígono
-            poligono_voronoi = Polygon(polygon_vertices)
-            
-            # Intersectar con el polígono límite
-            region_recortada = poligono_voronoi.intersection(poligono_limite)
-            
-            # Añadir a la lista si la intersección es válida
-            if not region_recortada.is_empty:
-                if isinstance(region_recortada, Polygon):
-                    regiones_voronoi.append(region_recortada)
-                elif isinstance(region_recortada, MultiPolygon):
-                    # Si la intersección es un multipolígono, añadir cada parte
-                    for geom in region_recortada.geoms:
-                        regiones_voronoi.append(geom)
+            celdas.append(Polygon(vor.vertices[region_vertices]))
+    
+    # Intersectar con el polígono límite solo las celdas que cruzan su borde
+    regiones_voronoi = []
+    for region_recortada in recortar_celdas(celdas, poligono_limite):
+        # Añadir a la lista si la intersección es válida
+        if not region_recortada.is_empty:
+            if isinstance(region_recortada, Polygon):
+                regiones_voronoi.append(region_recortada)
+            elif isinstance(region_recortada, MultiPolygon):
+                # Si la intersección es un multipolígono, añadir cada parte
+                for geom in region_recortada.geoms:
+                    regiones_voronoi.append(geom)
     
     # Si no se generaron regiones, devolver el polígono original
     if not regiones_voronoi:
         return [poligono_limite]
     
-    return regiones_voronoi 
\ No newline at end of file
+    return regiones_voronoi
+
+def _celdas_voronoi(puntos, minx, miny, maxx, maxy):
+    """
+    Calcula las celdas de Voronoi de los puntos, cerradas con los puntos
+    envolventes del bounding box, construyendo todos los polígonos a la vez.
+    
+    Args:
+        puntos: Array de puntos (n, 2)
+        minx, miny, maxx, maxy: Bounding box de la zona a cubrir
+    
+    Returns:
+        Array de polígonos (None para las regiones no válidas), uno por punto
+    """
+    vor = Voronoi(np.vstack([puntos, _puntos_envolventes(minx, miny, maxx, maxy)]))
+    
+    regiones = [vor.regions[vor.point_region[i]] for i in range(len(puntos))]
+    validas = np.array([-1 not in region and len(region) > 2 for region in regiones])
+    
+    celdas = np.full(len(puntos), None, dtype=object)
+    if validas.any():
+        regiones_validas = [region for region, valida in zip(regiones, validas) if valida]
+        vertices = vor.vertices[np.concatenate(regiones_validas)]
+        indices = np.repeat(np.arange(len(regiones_validas)), [len(region) for region in regiones_validas])
+        celdas[validas] = shapely.polygons(shapely.linearrings(vertices, indices=indices))
+    
+    return celdas
+
+def relajar_lloyd(puntos, poligono_limite, iteraciones_maximas=5, tolerancia=None):
+    """
+    Relajación de Lloyd: mueve cada semilla al centroide de su celda de Voronoi
+    recortada por el polígono límite, con celdas y centroides calculados en
+    llamadas vectorizadas de shapely.
+    
+    Se detiene antes de iteraciones_maximas si el desplazamiento máximo de las
+    semillas en una iteración es inferior a la tolerancia.
+    
+    Args:
+        puntos: Puntos iniciales (x, y)
+        poligono_limite: Polígono que limita las regiones
+        iteraciones_maximas: Número máximo de iteraciones
+        tolerancia: Desplazamiento máximo para considerar convergencia, en
+            unidades de coordenadas (por defecto, TOLERANCIA_LLOYD_RELATIVA
+            veces el lado de una celda media)
+    
+    Returns:
+        Tupla (array (n, 2) de puntos optimizados, iteraciones usadas)
+    """
+    puntos = np.array(puntos, dtype=float)
+    if len(puntos) <= 2 or iteraciones_maximas <= 0:
+        return puntos, 0
+    
+    if tolerancia is None:
+        tolerancia = TOLERANCIA_LLOYD_RELATIVA * math.sqrt(poligono_limite.area / len(puntos))
+    
+    minx, miny, maxx, maxy = poligono_limite.bounds
+    iteraciones = 0
+    
+    while iteraciones < iteraciones_maximas:
+        iteraciones += 1
+        comprobar_limite_tiempo()
+        
+        # Celdas recortadas y sus centroides, todo en lote
+        recortadas = recortar_celdas(_celdas_voronoi(puntos, minx, miny, maxx, maxy), poligono_limite)
+        centroides = shapely.centroid(recortadas)
+        
+        # Las semillas sin celda válida se quedan donde están
+        validos = ~(shapely.is_missing(centroides) | shapely.is_empty(centroides))
+        nuevos_puntos = puntos.copy()
+        nuevos_puntos[validos] = shapely.get_coordinates(centroides[validos])
+        
+        desplazamiento = np.sqrt(((nuevos_puntos - puntos) ** 2).sum(axis=1)).max()
+        puntos = nuevos_puntos
+        
+        if desplazamiento < tolerancia:
+            break
+    
+    ESTADISTICAS["relajaciones"] += 1
+    ESTADISTICAS["iteraciones_lloyd"] += iteraciones
+    
+    return puntos, iteraciones
+
+def relajar_cvt(puntos, poligono_limite, iteraciones_maximas=ITERACIONES_CVT, tolerancia=None,
+                muestras_por_semilla=MUESTRAS_POR_SEMILLA_CVT, rng=None):
+    """
+    Voronoi centroidal discreto: k-means sobre una nube densa de puntos
+    uniformes dentro del polígono, asignando cada muestra a la semilla más
+    cercana con un cKDTree. No necesita intersecciones de polígonos; el
+    recorte se hace una sola vez al generar el diagrama final.
+    
+    Args:
+        puntos: Puntos iniciales (x, y)
+        poligono_limite: Polígono que limita las regiones
+        iteraciones_maximas: Número máximo de iteraciones de k-means
+        tolerancia: Desplazamiento máximo para considerar convergencia (por
+            defecto, TOLERANCIA_LLOYD_RELATIVA veces el lado de una celda media)
+        muestras_por_semilla: Tamaño de la nube de muestras por cada semilla
+        rng: Generador aleatorio de la nube de muestras (None usa el estado global de NumPy)
+    
+    Returns:
+        Tupla (array (n, 2) de puntos optimizados, iteraciones usadas)
+    """
+    puntos = np.array(puntos, dtype=float)
+    if len(puntos) <= 2 or iteraciones_maximas <= 0:
+        return puntos, 0
+    
+    if tolerancia is None:
+        tolerancia = TOLERANCIA_LLOYD_RELATIVA * math.sqrt(poligono_limite.area / len(puntos))
+    
+    # Nube densa de muestras uniformes, generada una sola vez
+    muestras = generar_puntos_triangulacion(poligono_limite, len(puntos) * muestras_por_semilla, rng=rng)
+    if len(muestras) == 0:
+        return puntos, 0
+    
+    iteraciones = 0
+    while iteraciones < iteraciones_maximas:
+        iteraciones += 1
+        comprobar_limite_tiempo()
+        
+        # Asignar cada muestra a su semilla más cercana
+        _, asignacion = cKDTree(puntos).query(muestras)
+        
+        # Nueva semilla = media de sus muestras (las semillas sin muestras no se mueven)
+        conteo = np.bincount(asignacion, minlength=len(puntos))
+        suma_x = np.bincount(asignacion, weights=muestras[:, 0], minlength=len(puntos))
+        suma_y = np.bincount(asignacion, weights=muestras[:, 1], minlength=len(puntos))
+        
+        nuevos_puntos = puntos.copy()
+        con_muestras = conteo > 0
+        nuevos_puntos[con_muestras, 0] = suma_x[con_muestras] / conteo[con_muestras]
+        nuevos_puntos[con_muestras, 1] = suma_y[con_muestras] / conteo[con_muestras]
+        
+        desplazamiento = np.sqrt(((nuevos_puntos - puntos) ** 2).sum(axis=1)).max()
+        puntos = nuevos_puntos
+        
+        if desplazamiento < tolerancia:
+            break
+    
+    ESTADISTICAS["relajaciones_cvt"] += 1
+    ESTADISTICAS["iteraciones_cvt"] += iteraciones
+    
+    return puntos, iteraciones
+
+def poligonos_voronoi_global(geometrias, num_zonas, rng=None):
+    """
+    Divide un conjunto de municipios (una comunidad autónoma o toda España)
+    con un único diagrama de Voronoi en lugar de uno por polígono.
+    
+    Las semillas de cada municipio se generan dentro de él según su número de
+    zonas; las celdas se asignan y recortan a los municipios mediante un
+    STRtree. Las partes de una celda que caen en otro municipio se unen a la
+    zona de la semilla más cercana de ese municipio, de modo que cada
+    municipio queda cubierto por completo con una zona por semilla. Una zona
+    cuya celda queda partida (municipios cóncavos o piezas ajenas separadas)
+    se devuelve como un único MultiPolygon, no como varias zonas.
+    
+    Args:
+        geometrias: Secuencia de geometrías de los municipios (Polygon o MultiPolygon)
+        num_zonas: Secuencia con el número de zonas de cada municipio
+        rng: Generador aleatorio de las semillas (None usa el estado global de NumPy)
+    
+    Returns:
+        Lista con, para cada municipio, la lista de polígonos (o MultiPolygon) de sus zonas
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    resultado = [[g] for g in geometrias]
+    
+    # Generar las semillas de todos los municipios en una sola pasada
+    semillas = []
+    propietarios = []
+    for i, (geometria, n_zonas) in enumerate(zip(geometrias, num_zonas)):
+        if n_zonas <= 1 or geometria.is_empty or not geometria.is_valid:
+            continue
+        puntos = generar_puntos_dentro_poligono(geometria, n_zonas, rng)
+        if len(puntos) < n_zonas:
+            puntos = generar_puntos_triangulacion(geometria, n_zonas, rng=rng)
+        if len(puntos) > 1:
+            semillas.append(puntos)
+            propietarios.append(np.full(len(puntos), i))
+    
+    if not semillas:
+        return resultado
+    
+    semillas = np.concatenate(semillas)
+    propietarios = np.concatenate(propietarios)
+    
+    # Un único diagrama de Voronoi cerrado con puntos envolventes
+    minx, miny, maxx, maxy = shapely.total_bounds(geometrias)
+    vor = Voronoi(np.vstack([semillas, _puntos_envolventes(minx, miny, maxx, maxy)]))
+    
+    celdas = np.empty(len(semillas), dtype=object)
+    for i in range(len(semillas)):
+        region_vertices = vor.regions[vor.point_region[i]]
+        if -1 not in region_vertices and len(region_vertices) > 2:
+            celdas[i] = Polygon(vor.vertices[region_vertices])
+    
+    # Emparejar celdas con los municipios que intersectan
+    arbol = shapely.STRtree(geometrias)
+    idx_celdas, idx_municipios = arbol.query(celdas, predicate="intersects")
+    
+    # Las celdas que quedan dentro de su municipio no necesitan recorte
+    shapely.prepare(geometrias)
+    interiores = shapely.contains_properly(geometrias[idx_municipios], celdas[idx_celdas])
+    piezas = celdas[idx_celdas]
+    if (~interiores).any():
+        piezas[~interiores] = shapely.intersection(celdas[idx_celdas[~interiores]], geometrias[idx_municipios[~interiores]])
+    ESTADISTICAS["celdas"] += len(piezas)
+    ESTADISTICAS["recortes_evitados"] += int(interiores.sum())
+    
+    # Semillas de cada municipio (para reasignar las piezas ajenas)
+    semillas_municipio = {}
+    for i, propietario in enumerate(propietarios):
+        semillas_municipio.setdefault(propietario, []).append(i)
+    
+    partes_zona = [[] for _ in range(len(semillas))]
+    for idx_celda, idx_municipio, pieza in zip(idx_celdas, idx_municipios, piezas):
+        if pieza is None or pieza.is_empty or pieza.area <= 0:
+            continue
+        if propietarios[idx_celda] == idx_municipio:
+            partes_zona[idx_celda].append(pieza)
+        elif idx_municipio in semillas_municipio:
+            # Asignar la pieza a la semilla más cercana del municipio que la contiene
+            candidatas = semillas_municipio[idx_municipio]
+            punto = pieza.representative_point()
+            distancias = ((semillas[candidatas] - (punto.x, punto.y)) ** 2).sum(axis=1)
+            partes_zona[candidatas[int(distancias.argmin())]].append(pieza)
+    
+    # Reunir las zonas de cada municipio
+    for idx_municipio, indices in semillas_municipio.items():
+        zonas = []
+        for i in indices:
+            if not partes_zona[i]:
+                continue
+            zona = partes_zona[i][0] if len(partes_zona[i]) == 1 else shapely.union_all(partes_zona[i])
+            # Solo las partes poligonales (el recorte puede dejar líneas o puntos), en una sola zona
+            partes = shapely.get_parts(zona)
+            partes = partes[(shapely.get_type_id(partes) == 3) & (shapely.area(partes) > 0)]
+            if len(partes) == 1:
+                zonas.append(partes[0])
+            elif len(partes) > 1:
+                zonas.append(MultiPolygon(list(partes)))
+        if zonas:
+            resultado[idx_municipio] = zonas
+    
+    return resultado